@@ -0,0 +1,79 @@
+# Microbenchmark: cost of deriving the now-playing link per panel refresh.
+#
+# Run from the repository root:
+#   python bench/bench_link_resolver.py
+#
+# "cold" clears the link caches before every call (first refresh of a new item),
+# "warm" is every later 5 s refresh of the same playing item.
+import os, sys, timeit
+
+for key, val in {
+    "TG_TOKEN": "bench",
+    "KODI_HOST": "127.0.0.1",
+    "KODI_PORT": "8080",
+    "KODI_WS_PORT": "9090",
+    "KODI_USER": "bench",
+    "KODI_PASS": "bench",
+}.items():
+    os.environ.setdefault(key, val)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import kodi_media_bot as bot
+
+ITEMS = {
+    "youtube plugin": {
+        "type": "video",
+        "title": "Some video",
+        "file": "plugin://plugin.video.youtube/play/?video_id=dQw4w9WgXcQ",
+    },
+    "youtube manifest": {
+        "type": "video",
+        "title": "Some video",
+        "file": "http://127.0.0.1:50152/youtube/manifest/dash/?file=dQw4w9WgXcQ.mpd",
+    },
+    "soundcloud plugin": {
+        "type": "song",
+        "title": "Track",
+        "artist": ["Artist"],
+        "file": "plugin://plugin.audio.soundcloud/play/?url=https%3A%2F%2Fsoundcloud.com%2Fartist%2Ftrack%3Fin%3Dx",
+    },
+    "movie with imdb": {
+        "type": "movie",
+        "title": "A Movie",
+        "imdbnumber": "tt0111161",
+        "uniqueid": {"imdb": "tt0111161"},
+        "file": "smb://nas/movies/a_movie.mkv",
+    },
+}
+
+CACHED = (bot.resolve_file_link, bot.extract_youtube_id, bot.extract_soundcloud_url)
+
+
+def cold(item):
+    for fn in CACHED:
+        fn.cache_clear()
+    bot.external_item_display(item)
+
+
+def warm(item):
+    bot.external_item_display(item)
+
+
+def per_call_us(fn, item, number):
+    best = min(timeit.repeat(lambda: fn(item), number=number, repeat=5))
+    return best / number * 1e6
+
+
+def main():
+    number = int(os.environ.get("BENCH_NUMBER", "5000"))
+    print(f"{'item':<20} {'cold us':>10} {'warm us':>10} {'speedup':>8}")
+    for name, item in ITEMS.items():
+        c = per_call_us(cold, item, number)
+        w = per_call_us(warm, item, number)
+        print(f"{name:<20} {c:>10.2f} {w:>10.2f} {c / w:>7.1f}x")
+    info = bot.resolve_file_link.cache_info()
+    print(f"resolve_file_link cache: hits={info.hits} misses={info.misses} size={info.currsize}/{info.maxsize}")
+
+
+if __name__ == "__main__":
+    main()
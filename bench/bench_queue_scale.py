@@ -0,0 +1,217 @@
+# Queue scalability: render, edit, match, LOCK hold time and memory at 1k/10k/100k items.
+#
+# Run from the repository root:
+#   python bench/bench_queue_scale.py
+#   python bench/bench_queue_scale.py --save-baseline bench/queue_scale_baseline.json
+#   python bench/bench_queue_scale.py --baseline bench/queue_scale_baseline.json
+#
+# Exits with status 1 when a metric is over its budget (BUDGETS; near-constant in
+# queue size, and the rendered list must fit Telegram's 4096-character limit) or,
+# with --baseline, more than --tolerance times its baseline.
+import argparse, asyncio, contextlib, gc, io, json, os, statistics, sys, threading, time, tracemalloc, types
+
+for key, val in {
+    "TG_TOKEN": "bench",
+    "KODI_HOST": "127.0.0.1",
+    "KODI_PORT": "8080",
+    "KODI_WS_PORT": "9090",
+    "KODI_USER": "bench",
+    "KODI_PASS": "bench",
+    "CHECKPOINT_FILE": "",
+}.items():
+    os.environ.setdefault(key, val)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import kodi_media_bot as bot
+
+# metric -> (fixed, per 1k queued items); ms unless named otherwise. Everything the event
+# loop waits on stays near-constant with queue size; the list must fit one Telegram message.
+BUDGETS = {
+    "render_ms": (5.0, 0.0),
+    "render_chars": (4096, 0),
+    "panel_ms": (5.0, 0.0),
+    "insert_ms": (1.0, 0.01),
+    "delete_first_ms": (1.0, 0.01),
+    "delete_middle_ms": (1.0, 0.01),
+    "delete_last_ms": (1.0, 0.01),
+    "match_hit_ms": (1.0, 0.01),
+    "match_miss_ms": (1.0, 0.01),
+    "lock_hold_max_ms": (5.0, 0.05),
+    "bytes_per_item": (4096, 0),
+}
+PASTE_BATCH = 500
+
+
+# Wraps bot.LOCK and records how long each acquisition is held.
+class TimedLock:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.holds = []
+        self.since = 0.0
+
+    def acquire(self, *args, **kwargs):
+        ok = self.lock.acquire(*args, **kwargs)
+        if ok:
+            self.since = time.perf_counter()
+        return ok
+
+    def release(self):
+        self.holds.append(time.perf_counter() - self.since)
+        self.lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+
+def synthetic_item(i):
+    if i % 2:
+        return bot.make_youtube(f"{i:011d}", title=f"Channel {i % 97} - Video number {i}")
+    return bot.make_soundcloud(f"https://soundcloud.com/artist-{i % 211}/track-number-{i}")
+
+
+def fill(n):
+    with contextlib.redirect_stdout(io.StringIO()):
+        bot.clear_queue()
+    bot.DISPLAY_INDEX = None
+    bot.CURRENT_INDEX = None
+    for start in range(0, n, PASTE_BATCH):
+        bot.queue_items([synthetic_item(i) for i in range(start, min(start + PASTE_BATCH, n))])
+
+
+# Median wall time of fn in ms; LOCK hold times seen during the calls go into holds.
+# The cyclic GC is paused while timing: a full collection over 100k queued dicts
+# takes ~200 ms wherever it happens to trigger and would hide the code's own cost.
+def median_ms(fn, repeat, holds):
+    times = []
+    for _ in range(repeat):
+        bot.LOCK.holds.clear()
+        gc.disable()
+        try:
+            t = time.perf_counter()
+            fn()
+            times.append((time.perf_counter() - t) * 1000.0)
+        finally:
+            gc.enable()
+        holds.extend(bot.LOCK.holds)
+    return statistics.median(times)
+
+
+async def _no_send(**kwargs):
+    return types.SimpleNamespace(message_id=1)
+
+
+def measure(n, repeat):
+    out = {}
+    t = time.perf_counter()
+    fill(n)
+    out["fill_s"] = round(time.perf_counter() - t, 3)
+    # Settle the full collection the fill has earned before timing anything.
+    gc.collect()
+
+    holds = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        out["render_ms"] = median_ms(bot.build_list_text, repeat, holds)
+        out["render_chars"] = len(bot.build_list_text())
+        ctx = types.SimpleNamespace(bot=types.SimpleNamespace(send_message=_no_send))
+        loop = asyncio.new_event_loop()
+        out["panel_ms"] = median_ms(lambda: loop.run_until_complete(bot.send_info_list_panel(ctx, -1)), repeat, holds)
+        loop.close()
+
+        # Each measured insert/delete is undone through the same entry points, outside the timing.
+        extra = n
+        times = []
+        for _ in range(repeat):
+            extra += 1
+            times.append(median_ms(lambda: bot.queue_items([synthetic_item(extra)]), 1, holds))
+            bot.delete_index(len(bot.QUEUE) - 1)
+        out["insert_ms"] = statistics.median(times)
+
+        for name, pos in (("first", lambda: 0), ("middle", lambda: len(bot.QUEUE) // 2), ("last", lambda: len(bot.QUEUE) - 1)):
+            times = []
+            for _ in range(repeat):
+                i = pos()
+                times.append(median_ms(lambda: bot.delete_index(i), 1, holds))
+                extra += 1
+                bot.queue_items([synthetic_item(extra)])
+            out[f"delete_{name}_ms"] = statistics.median(times)
+
+        last = bot.QUEUE[-1]
+        hit = {"type": "song", "title": last["title"], "label": last["title"], "file": last["url"], "artist": []}
+        miss = {"type": "song", "title": "Nobody - Not queued", "label": "Nobody - Not queued", "file": "http://example.invalid/x.mp3", "artist": []}
+        out["match_hit_ms"] = median_ms(lambda: bot.match_queue_item(dict(hit)), repeat, holds)
+        bot.DISPLAY_INDEX = None
+        out["match_miss_ms"] = median_ms(lambda: bot.match_queue_item(dict(miss)), repeat, holds)
+        bot.DISPLAY_INDEX = None
+    out["lock_hold_max_ms"] = max(holds) * 1000.0 if holds else 0.0
+
+    # Memory last: the first allocations after tracemalloc.stop() are slow enough to skew timings.
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    fill(n)
+    out["bytes_per_item"] = round((tracemalloc.get_traced_memory()[0] - before) / n)
+    tracemalloc.stop()
+    return {k: (round(v, 3) if isinstance(v, float) else v) for k, v in out.items()}
+
+
+def budget(metric, n):
+    fixed, per_k = BUDGETS[metric]
+    return fixed + per_k * n / 1000.0
+
+
+def check(results, baseline, tolerance):
+    failures = []
+    for size, row in results.items():
+        n = int(size)
+        for metric in BUDGETS:
+            val = row[metric]
+            limit = budget(metric, n)
+            if val > limit:
+                failures.append(f"{size}: {metric}={val} over budget {limit:.3f}")
+            base = (baseline.get(size) or {}).get(metric) if baseline else None
+            # Sub-millisecond timings are too noisy for a ratio check.
+            if base and val > base * tolerance and (metric == "bytes_per_item" or val >= 1.0):
+                failures.append(f"{size}: {metric}={val} is {val / base:.2f}x baseline {base}")
+    return failures
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Queue scalability benchmark.")
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--baseline", help="JSON from --save-baseline to compare against")
+    ap.add_argument("--tolerance", type=float, default=1.5, help="allowed slowdown factor over the baseline")
+    ap.add_argument("--save-baseline", help="write these results as the new baseline")
+    args = ap.parse_args()
+
+    bot.LOCK = TimedLock()
+    bot.TG_MIN_INTERVAL = 0.0
+    results = {}
+    metrics = ["fill_s"] + list(BUDGETS)
+    print(f"{'metric':<18}" + "".join(f"{n:>12}" for n in args.sizes))
+    for n in args.sizes:
+        results[str(n)] = measure(n, args.repeat)
+    for metric in metrics:
+        print(f"{metric:<18}" + "".join(f"{results[str(n)][metric]:>12}" for n in args.sizes))
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    failures = check(results, baseline, args.tolerance)
+    for line in failures:
+        print(f"FAIL {line}")
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,381 @@
+# End-to-end scenarios: the unmodified bot against fake Kodi and fake Telegram servers.
+#
+# Run from the repository root:
+#   python bench/bench_scenarios.py                 # paste, skip and party
+#   python bench/bench_scenarios.py paste skip --quick
+#
+# Each scenario starts fresh fakes (bench/fake_kodi.py, bench/fake_telegram.py),
+# runs kodi_media_bot.py as a subprocess pointed at them via KODI_HOST/KODI_PORT/
+# KODI_WS_PORT and TG_BASE_URL, drives it through Telegram updates, and reports
+# end-to-end latencies, Telegram calls per action and Kodi calls per minute.
+# SoundCloud track links are used throughout because they queue without network
+# access; the addon's "media_url=" hand-off is simulated by the fake Kodi.
+import argparse, json, math, os, re, signal, subprocess, sys, threading, time
+
+import fake_kodi, fake_telegram
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+CHAT_ID = -1003641420817
+NOMINAL_TRACK_SEC = 240.0
+TRACE_RE = re.compile(r"^TRACE (\{.*\})$")
+GAP_RE = re.compile(r"^TRACK GAP gap=([0-9.]+)s")
+
+
+def percentile(vals, q):
+    if not vals:
+        return None
+    vals = sorted(vals)
+    return vals[min(len(vals) - 1, int(len(vals) * q))]
+
+
+def fmt_ms(vals):
+    if not vals:
+        return "n/a"
+    return (
+        f"p50={percentile(vals, 0.5) * 1000:.0f}ms p95={percentile(vals, 0.95) * 1000:.0f}ms "
+        f"max={max(vals) * 1000:.0f}ms n={len(vals)}"
+    )
+
+
+def wait_for(pred, timeout, step=0.05):
+    end = time.time() + timeout
+    while time.time() < end:
+        if pred():
+            return True
+        time.sleep(step)
+    return pred()
+
+
+def soundcloud_links(n, offset=0):
+    return [f"https://soundcloud.com/bench-artist-{(offset + i) % 37}/track-{offset + i}" for i in range(n)]
+
+
+# Title the fake Kodi reports while playing soundcloud_links()[i].
+def soundcloud_title(i):
+    return f"bench artist {i % 37} - track {i}"
+
+
+# Press play once the first paste has been queued, like the host would.
+def press_play(run):
+    wait_for(lambda: bot_replies(run["t0"]), 30, step=0.1)
+    fake_telegram.inject_button(CHAT_ID, "playpause")
+
+
+# Keep the bot's stdout in a log file (with relative timestamps) and in memory for parsing.
+def read_output(run):
+    start = time.time()
+    with open(run["log_path"], "w") as log:
+        for line in run["proc"].stdout:
+            line = line.rstrip("\n")
+            now = time.time()
+            run["lines"].append((now, line))
+            log.write(f"{now - start:9.3f} {line}\n")
+
+
+# Start fakes and the bot, wait for the startup panel and the WebSocket connection.
+def boot(args, name, track_seconds=(15.0, 25.0)):
+    http_port, ws_port = fake_kodi.start(
+        latency=args.kodi_latency,
+        jitter=args.kodi_latency / 2,
+        av_delay=args.av_delay,
+        addon_delay=args.addon_delay,
+        track_seconds=track_seconds,
+    )
+    tg_url = fake_telegram.start(chat_per_min=args.tg_per_min)
+    env = dict(os.environ)
+    for key in ("CEC_HOST", "HOST_IP"):
+        env.pop(key, None)
+    env.update({
+        "TG_TOKEN": "123456:bench",
+        "TG_BASE_URL": tg_url,
+        "KODI_HOST": "127.0.0.1",
+        "KODI_PORT": str(http_port),
+        "KODI_WS_PORT": str(ws_port),
+        "KODI_USER": "kodi",
+        "KODI_PASS": "kodi",
+        "CHECKPOINT_FILE": "",
+        "STREAM_PREFETCH": "0",
+        "CEC_MONITOR": "0",
+        "CEC_SSH_MUX": "0",
+        "PYTHONUNBUFFERED": "1",
+    })
+    os.makedirs(args.log_dir, exist_ok=True)
+    if args.record:
+        env["KODI_TRACE_FILE"] = os.path.join(args.log_dir, f"{name}.trace.jsonl.gz")
+    run = {
+        "name": name,
+        "lines": [],
+        "log_path": os.path.join(args.log_dir, f"{name}.log"),
+        "proc": subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, "kodi_media_bot.py")],
+            cwd=ROOT,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+        ),
+    }
+    threading.Thread(target=read_output, args=(run,), daemon=True).start()
+    ok = wait_for(
+        lambda: fake_kodi.connected() and fake_telegram.calls_since(0, "sendMessage") and fake_telegram.calls_since(0, "getUpdates"),
+        60,
+    )
+    if not ok:
+        shutdown(run)
+        raise SystemExit(f"{name}: bot did not start, see {run['log_path']}")
+    run["t0"] = time.time()
+    return run
+
+
+def shutdown(run):
+    proc = run["proc"]
+    if proc.poll() is None:
+        proc.send_signal(signal.SIGINT)
+        try:
+            proc.wait(15)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+    fake_telegram.stop()
+    fake_kodi.stop()
+
+
+def bot_lines(run, since=0.0):
+    return [line for ts, line in list(run["lines"]) if ts >= since]
+
+
+def trace_stage(run, stage, since=0.0):
+    out = []
+    for line in bot_lines(run, since):
+        m = TRACE_RE.match(line)
+        if m:
+            data = json.loads(m.group(1))
+            if data.get("stage") == stage:
+                out.append(data["ms"] / 1000.0)
+    return out
+
+
+def track_gaps(run, since=0.0):
+    return [float(m.group(1)) for m in (GAP_RE.match(l) for l in bot_lines(run, since)) if m]
+
+
+def kodi_events(method, since=0.0):
+    with fake_kodi.LOCK:
+        return [(ts, data) for ts, m, data in fake_kodi.STATE["events"] if m == method and ts >= since]
+
+
+def kodi_calls(since, until):
+    with fake_kodi.LOCK:
+        return [m for ts, m in fake_kodi.STATE["call_log"] if since <= ts <= until]
+
+
+# Telegram calls made by the bot itself (long polling excluded).
+def tg_calls(since, until):
+    return [c for c in fake_telegram.calls_since(since) if c[0] <= until and c[1] != "getUpdates"]
+
+
+def bot_replies(since):
+    out = []
+    for ts, method, params in fake_telegram.calls_since(since, "sendMessage"):
+        text = params.get("text", "")
+        if text.startswith("✔") or text.startswith("⚠"):
+            out.append((ts, text))
+    return out
+
+
+def common_report(run, since, until, actions, label):
+    minutes = max(until - since, 1e-6) / 60.0
+    kodi = kodi_calls(since, until)
+    tg = tg_calls(since, until)
+    top = {}
+    for m in kodi:
+        top[m] = top.get(m, 0) + 1
+    with fake_telegram.LOCK:
+        errors = dict(fake_telegram.STATE["errors"])
+    return {
+        "duration_s": round(until - since, 1),
+        f"telegram_calls_per_{label}": round(len(tg) / max(actions, 1), 2),
+        "telegram_calls_per_min": round(len(tg) / minutes, 1),
+        "telegram_429": sum(n for (m, code), n in errors.items() if code == 429),
+        "telegram_400": sum(n for (m, code), n in errors.items() if code == 400),
+        "kodi_calls_per_min": round(len(kodi) / minutes, 1),
+        "kodi_top_methods": dict(sorted(top.items(), key=lambda kv: -kv[1])[:6]),
+        "first_audio": fmt_ms(trace_stage(run, "first_audio", since)),
+        "track_gap": fmt_ms(track_gaps(run, since)),
+    }
+
+
+# Paste N SoundCloud links spread over several messages.
+def scenario_paste(args, run):
+    links = soundcloud_links(args.links)
+    texts = ["\n".join(links[i:i + args.per_message]) for i in range(0, len(links), args.per_message)]
+    start = time.time()
+    sent = []
+    for n, text in enumerate(texts):
+        sent.append(time.time())
+        fake_telegram.inject_text(CHAT_ID, text)
+        if n == 0:
+            press_play(run)
+        time.sleep(args.paste_interval)
+    wait_for(lambda: len(bot_replies(start)) >= len(texts), 120 + 30 * len(texts), step=0.2)
+    end = time.time()
+    replies = bot_replies(start)
+    latencies = [r[0] - s for s, r in zip(sent, replies)]
+    out = common_report(run, start, end, len(texts), "message")
+    out.update({
+        "messages": len(texts),
+        "links": len(links),
+        "replies": len(replies),
+        "reply_latency": fmt_ms(latencies),
+        "every_message_answered": len(replies) >= len(texts),
+    })
+    return out
+
+
+# Queue tracks, start playback, then hammer the skip button.
+def scenario_skip(args, run):
+    links = soundcloud_links(args.skips + 5)
+    fake_telegram.inject_text(CHAT_ID, "\n".join(links))
+    press_play(run)
+    wait_for(lambda: kodi_events("Player.OnAVStart", run["t0"]), 60, step=0.2)
+    time.sleep(3.0)
+    start = time.time()
+    pressed = {}
+    for _ in range(args.skips):
+        pressed[fake_telegram.inject_button(CHAT_ID, "skip")] = time.time()
+        time.sleep(args.skip_interval)
+    last_press = time.time()
+
+    def _acks():
+        out = {}
+        for ts, method, params in fake_telegram.calls_since(start, "answerCallbackQuery"):
+            out.setdefault(params.get("callback_query_id"), ts)
+        return out
+
+    # Settled once every press was handled and Kodi kept playing without a new Player.Open for 3 s.
+    # Presses are handled in order and each acks before it opens the next track, so the
+    # last press has only been acted on once a Player.Open follows the last ack.
+    def _settled():
+        acks = _acks()
+        if len(acks) < len(pressed):
+            return False
+        last_ack = max(acks.values())
+        with fake_kodi.LOCK:
+            opens = [ts for ts, m in fake_kodi.STATE["call_log"] if m == "Player.Open" and ts >= last_ack]
+            playing = fake_kodi.STATE["player"] is not None
+        if not opens:
+            return False
+        return playing and time.time() - opens[-1] > 3.0
+
+    wait_for(_settled, 120 + 30 * args.skips, step=0.2)
+    end = time.time()
+    acks = _acks()
+    ack_latency = [acks[q] - ts for q, ts in pressed.items() if q in acks]
+    av = [ts for ts, _ in kodi_events("Player.OnAVStart", start)]
+    player = fake_kodi.STATE["player"] or {}
+    out = common_report(run, start, end, args.skips, "press")
+    out.update({
+        "presses": args.skips,
+        "ack_latency": fmt_ms(ack_latency),
+        "settle_after_last_press": f"{(av[-1] - last_press) * 1000:.0f}ms" if av and av[-1] >= last_press else "n/a",
+        "player_open_calls": len([m for m in kodi_calls(start, end) if m == "Player.Open"]),
+        "landed_on_expected_track": player.get("title") == soundcloud_title(min(args.skips, len(links) - 1)),
+    })
+    return out
+
+
+# Play a compressed party: track lengths are scaled down, everything else is real time.
+def scenario_party(args, run):
+    tracks = max(int(math.ceil(args.party_hours * 3600 / NOMINAL_TRACK_SEC)), 2)
+    links = soundcloud_links(tracks)
+    start = time.time()
+    for i in range(0, len(links), args.per_message):
+        fake_telegram.inject_text(CHAT_ID, "\n".join(links[i:i + args.per_message]))
+        if i == 0:
+            press_play(run)
+        time.sleep(args.paste_interval)
+    real_track = NOMINAL_TRACK_SEC / args.time_scale
+    # Scripted remote use: someone pauses for a while a third of the way in.
+    pause_at = tracks * real_track / 3
+    fake_kodi.script([
+        (pause_at, "Player.PlayPause", {"playerid": 0}),
+        (pause_at + real_track / 2, "Player.PlayPause", {"playerid": 0}),
+    ])
+    wait_for(
+        lambda: len(kodi_events("Player.OnStop", start)) and sum(1 for _, d in kodi_events("Player.OnStop", start) if d.get("end")) >= tracks,
+        tracks * real_track * 1.5 + 60,
+        step=0.5,
+    )
+    end = time.time()
+    ends = [ts for ts, d in kodi_events("Player.OnStop", start) if d.get("end")]
+    starts = [ts for ts, _ in kodi_events("Player.OnAVStart", start)]
+    gaps = []
+    for ts in ends:
+        nxt = [s for s in starts if s > ts]
+        if nxt:
+            gaps.append(nxt[0] - ts)
+    out = common_report(run, start, end, tracks, "track")
+    out.update({
+        "tracks_queued": tracks,
+        "tracks_finished": len(ends),
+        "simulated_hours": round(len(ends) * NOMINAL_TRACK_SEC / 3600, 2),
+        "end_to_next_audio": fmt_ms(gaps),
+        "resume_attempts": sum(1 for l in bot_lines(run, start) if l.startswith("RESUME ATTEMPT")),
+        "every_track_finished": len(ends) >= tracks,
+    })
+    return out
+
+
+# Scenario -> (runner, whether tracks use the scaled party length instead of a full hour).
+# Boolean results are the scenario's own correctness checks; any False fails the run.
+SCENARIOS = {"paste": (scenario_paste, False), "skip": (scenario_skip, False), "party": (scenario_party, True)}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Run the bot against fake Kodi and Telegram servers.")
+    ap.add_argument("scenarios", nargs="*", help=f"any of {', '.join(SCENARIOS)} (default: all)")
+    ap.add_argument("--quick", action="store_true", help="small sizes for a smoke run")
+    ap.add_argument("--links", type=int, default=500)
+    ap.add_argument("--per-message", type=int, default=25)
+    ap.add_argument("--paste-interval", type=float, default=0.5)
+    ap.add_argument("--skips", type=int, default=20)
+    ap.add_argument("--skip-interval", type=float, default=0.25)
+    ap.add_argument("--party-hours", type=float, default=4.0)
+    ap.add_argument("--time-scale", type=float, default=12.0, help="nominal 4 min tracks play for 240/scale s")
+    ap.add_argument("--kodi-latency", type=float, default=0.02)
+    ap.add_argument("--av-delay", type=float, default=0.3)
+    ap.add_argument("--addon-delay", type=float, default=0.8)
+    ap.add_argument("--tg-per-min", type=int, default=20)
+    ap.add_argument("--log-dir", default=os.path.join(ROOT, "bench", "logs"))
+    ap.add_argument("--json", help="also write the results to this file")
+    ap.add_argument("--record", action="store_true", help="record a Kodi trace per scenario for bench/replay_trace.py")
+    args = ap.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        ap.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+    if args.quick:
+        args.links, args.skips, args.party_hours, args.time_scale = 100, 8, 0.5, 24.0
+    results = {}
+    failed = []
+    for name in args.scenarios or list(SCENARIOS):
+        runner, scaled = SCENARIOS[name]
+        real_track = NOMINAL_TRACK_SEC / args.time_scale if scaled else 3600.0
+        run = boot(args, name, track_seconds=(real_track * 0.75, real_track * 1.25))
+        try:
+            results[name] = runner(args, run)
+        finally:
+            shutdown(run)
+        print(f"== {name}", flush=True)
+        for key, val in results[name].items():
+            print(f"  {key:<28} {val}", flush=True)
+        failed += [f"{name}.{key}" for key, val in results[name].items() if val is False]
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if failed:
+        print(f"FAILED: {', '.join(failed)}", flush=True)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
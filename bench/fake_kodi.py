@@ -0,0 +1,394 @@
+# Fake Kodi for offline benchmarks: JSON-RPC over HTTP plus WebSocket notifications.
+#
+# Models just enough of a LibreELEC box for kodi_media_bot: audio/video players,
+# playlists 0/1, seek/pause, tracks that end on their own, and the SoundCloud
+# addon inserting a "media_url=" stream entry into playlist 0 some time after a
+# plugin item starts. Every RPC and notification is logged with a timestamp.
+import asyncio, hashlib, json, threading, time, random
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote, urlparse, parse_qs
+
+from websockets.asyncio.server import serve, broadcast
+from websockets.exceptions import ConnectionClosed
+
+LOCK = threading.RLock()
+STATE = {}
+
+
+# Reset all fake state; times are real seconds.
+def reset(latency=0.02, jitter=0.01, av_delay=0.3, addon_delay=0.8, track_seconds=(15.0, 25.0)):
+    with LOCK:
+        STATE.clear()
+        STATE.update({
+            "latency": latency,
+            "jitter": jitter,
+            "av_delay": av_delay,
+            "addon_delay": addon_delay,
+            "track_seconds": track_seconds,
+            "playlists": {0: [], 1: []},
+            "player": None,
+            "gen": 0,
+            "calls": Counter(),
+            "call_log": [],
+            "events": [],
+            "clients": set(),
+            "loop": None,
+            "http": None,
+            "ws": None,
+            "ticker": None,
+            "running": False,
+        })
+
+
+# Deterministic per-file duration so runs are comparable.
+def track_duration(file):
+    lo, hi = STATE["track_seconds"]
+    h = int(hashlib.md5(file.encode()).hexdigest()[:8], 16)
+    return lo + (hi - lo) * (h % 1000) / 999.0
+
+
+# Display title the way Kodi would label a SoundCloud/YouTube plugin item.
+def file_title(file):
+    qs = parse_qs(urlparse(file).query)
+    url = (qs.get("url") or [""])[0]
+    if url:
+        parts = urlparse(unquote(url)).path.strip("/").split("/")
+        if len(parts) >= 2:
+            return f"{parts[0].replace('-', ' ')} - {parts[1].replace('-', ' ')}"
+    vid = (qs.get("video_id") or [""])[0]
+    if vid:
+        return f"Video {vid}"
+    return file.rsplit("/", 1)[-1] or file
+
+
+def kodi_time(sec):
+    sec = max(int(sec), 0)
+    return {"hours": sec // 3600, "minutes": (sec % 3600) // 60, "seconds": sec % 60, "milliseconds": 0}
+
+
+def time_seconds(t):
+    return t.get("hours", 0) * 3600 + t.get("minutes", 0) * 60 + t.get("seconds", 0) + t.get("milliseconds", 0) / 1000.0
+
+
+# Send a JSON-RPC notification to every connected client.
+def notify(method, data):
+    with LOCK:
+        STATE["events"].append((time.time(), method, data))
+        loop = STATE["loop"]
+        clients = set(STATE["clients"])
+    if not loop or not clients:
+        return
+    msg = json.dumps({"jsonrpc": "2.0", "method": method, "params": {"data": data, "sender": "xbmc"}})
+    loop.call_soon_threadsafe(broadcast, clients, msg)
+
+
+# Fire a notification later unless the player changed in between.
+def notify_later(delay, method, data, gen):
+    def _fire():
+        with LOCK:
+            if STATE["gen"] != gen:
+                return
+        notify(method, data)
+    t = threading.Timer(delay, _fire)
+    t.daemon = True
+    t.start()
+
+
+def player_position(p):
+    if p["paused"]:
+        return p["pos"]
+    return p["pos"] + (time.time() - p["t"])
+
+
+def player_data(p):
+    return {"playerid": p["playerid"], "speed": 0 if p["paused"] else 1}
+
+
+def item_data(p):
+    return {"type": "song" if p["playerid"] == 0 else "unknown", "title": p["title"]}
+
+
+def stop_player(end):
+    p = STATE["player"]
+    if not p:
+        return
+    STATE["player"] = None
+    STATE["gen"] += 1
+    notify("Player.OnStop", {"item": item_data(p), "end": end})
+
+
+# Start playing a file; plugin items of the SoundCloud addon resolve first.
+def open_file(file, playlistid=-1, position=-1):
+    stop_player(False)
+    STATE["gen"] += 1
+    gen = STATE["gen"]
+    playerid = 0 if file.startswith("plugin://plugin.audio.") or playlistid == 0 else 1
+    if file.startswith("plugin://plugin.audio.soundcloud") and "media_url=" not in file:
+        def _resolve():
+            with LOCK:
+                if STATE["gen"] != gen:
+                    return
+                stream = "https://cf-media.sndcdn.com/" + hashlib.md5(file.encode()).hexdigest()[:12] + ".128.mp3"
+                url = (parse_qs(urlparse(file).query).get("url") or [""])[0]
+                media = f"plugin://plugin.audio.soundcloud/play/?media_url={quote(stream, safe='')}&url={quote(url, safe='')}"
+                items = STATE["playlists"][0]
+                items.append({"file": media, "label": file_title(file)})
+                pos = len(items) - 1
+            notify("Playlist.OnAdd", {"playlistid": 0, "position": pos, "item": {"type": "song", "title": file_title(file)}})
+        t = threading.Timer(STATE["addon_delay"], _resolve)
+        t.daemon = True
+        t.start()
+        return
+    p = {
+        "playerid": playerid,
+        "playlistid": playlistid,
+        "position": position,
+        "file": file,
+        "title": file_title(file),
+        "duration": track_duration(file),
+        "pos": 0.0,
+        "t": time.time(),
+        "paused": False,
+    }
+    STATE["player"] = p
+    notify("Player.OnPlay", {"item": item_data(p), "player": player_data(p)})
+    notify_later(STATE["av_delay"], "Player.OnAVStart", {"item": item_data(p), "player": player_data(p)}, gen)
+
+
+def open_playlist(playlistid, position):
+    items = STATE["playlists"].get(playlistid) or []
+    if not 0 <= position < len(items):
+        return False
+    open_file(items[position]["file"], playlistid, position)
+    return True
+
+
+# End tracks that ran out, advancing through a playlist like Kodi does.
+def ticker():
+    while STATE.get("running"):
+        time.sleep(0.05)
+        with LOCK:
+            p = STATE["player"]
+            if not p or p["paused"] or player_position(p) < p["duration"]:
+                continue
+            items = STATE["playlists"].get(p["playlistid"]) or []
+            if 0 <= p["position"] < len(items) - 1:
+                open_playlist(p["playlistid"], p["position"] + 1)
+            else:
+                stop_player(True)
+
+
+def rpc_player(method, params):
+    p = STATE["player"]
+    if method == "Player.GetActivePlayers":
+        if not p:
+            return []
+        return [{"playerid": p["playerid"], "type": "audio" if p["playerid"] == 0 else "video", "playertype": "internal"}]
+    if method == "Player.Open":
+        item = params.get("item") or {}
+        if "file" in item:
+            open_file(item["file"])
+        elif "playlistid" in item:
+            open_playlist(item["playlistid"], item.get("position", 0))
+        return "OK"
+    if method == "Player.Stop":
+        stop_player(False)
+        return "OK"
+    if method == "Player.SetRepeat":
+        return "OK"
+    if not p or params.get("playerid") not in (None, p["playerid"]):
+        raise LookupError("Failed to execute method.")
+    if method == "Player.GetProperties":
+        pos = player_position(p)
+        props = {
+            "time": kodi_time(pos),
+            "totaltime": kodi_time(p["duration"]),
+            "percentage": 100.0 * pos / p["duration"],
+            "speed": 0 if p["paused"] else 1,
+            "playlistid": p["playlistid"],
+            "position": p["position"],
+            "canseek": True,
+            "type": "audio" if p["playerid"] == 0 else "video",
+        }
+        return {k: props[k] for k in params.get("properties", []) if k in props}
+    if method == "Player.GetItem":
+        return {"item": {"type": item_data(p)["type"], "label": p["title"], "title": p["title"], "file": p["file"], "artist": []}}
+    if method == "Player.PlayPause":
+        p["pos"] = player_position(p)
+        p["t"] = time.time()
+        p["paused"] = not p["paused"]
+        notify("Player.OnPause" if p["paused"] else "Player.OnResume", {"item": item_data(p), "player": player_data(p)})
+        return {"speed": 0 if p["paused"] else 1}
+    if method == "Player.Seek":
+        value = params.get("value") or {}
+        if "time" in value:
+            pos = time_seconds(value["time"])
+        elif "percentage" in value:
+            pos = p["duration"] * value["percentage"] / 100.0
+        else:
+            pos = player_position(p) + value.get("seconds", 0)
+        p["pos"] = min(max(pos, 0.0), p["duration"])
+        p["t"] = time.time()
+        data = player_data(p)
+        data["time"] = kodi_time(p["pos"])
+        notify("Player.OnSeek", {"item": item_data(p), "player": data})
+        return {"time": kodi_time(p["pos"]), "totaltime": kodi_time(p["duration"]), "percentage": 100.0 * p["pos"] / p["duration"]}
+    if method == "Player.GoTo":
+        to = params.get("to")
+        if to == "next":
+            to = p["position"] + 1
+        elif to == "previous":
+            to = p["position"] - 1
+        if not open_playlist(p["playlistid"], to):
+            raise LookupError("Invalid params.")
+        return "OK"
+    raise KeyError(method)
+
+
+def rpc_playlist(method, params):
+    pid = params.get("playlistid", 0)
+    items = STATE["playlists"].setdefault(pid, [])
+    if method == "Playlist.GetItems":
+        out = [{"file": it["file"], "label": it["label"], "title": it["label"], "type": "unknown"} for it in items]
+        return {"items": out, "limits": {"start": 0, "end": len(out), "total": len(out)}}
+    if method == "Playlist.Clear":
+        items.clear()
+        notify("Playlist.OnClear", {"playlistid": pid})
+        return "OK"
+    if method in ("Playlist.Add", "Playlist.Insert"):
+        new = params.get("item") or []
+        if isinstance(new, dict):
+            new = [new]
+        pos = params.get("position", len(items)) if method == "Playlist.Insert" else len(items)
+        for n, it in enumerate(new):
+            file = it.get("file", "")
+            items.insert(pos + n, {"file": file, "label": file_title(file)})
+            notify("Playlist.OnAdd", {"playlistid": pid, "position": pos + n, "item": {"type": "unknown", "title": file_title(file)}})
+        return "OK"
+    if method == "Playlist.Remove":
+        pos = params.get("position", 0)
+        if 0 <= pos < len(items):
+            items.pop(pos)
+            notify("Playlist.OnRemove", {"playlistid": pid, "position": pos})
+        return "OK"
+    if method == "Playlist.Swap":
+        a, b = params.get("position1", 0), params.get("position2", 0)
+        if 0 <= a < len(items) and 0 <= b < len(items):
+            items[a], items[b] = items[b], items[a]
+        return "OK"
+    raise KeyError(method)
+
+
+# Execute one JSON-RPC call against the fake state; scripted calls are not counted.
+def rpc(method, params, count=True):
+    with LOCK:
+        if count:
+            STATE["calls"][method] += 1
+            STATE["call_log"].append((time.time(), method))
+        if method.startswith("Player."):
+            return rpc_player(method, params)
+        if method.startswith("Playlist."):
+            return rpc_playlist(method, params)
+        if method == "JSONRPC.Ping":
+            return "pong"
+        if method == "Application.GetProperties":
+            return {"volume": 100, "muted": False}
+        raise KeyError(method)
+
+
+# Play a script of (delay_s, method, params) steps as if someone used the Kodi remote.
+def script(steps):
+    def _run():
+        start = time.time()
+        for delay, method, params in steps:
+            time.sleep(max(start + delay - time.time(), 0))
+            if not STATE.get("running"):
+                return
+            try:
+                rpc(method, params, count=False)
+            except (KeyError, LookupError):
+                pass
+    threading.Thread(target=_run, daemon=True).start()
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        time.sleep(max(STATE["latency"] + random.uniform(-STATE["jitter"], STATE["jitter"]), 0))
+        try:
+            req = json.loads(body)
+        except ValueError:
+            req = {}
+        resp = {"jsonrpc": "2.0", "id": req.get("id")}
+        try:
+            resp["result"] = rpc(req.get("method", ""), req.get("params") or {})
+        except KeyError:
+            resp["error"] = {"code": -32601, "message": "Method not found."}
+        except LookupError as e:
+            resp["error"] = {"code": -32100, "message": str(e)}
+        out = json.dumps(resp).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        try:
+            self.wfile.write(out)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+async def ws_handler(ws):
+    with LOCK:
+        STATE["clients"].add(ws)
+    try:
+        async for _ in ws:
+            pass
+    except ConnectionClosed:
+        pass
+    finally:
+        with LOCK:
+            STATE["clients"].discard(ws)
+
+
+# Start the HTTP and WebSocket servers on free ports; returns (http_port, ws_port).
+def start(**opts):
+    reset(**opts)
+    STATE["running"] = True
+    http = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    http.daemon_threads = True
+    threading.Thread(target=http.serve_forever, daemon=True).start()
+    STATE["http"] = http
+    ready = threading.Event()
+
+    def _ws_main():
+        async def _serve():
+            STATE["loop"] = asyncio.get_running_loop()
+            async with serve(ws_handler, "127.0.0.1", 0) as server:
+                STATE["ws"] = server
+                STATE["ws_port"] = server.sockets[0].getsockname()[1]
+                STATE["ws_stop"] = asyncio.Event()
+                ready.set()
+                await STATE["ws_stop"].wait()
+        asyncio.run(_serve())
+    threading.Thread(target=_ws_main, daemon=True).start()
+    ready.wait(5)
+    threading.Thread(target=ticker, daemon=True).start()
+    return http.server_address[1], STATE["ws_port"]
+
+
+def stop():
+    STATE["running"] = False
+    if STATE.get("http"):
+        STATE["http"].shutdown()
+        STATE["http"].server_close()
+    if STATE.get("loop"):
+        STATE["loop"].call_soon_threadsafe(STATE["ws_stop"].set)
+
+
+def connected():
+    with LOCK:
+        return bool(STATE["clients"])
@@ -0,0 +1,234 @@
+# Fake Telegram Bot API for offline benchmarks.
+#
+# Serves /bot<token>/<method> like api.telegram.org for the handful of methods
+# kodi_media_bot uses, keeps every chat's messages, and answers 429 with
+# retry_after once a chat exceeds Telegram-like send/edit limits. Scenarios push
+# user messages and button presses in through inject_text/inject_button.
+import json, math, threading, time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+LOCK = threading.Condition()
+STATE = {}
+BOT_USER = {"id": 777000111, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+GUEST_USER = {"id": 4242, "is_bot": False, "first_name": "Guest"}
+# Parameters PTB sends as plain strings; everything else is JSON encoded.
+STRING_PARAMS = {"text", "parse_mode", "callback_query_id"}
+RATE_LIMITED = {"sendMessage", "editMessageText", "editMessageReplyMarkup"}
+MAX_TEXT = 4096
+
+
+# Reset all fake state; limits mirror Telegram's documented group limits.
+def reset(chat_per_sec=1.0, chat_per_min=20, global_per_sec=30):
+    with LOCK:
+        STATE.clear()
+        STATE.update({
+            "chat_per_sec": chat_per_sec,
+            "chat_per_min": chat_per_min,
+            "global_per_sec": global_per_sec,
+            "updates": [],
+            "update_id": 1,
+            "message_id": 1,
+            "messages": {},
+            "calls": Counter(),
+            "errors": Counter(),
+            "call_log": [],
+            "chat_sends": {},
+            "global_sends": deque(),
+            "http": None,
+        })
+
+
+def chat_of(chat_id):
+    return {"id": chat_id, "type": "supergroup" if chat_id < 0 else "private", "title": "Bench party"}
+
+
+# Seconds the caller must wait before another send/edit, or 0.
+def rate_limit_wait(chat_id, now):
+    sends = STATE["chat_sends"].setdefault(chat_id, deque())
+    while sends and now - sends[0] >= 60:
+        sends.popleft()
+    glob = STATE["global_sends"]
+    while glob and now - glob[0] >= 1:
+        glob.popleft()
+    wait = 0.0
+    if len(sends) >= STATE["chat_per_min"]:
+        wait = max(wait, sends[0] + 60 - now)
+    # Telegram tolerates short bursts, so the per-second limit is averaged over 3 s.
+    recent = [ts for ts in sends if now - ts < 3]
+    if len(recent) >= 3 * STATE["chat_per_sec"]:
+        wait = max(wait, recent[0] + 3 - now)
+    if len(glob) >= STATE["global_per_sec"]:
+        wait = max(wait, glob[0] + 1 - now)
+    return wait
+
+
+def new_message(chat_id, text, reply_markup=None, sender=BOT_USER):
+    mid = STATE["message_id"]
+    STATE["message_id"] += 1
+    msg = {"message_id": mid, "date": int(time.time()), "chat": chat_of(chat_id), "from": sender, "text": text}
+    if reply_markup:
+        msg["reply_markup"] = reply_markup
+    STATE["messages"].setdefault(chat_id, {})[mid] = msg
+    return msg
+
+
+class ApiError(Exception):
+    def __init__(self, code, description, retry_after=None):
+        super().__init__(description)
+        self.code = code
+        self.description = description
+        self.retry_after = retry_after
+
+
+# Execute one Bot API method.
+def api(method, params):
+    now = time.time()
+    with LOCK:
+        STATE["calls"][method] += 1
+        STATE["call_log"].append((now, method, params))
+        chat_id = params.get("chat_id")
+        if method in RATE_LIMITED and chat_id is not None:
+            wait = rate_limit_wait(chat_id, now)
+            if wait > 0:
+                retry = max(int(math.ceil(wait)), 1)
+                raise ApiError(429, f"Too Many Requests: retry after {retry}", retry)
+            STATE["chat_sends"].setdefault(chat_id, deque()).append(now)
+            STATE["global_sends"].append(now)
+        if method == "getMe":
+            return BOT_USER
+        if method in ("deleteWebhook", "answerCallbackQuery", "setMyCommands"):
+            return True
+        if method == "getWebhookInfo":
+            return {"url": "", "has_custom_certificate": False, "pending_update_count": len(STATE["updates"])}
+        if method == "sendMessage":
+            text = params.get("text", "")
+            if not text:
+                raise ApiError(400, "Bad Request: message text is empty")
+            if len(text) > MAX_TEXT:
+                raise ApiError(400, "Bad Request: message is too long")
+            return new_message(chat_id, text, params.get("reply_markup"))
+        if method in ("editMessageText", "editMessageReplyMarkup"):
+            msg = STATE["messages"].get(chat_id, {}).get(params.get("message_id"))
+            if msg is None:
+                raise ApiError(400, "Bad Request: message to edit not found")
+            text = params.get("text", msg["text"])
+            if len(text) > MAX_TEXT:
+                raise ApiError(400, "Bad Request: message is too long")
+            markup = params.get("reply_markup", msg.get("reply_markup"))
+            if text == msg["text"] and markup == msg.get("reply_markup"):
+                raise ApiError(400, "Bad Request: message is not modified: specified new message content and reply markup are exactly the same as a current content and reply markup of the message")
+            msg["text"] = text
+            if markup:
+                msg["reply_markup"] = markup
+            msg["edit_date"] = int(now)
+            return msg
+        if method == "deleteMessage":
+            if STATE["messages"].get(chat_id, {}).pop(params.get("message_id"), None) is None:
+                raise ApiError(400, "Bad Request: message to delete not found")
+            return True
+        if method == "getUpdates":
+            offset = params.get("offset") or 0
+            STATE["updates"] = [u for u in STATE["updates"] if u["update_id"] >= offset]
+            end = now + min(float(params.get("timeout") or 0), 10.0)
+            while not STATE["updates"] and time.time() < end and STATE.get("http"):
+                LOCK.wait(end - time.time())
+            return list(STATE["updates"])
+    raise ApiError(404, "Not Found")
+
+
+def push_update(update):
+    with LOCK:
+        update["update_id"] = STATE["update_id"]
+        STATE["update_id"] += 1
+        STATE["updates"].append(update)
+        LOCK.notify_all()
+
+
+# Post a user text message into a chat; returns the message id.
+def inject_text(chat_id, text, user=GUEST_USER):
+    with LOCK:
+        msg = new_message(chat_id, text, sender=user)
+    push_update({"message": msg})
+    return msg["message_id"]
+
+
+# Press an inline button on the newest bot message that has a keyboard.
+def inject_button(chat_id, data, user=GUEST_USER):
+    with LOCK:
+        panels = [m for m in STATE["messages"].get(chat_id, {}).values() if m.get("reply_markup")]
+        msg = max(panels, key=lambda m: m["message_id"]) if panels else new_message(chat_id, "panel")
+        qid = f"cq{STATE['update_id']}"
+    push_update({"callback_query": {"id": qid, "from": user, "chat_instance": "bench", "data": data, "message": msg}})
+    return qid
+
+
+def parse_params(handler, body):
+    ctype = handler.headers.get("Content-Type", "")
+    if "json" in ctype:
+        return json.loads(body or b"{}")
+    out = {}
+    for key, vals in parse_qs(body.decode(), keep_blank_values=True).items():
+        val = vals[-1]
+        if key not in STRING_PARAMS:
+            try:
+                val = json.loads(val)
+            except ValueError:
+                pass
+        out[key] = val
+    return out
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        method = self.path.rsplit("/", 1)[-1]
+        try:
+            resp = {"ok": True, "result": api(method, parse_params(self, body))}
+        except ApiError as e:
+            resp = {"ok": False, "error_code": e.code, "description": e.description}
+            if e.retry_after:
+                resp["parameters"] = {"retry_after": e.retry_after}
+            with LOCK:
+                STATE["errors"][(method, e.code)] += 1
+        out = json.dumps(resp).encode()
+        self.send_response(200 if resp["ok"] else resp["error_code"])
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        try:
+            self.wfile.write(out)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    do_GET = do_POST
+
+    def log_message(self, *args):
+        pass
+
+
+# Start the server on a free port; returns the base URL for Application.builder().base_url().
+def start(**opts):
+    reset(**opts)
+    http = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    http.daemon_threads = True
+    STATE["http"] = http
+    threading.Thread(target=http.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{http.server_address[1]}/bot"
+
+
+def stop():
+    with LOCK:
+        http = STATE.get("http")
+        STATE["http"] = None
+        LOCK.notify_all()
+    if http:
+        http.shutdown()
+        http.server_close()
+
+
+# Bot API calls made since a timestamp, optionally filtered by method.
+def calls_since(ts, method=None):
+    with LOCK:
+        return [c for c in STATE["call_log"] if c[0] >= ts and (method is None or c[1] == method)]
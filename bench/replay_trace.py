@@ -0,0 +1,318 @@
+# Replay a recorded Kodi trace through the bot's playback logic on a virtual clock.
+#
+# Record on the real box with KODI_TRACE_FILE=/data/kodi-trace.jsonl.gz, then:
+#   python bench/replay_trace.py kodi-trace.jsonl.gz --json new.json
+#   python bench/replay_trace.py kodi-trace.jsonl.gz --bot /tmp/old/kodi_media_bot.py --json old.json
+#   python bench/replay_trace.py --compare old.json new.json
+#
+# The WebSocket listener, autoplay state machine and checkpoints run unmodified
+# on an event loop whose clock jumps straight to the next timer, with the bot's
+# CLOCK pointed at it. Kodi notifications arrive at their recorded times, RPCs are
+# answered with the latest recorded response for the same call, and queue edits and
+# button presses are re-applied. Background I/O jobs (stream resolve, seek after
+# open, prefetch) are not run: their Kodi traffic is already part of the trace.
+import argparse, asyncio, concurrent.futures, contextlib, gzip, importlib.util, io, json, logging, os, sys, time, types
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+PANEL_REFRESH_SEC = 5.0
+
+
+def load_trace(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    records.sort(key=lambda r: r["t"])
+    return records
+
+
+def load_bot(path):
+    for key, val in {
+        "TG_TOKEN": "replay",
+        "KODI_HOST": "127.0.0.1",
+        "KODI_PORT": "8080",
+        "KODI_WS_PORT": "9090",
+        "KODI_USER": "replay",
+        "KODI_PASS": "replay",
+    }.items():
+        os.environ.setdefault(key, val)
+    os.environ["CHECKPOINT_FILE"] = ""
+    os.environ["KODI_TRACE_FILE"] = ""
+    spec = importlib.util.spec_from_file_location("kodi_media_bot", path)
+    bot = importlib.util.module_from_spec(spec)
+    sys.modules["kodi_media_bot"] = bot
+    spec.loader.exec_module(bot)
+    if not hasattr(bot, "CLOCK"):
+        raise SystemExit(f"{path} has no injectable CLOCK; it predates trace replay")
+    return bot
+
+
+# Selector that never blocks: an idle wait advances the loop's virtual time instead.
+class VirtualSelector:
+    def __init__(self, loop, selector):
+        self.loop = loop
+        self.selector = selector
+
+    def select(self, timeout=None):
+        ready = self.selector.select(0)
+        if not ready and timeout:
+            self.loop.vt += timeout
+        return ready
+
+    def __getattr__(self, name):
+        return getattr(self.selector, name)
+
+
+class VirtualLoop(asyncio.SelectorEventLoop):
+    def __init__(self):
+        super().__init__()
+        self.vt = 0.0
+        self._clock_resolution = 1e-6
+        self._selector = VirtualSelector(self, self._selector)
+
+    def time(self):
+        return self.vt
+
+
+# Runs submitted work inline so asyncio.to_thread stays on virtual time.
+class InlineExecutor(concurrent.futures.ThreadPoolExecutor):
+    def submit(self, fn, *args, **kwargs):
+        fut = concurrent.futures.Future()
+        try:
+            fut.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            fut.set_exception(e)
+        return fut
+
+
+# Drops background I/O jobs; their effects on Kodi are already in the trace.
+class DeferredExecutor(concurrent.futures.ThreadPoolExecutor):
+    def __init__(self, stats):
+        super().__init__(max_workers=1)
+        self.stats = stats
+
+    def submit(self, fn, *args, **kwargs):
+        self.stats["io_jobs_skipped"] += 1
+        fut = concurrent.futures.Future()
+        fut.set_result(None)
+        return fut
+
+
+# Answer RPCs with the latest recorded response for the same call, else the same method.
+def make_kodi_call(records, clock, stats):
+    by_call = {}
+    by_method = {}
+    for r in records:
+        if r["k"] != "rpc":
+            continue
+        key = (r["m"], json.dumps(r.get("p"), sort_keys=True))
+        by_call.setdefault(key, []).append(r)
+        by_method.setdefault(r["m"], []).append(r)
+
+    def pick(cands, now):
+        best = None
+        for r in cands:
+            if r["t"] > now:
+                break
+            best = r
+        return best or cands[0]
+
+    def kodi_call(method, params=None):
+        now = clock()
+        stats["rpc"][method] = stats["rpc"].get(method, 0) + 1
+        if method in ("Player.Open", "Player.GoTo"):
+            stats["opens"].append(now)
+        cands = by_call.get((method, json.dumps(params, sort_keys=True))) or by_method.get(method)
+        if not cands:
+            return {"jsonrpc": "2.0", "id": 1, "error": {"code": -32100, "message": "not in trace"}}
+        return pick(cands, now)["r"]
+    return kodi_call
+
+
+class ReplaySocket:
+    def __init__(self, msgs, t0):
+        self.msgs = msgs
+        self.t0 = t0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def __aiter__(self):
+        loop = asyncio.get_running_loop()
+        for r in self.msgs:
+            await asyncio.sleep(max(r["t"] - self.t0 - loop.time(), 0))
+            yield json.dumps(r["msg"])
+        await asyncio.Event().wait()
+
+
+# Re-apply a button press the way on_button does, minus the Telegram replies.
+def replay_cmd(bot, c):
+    if c == "skip":
+        bot.skip_queue()
+    elif c == "back":
+        bot.back_queue()
+    elif c == "stop":
+        bot.hard_stop_and_clear()
+    elif c == "repeat":
+        bot.REPEAT_MODE = {"off": "one", "one": "all", "all": "off"}[bot.REPEAT_MODE]
+        bot.schedule_kodi_playlist_sync()
+        bot.autoplay_notify()
+    elif c == "playpause":
+        if bot.DISPLAY_INDEX is None:
+            if bot.QUEUE:
+                bot.play_index(0)
+        elif bot.get_active_playerid() is None:
+            bot.play_index(bot.DISPLAY_INDEX)
+    elif c.startswith("play:"):
+        bot.play_index(int(c[5:]))
+
+
+async def feed_actions(bot, records, t0):
+    loop = asyncio.get_running_loop()
+    for r in records:
+        await asyncio.sleep(max(r["t"] - t0 - loop.time(), 0))
+        if r["k"] == "q":
+            bot.queue_items([bot.make_item(it["title"], it["url"], it["kind"], link=it.get("link")) for it in r["items"]])
+        elif r["k"] == "del":
+            bot.delete_index(r["i"])
+        elif r["k"] == "clear":
+            bot.clear_queue()
+        elif r["k"] == "cmd":
+            replay_cmd(bot, r["c"])
+
+
+# Poll progress like the panel refresher so LAST_PROGRESS_* is fed.
+async def panel_refresher(bot):
+    while True:
+        try:
+            bot.get_now_playing_text()
+        except Exception as e:
+            print(f"REPLAY panel error={e}", flush=True)
+        await asyncio.sleep(PANEL_REFRESH_SEC)
+
+
+def percentiles(vals):
+    if not vals:
+        return None
+    vals = sorted(vals)
+    pick = lambda q: round(vals[min(len(vals) - 1, int(len(vals) * q))], 3)
+    return {"p50": pick(0.5), "p95": pick(0.95), "max": round(vals[-1], 3), "n": len(vals)}
+
+
+def replay(args):
+    records = load_trace(args.trace)
+    if not records:
+        raise SystemExit("empty trace")
+    bot = load_bot(args.bot)
+    t0 = records[0]["t"]
+    span = records[-1]["t"] - t0
+    stats = {"rpc": {}, "opens": [], "io_jobs_skipped": 0}
+    loop = VirtualLoop()
+    asyncio.set_event_loop(loop)
+    loop.set_default_executor(InlineExecutor())
+    clock = lambda: t0 + loop.time()
+    bot.CLOCK = clock
+    bot.MAIN_LOOP = loop
+    bot.IO_EXECUTOR = DeferredExecutor(stats)
+    bot.kodi_call = make_kodi_call(records, clock, stats)
+    ws_msgs = [r for r in records if r["k"] == "ws"]
+    bot.websockets = types.SimpleNamespace(connect=lambda *a, **kw: ReplaySocket(ws_msgs, t0))
+    actions = [r for r in records if r["k"] in ("q", "del", "clear", "cmd")]
+
+    out = io.StringIO()
+    if hasattr(bot, "LOG"):
+        # Bots with leveled logging write through LOG instead of print.
+        handler = logging.StreamHandler(out)
+        bot.LOG.addHandler(handler)
+        bot.LOG.propagate = False
+    wall = time.perf_counter()
+    with contextlib.redirect_stdout(out):
+        for coro in (
+            bot.kodi_ws_listener(),
+            bot.autoplay_machine(),
+            bot.checkpoint_ticker(),
+            feed_actions(bot, actions, t0),
+            panel_refresher(bot),
+        ):
+            loop.create_task(coro)
+        loop.call_at(span + args.grace, loop.stop)
+        loop.run_forever()
+        tasks = asyncio.all_tasks(loop)
+        for task in tasks:
+            task.cancel()
+        loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        loop.close()
+    wall = time.perf_counter() - wall
+    lines = out.getvalue().splitlines()
+    if args.verbose:
+        for line in lines:
+            print(line)
+
+    # Time from Kodi reporting a natural track end to the bot opening the next item.
+    ends = [r["t"] - t0 for r in ws_msgs if r["msg"].get("method") == "Player.OnStop" and ((r["msg"].get("params") or {}).get("data") or {}).get("end")]
+    opens = [t - t0 for t in stats["opens"]]
+    decisions = []
+    for t in ends:
+        nxt = [o for o in opens if o >= t]
+        if nxt and nxt[0] - t < 60:
+            decisions.append(nxt[0] - t)
+    gaps = [float(l.split("gap=")[1].split("s")[0]) for l in lines if l.startswith("TRACK GAP")]
+    return {
+        "trace": os.path.basename(args.trace),
+        "bot": os.path.abspath(args.bot),
+        "virtual_span_s": round(span, 1),
+        "wall_s": round(wall, 2),
+        "ws_events": len(ws_msgs),
+        "track_ends": len(ends),
+        "end_to_open_s": percentiles(decisions),
+        "track_gap_s": percentiles(gaps),
+        "opens": len(opens),
+        "resume_attempts": sum(1 for l in lines if l.startswith("RESUME ATTEMPT")),
+        "autoplay_transitions": sum(1 for l in lines if l.startswith("AUTOPLAY STATE")),
+        "io_jobs_skipped": stats["io_jobs_skipped"],
+        "rpc_calls": dict(sorted(stats["rpc"].items(), key=lambda kv: -kv[1])),
+    }
+
+
+def compare(a_path, b_path):
+    with open(a_path) as f:
+        a = json.load(f)
+    with open(b_path) as f:
+        b = json.load(f)
+    print(f"{'metric':<28} {'A':>12} {'B':>12} {'delta':>10}")
+    for key in ("end_to_open_s", "track_gap_s"):
+        for q in ("p50", "p95", "max"):
+            va = (a.get(key) or {}).get(q)
+            vb = (b.get(key) or {}).get(q)
+            delta = f"{vb - va:+.3f}" if va is not None and vb is not None else ""
+            print(f"{key + ' ' + q:<28} {str(va):>12} {str(vb):>12} {delta:>10}")
+    for key in ("opens", "resume_attempts", "autoplay_transitions", "io_jobs_skipped"):
+        print(f"{key:<28} {a.get(key)!s:>12} {b.get(key)!s:>12} {b.get(key, 0) - a.get(key, 0):>+10}")
+    print(f"{'rpc calls':<28} {sum(a['rpc_calls'].values()):>12} {sum(b['rpc_calls'].values()):>12}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Replay a KODI_TRACE_FILE recording on a virtual clock.")
+    ap.add_argument("trace", nargs="?")
+    ap.add_argument("--bot", default=os.path.join(ROOT, "kodi_media_bot.py"), help="bot version to replay against")
+    ap.add_argument("--grace", type=float, default=30.0, help="virtual seconds to keep running after the last record")
+    ap.add_argument("--json", help="write the summary to this file")
+    ap.add_argument("--compare", nargs=2, metavar=("A_JSON", "B_JSON"))
+    ap.add_argument("-v", "--verbose", action="store_true", help="print the bot's log lines")
+    args = ap.parse_args()
+    if args.compare:
+        compare(*args.compare)
+        return
+    if not args.trace:
+        ap.error("a trace file is required")
+    result = replay(args)
+    print(json.dumps(result, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
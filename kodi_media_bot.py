@@ -1,13 +1,17 @@
-import os, re, threading, time, requests, asyncio, subprocess, html, json, unicodedata
+import os, re, sys, threading, time, requests, asyncio, subprocess, html, json, unicodedata, base64, multiprocessing, secrets, functools, gzip, bisect, queue, signal, tracemalloc
+import logging, logging.handlers
+STARTUP_TS = time.time()
 from urllib.parse import unquote, quote_plus, urlparse, parse_qs
-from pytube import Playlist, YouTube
-from yt_dlp import YoutubeDL
-from telegram.ext import Application, MessageHandler, filters, CallbackQueryHandler
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter, deque
+import concurrent.futures
+from telegram.ext import Application, MessageHandler, filters, CallbackQueryHandler, CommandHandler
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.error import RetryAfter, TimedOut
 import websockets
 
 TOKEN = os.environ["TG_TOKEN"]
+TG_BASE_URL = os.environ.get("TG_BASE_URL", "")
 KODI_HOST = os.environ["KODI_HOST"]
 KODI_PORT = os.environ["KODI_PORT"]
 KODI_WS_PORT = os.environ["KODI_WS_PORT"]
@@ -17,12 +21,37 @@ STARTUP_CHAT_ID = -1003641420817
 CEC_HOST = os.environ.get("CEC_HOST") or os.environ.get("HOST_IP")
 CEC_CMD_VOL_UP = "0x41"
 CEC_CMD_VOL_DOWN = "0x42"
+CEC_SSH_MUX = os.environ.get("CEC_SSH_MUX", "1") not in ("0", "false", "False", "no", "NO")
+CEC_SSH_CONTROL_PATH = os.environ.get("CEC_SSH_CONTROL_PATH", "/tmp/kodi-cec-ssh.sock")
+CEC_SSH_MASTER = None
+CEC_SSH_MASTER_TS = 0.0
+CEC_SSH_LOCK = threading.Lock()
+CEC_SSH_CONNECT_TIMEOUT = 8.0
+CEC_SSH_RETRY_SEC = 10.0
+CEC_QUEUE = asyncio.Queue()
+CEC_COALESCE_SEC = 0.25
+CEC_TIMEOUTS = {"volume": 30, "power": 20, "topology": 20, "report": 15}
+CEC_LATENCY = {}
+CEC_MONITOR = os.environ.get("CEC_MONITOR", "1") not in ("0", "false", "False", "no", "NO")
+CEC_MONITOR_PROC = None
+CEC_MONITOR_UP = False
+CEC_AUDIO_LA = "5"
+CEC_MSG_RE = re.compile(r"\((\d+) to (\d+)\): ([A-Z0-9_]+)")
+CEC_PWR_RE = re.compile(r"pwr-state: ([a-z-]+)")
+CEC_PWR_STATES = {"on": "On", "to-on": "On", "standby": "Standby", "to-standby": "Standby"}
 
 YT = re.compile(r"(?:v=|youtu\.be/|shorts/)([A-Za-z0-9_-]{11})")
 PL = re.compile(r"(?:[?&]list=)([A-Za-z0-9_-]+)")
 SC = re.compile(r"https?://(www\.)?soundcloud\.com/[^/]+/[^/?#]+")
-SC_SET = re.compile(r"https?://(www\.)?soundcloud\.com/[^/]+/sets/[^/?#]+")
-SC_SHORT = re.compile(r"https?://on\.soundcloud\.com/[A-Za-z0-9]+")
+YT_ID = re.compile(r"^[A-Za-z0-9_-]{11}$")
+SC_TRACK_ID = re.compile(r"soundcloud:tracks:(\d+)|/tracks/(\d+)")
+SC_QUERY = re.compile(r"\?.*$")
+IMDB_ID = re.compile(r"^tt\d+$")
+LINK = re.compile(
+    r"(?P<sc_short>https?://on\.soundcloud\.com/[A-Za-z0-9]+)"
+    r"|https?://(?:www\.|m\.)?soundcloud\.com/(?P<sc_user>[^/\s?#]+)/(?P<sc_path>[^/\s?#]+)(?:/(?P<sc_sub>[^/\s?#]+))?\S*"
+    r"|(?P<yt>(?:https?://)?(?:[\w-]+\.)?(?:youtube\.com|youtu\.be)/\S+)"
+)
 
 pending = {}
 
@@ -37,11 +66,28 @@ PANEL_MSG_ID = {}
 LIST_DIRTY = False
 HIFI_STATUS_CACHE = "⚪ Hifi: Unknown"
 HIFI_STATUS_TS = 0.0
+HIFI_STATUS = None
+HIFI_CONFIRM_TASK = None
+HIFI_CONFIRM_DELAYS = (1, 2, 3, 5, 8, 13)
 DEBUG_WS = os.environ.get("DEBUG_WS") in ("1", "true", "True", "yes", "YES")
+LOG = logging.getLogger("kodi_media_bot")
+LOG.setLevel(getattr(logging, os.environ.get("LOG_LEVEL", "INFO").upper(), logging.INFO))
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "%(message)s")
+LOG_SAMPLE = {}
+LOG_SAMPLE_SEEN = Counter()
+LOG_LISTENER = None
+KODI_TRACE_FILE = os.environ.get("KODI_TRACE_FILE", "")
+KODI_TRACE = None
+KODI_TRACE_LOCK = threading.Lock()
+KODI_TRACE_FLUSH_TS = 0.0
+KODI_TRACE_FLUSH_SEC = 1.0
+CLOCK = time.time
 TG_RATE_LOCK = asyncio.Lock()
 TG_LAST_TS = 0.0
 TG_MIN_INTERVAL = 1.1
 TG_MAX_RETRIES = 3
+TG_MAX_TEXT = 4096
+LIST_CONTEXT_BEFORE = 3
 LAST_PROGRESS_TS = 0.0
 LAST_PROGRESS_TIME = None
 LAST_PROGRESS_TOTAL = None
@@ -59,8 +105,38 @@ WS_STATE = "unknown"
 KODI_WS_URL = None
 APP_INSTANCE = None
 MAIN_LOOP = None
-AUTOPLAY_THREAD_STARTED = False
-AUTOPLAY_THREAD = None
+BACKGROUND_TASKS = []
+AUTOPLAY_STATE = "idle"
+AUTOPLAY_STATE_TS = 0.0
+AUTOPLAY_WAKE = None
+AUTOPLAY_START_TIMEOUT_SEC = 15.0
+AUTOPLAY_STOP_SETTLE_SEC = 0.15
+AUTOPLAY_PREFETCH_RECHECK_SEC = 5.0
+AUTOPLAY_WATCHDOG_SEC = 5.0
+WS_WAITERS = []
+WS_WAITERS_LOCK = threading.Lock()
+WS_RECENT_EVENTS = deque(maxlen=64)
+TRACE_STATS = {}
+TRACE_LOCK = threading.Lock()
+TRACE_WINDOW = 200
+TRACE_SUMMARY_EVERY = 10
+TRACE_COMPLETED = 0
+TRACE_ACTIVE = None
+CHECKPOINT_FILE = os.environ.get("CHECKPOINT_FILE", "/data/checkpoints.json").strip()
+CHECKPOINTS = {}
+CHECKPOINTS_LOCK = threading.Lock()
+CHECKPOINT_DIRTY = False
+CHECKPOINT_FLUSH_TS = 0.0
+CHECKPOINT_LIVE = None
+CHECKPOINT_TICK_SEC = 1.0
+CHECKPOINT_SYNC_SEC = 15.0
+CHECKPOINT_FLUSH_SEC = 10.0
+CHECKPOINT_MIN_SEC = 5
+CHECKPOINT_MAX_ENTRIES = 200
+CHECKPOINT_RESTORE_SEC = 1800
+CHECKPOINT_RESTORE_WAIT_SEC = 30.0
+# Checkpoints belong to one queue entry of one bot run; a fresh queue of the same link starts from the top.
+CHECKPOINT_SESSION = secrets.token_hex(4)
 LAST_WS_ITEM = {}
 LAST_WS_PLAYERID = None
 LAST_WS_YT_ID = ""
@@ -74,38 +150,581 @@ SC_CLIENT_ID_CACHE = ""
 SC_CLIENT_ID_TS = 0.0
 SC_PERMALINK_CACHE = {}
 SC_PERMALINK_TTL = 3600.0
+SC_SET_CACHE = {}
+SC_SET_TTL = 900.0
+SC_SET_CACHE_MAX = 200
+SC_API_BATCH_SIZE = 50
+SC_RESOLVE_WORKERS = 4
+STREAM_PREFETCH = os.environ.get("STREAM_PREFETCH", "1") not in ("0", "false", "False", "no", "NO")
+STREAM_CACHE = {}
+STREAM_DEFAULT_TTL = 300.0
+STREAM_EXPIRY_MARGIN = 30.0
+STREAM_PREFETCH_INFLIGHT = set()
+SC_DIRECT_STREAM = os.environ.get("SC_DIRECT_STREAM") in ("1", "true", "True", "yes", "YES")
+STREAM_PREFETCH_FAILED = {}
+STREAM_PREFETCH_RETRY_SEC = 60.0
+TRANSITION_TS = 0.0
+TRANSITION_DIRECT = False
+KODI_PLAYLIST_SYNC = os.environ.get("KODI_PLAYLIST_SYNC") in ("1", "true", "True", "yes", "YES")
+KODI_MIRROR = {0: [], 1: []}
+KODI_MIRROR_MAX_AHEAD = 100
+KODI_MIRROR_MAX_BEHIND = 10
+KODI_MIRROR_EXPECT_ADDS = 0
+KODI_MIRROR_ADDS_LOCK = threading.Lock()
+KODI_SYNC_PENDING = False
+KODI_SYNC_STATE_LOCK = threading.Lock()
+KODI_SYNC_RUN_LOCK = threading.Lock()
+EXTRACT_POOL_SIZE = int(os.environ.get("EXTRACT_POOL_SIZE", "2"))
+EXTRACT_JOB_TIMEOUT = float(os.environ.get("EXTRACT_JOB_TIMEOUT", "120"))
+EXTRACT_IDLE = []
+EXTRACT_BUSY = 0
+EXTRACT_SEM = None
+EXTRACT_JOBS = {
+    "sc_set": "extract_soundcloud_set",
+    "yt_playlist": "expand_playlist",
+    "yt_title": "fetch_youtube_title",
+    "sc_stream": "resolve_soundcloud_stream_url_ytdlp",
+}
+YT_TITLE_CACHE = {}
+YT_TITLE_CACHE_MAX = 2000
+IO_EXECUTOR_WORKERS = int(os.environ.get("IO_EXECUTOR_WORKERS", "8"))
+IO_EXECUTOR = ThreadPoolExecutor(max_workers=IO_EXECUTOR_WORKERS, thread_name_prefix="kodi-io")
+IO_STATS = {"submitted": 0, "running": 0, "done": 0, "superseded": 0}
+IO_STATS_LOCK = threading.Lock()
+IO_GENERATIONS = {}
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0") or 0)
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRICS_LOCK = threading.Lock()
+METRICS_HIST = {}
+METRICS_COUNTERS = {}
+METRICS_SERVER = None
+ADMIN_USER_IDS = {int(x) for x in re.split(r"[,\s]+", os.environ.get("ADMIN_USER_IDS", "")) if x.isdigit()}
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "/data/profiles")
+PROFILE_DEFAULT_SEC = 30
+PROFILE_MAX_SEC = 300
+PROFILE_INTERVAL = 0.01
+PROFILE_MEM_FRAMES = 5
+PROFILE_TOP = 10
+PROFILE_ACTIVE = None
+# Top frames of a thread that is parked, not working: loop select, pool/queue waits.
+PROFILE_IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("thread.py", "_worker"),
+    ("queue.py", "get"),
+    ("connection.py", "_recv"),
+}
+# name -> (type, help, label names); samples are keyed by (name, label values).
+METRICS_HELP = {
+    "kodi_call_seconds": ("histogram", "Kodi JSON-RPC call latency.", ("method",)),
+    "kodi_call_errors_total": ("counter", "Kodi JSON-RPC calls that raised.", ("method",)),
+    "telegram_call_seconds": ("histogram", "Telegram Bot API call latency.", ("method",)),
+    "telegram_wait_seconds": ("histogram", "Time spent waiting for the Telegram rate limiter before the first attempt.", ("method",)),
+    "telegram_retry_after_total": ("counter", "RetryAfter (429) responses from Telegram.", ("method",)),
+    "kodi_ws_reconnects_total": ("counter", "Kodi WebSocket connections lost or refused.", ()),
+    "track_gap_seconds": ("histogram", "Time from a track ending (or a play request) to the next audio start.", ("direct",)),
+    "cache_lookups_total": ("counter", "Cache lookups by cache and result.", ("cache", "result")),
+}
+YT_DLP_MODULE = None
+PYTUBE_MODULE = None
+
+# Keep only every Nth line of the categories in LOG_SAMPLE, e.g. "SEEN=10,RESUME SEEK=5".
+def parse_log_sample(spec):
+    out = {}
+    for part in spec.split(","):
+        category, _, every = part.rpartition("=")
+        if category.strip() and every.strip().isdigit() and int(every) > 1:
+            out[category.strip()] = int(every)
+    return out
+
+LOG_SAMPLE.update(parse_log_sample(os.environ.get("LOG_SAMPLE", "")))
+
+# Log one line as "CATEGORY message"; cheap when the level is off or the category is sampled out.
+def log(category, msg="", level=logging.INFO):
+    if not LOG.isEnabledFor(level):
+        return
+    every = LOG_SAMPLE.get(category)
+    if every:
+        LOG_SAMPLE_SEEN[category] += 1
+        if LOG_SAMPLE_SEEN[category] % every != 1:
+            return
+    LOG.log(level, f"{category} {msg}" if msg else category, extra={"category": category, "detail": msg})
+
+# Stdout handler for the log listener thread: one flush per drained batch, not per line.
+class DrainFlushHandler(logging.StreamHandler):
+    def __init__(self, stream, pending):
+        super().__init__(stream)
+        self.pending = pending
+
+    def flush(self):
+        if self.pending.empty():
+            super().flush()
+
+# One JSON object per line for LOG_FORMAT=json.
+class JsonLogFormatter(logging.Formatter):
+    def format(self, record):
+        return json.dumps({
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "cat": getattr(record, "category", record.name),
+            "msg": getattr(record, "detail", None) or record.getMessage(),
+        }, ensure_ascii=False)
+
+# Formatter for LOG_FORMAT: JSON lines or a logging format string.
+def log_formatter():
+    return JsonLogFormatter() if LOG_FORMAT == "json" else logging.Formatter(LOG_FORMAT)
+
+# Log straight to stdout from an extract worker; jobs log rarely, so no queue thread is needed.
+def setup_worker_logging():
+    out = logging.StreamHandler(sys.stdout)
+    out.setFormatter(log_formatter())
+    root = logging.getLogger()
+    root.addHandler(out)
+    root.setLevel(logging.WARNING)
+
+# Route bot and library logging through a queue so writes happen on a background thread.
+def setup_logging():
+    global LOG_LISTENER
+    pending = queue.SimpleQueue()
+    out = DrainFlushHandler(sys.stdout, pending)
+    out.setFormatter(log_formatter())
+    root = logging.getLogger()
+    root.addHandler(logging.handlers.QueueHandler(pending))
+    # Libraries (httpx, telegram) only surface warnings, as before.
+    root.setLevel(logging.WARNING)
+    LOG_LISTENER = logging.handlers.QueueListener(pending, out)
+    LOG_LISTENER.start()
 
 # Serialize Telegram API calls to avoid send/edit/delete collisions.
 async def telegram_request(call, *args, **kwargs):
     global TG_LAST_TS
+    name = (getattr(call, "__name__", "call"),)
+    queued = time.perf_counter()
     for _ in range(TG_MAX_RETRIES):
         async with TG_RATE_LOCK:
-            now = time.time()
+            now = CLOCK()
             wait = TG_MIN_INTERVAL - (now - TG_LAST_TS)
             if wait > 0:
                 await asyncio.sleep(wait)
+            if queued:
+                metrics_observe("telegram_wait_seconds", name, time.perf_counter() - queued)
+                queued = 0.0
             try:
-                res = await call(*args, **kwargs)
-                TG_LAST_TS = time.time()
+                res = await timed_telegram_call(name, call, *args, **kwargs)
+                TG_LAST_TS = CLOCK()
                 return res
             except RetryAfter as e:
-                TG_LAST_TS = time.time()
+                TG_LAST_TS = CLOCK()
+                metrics_inc("telegram_retry_after_total", name)
                 await asyncio.sleep(e.retry_after)
             except TimedOut:
-                TG_LAST_TS = time.time()
+                TG_LAST_TS = CLOCK()
                 await asyncio.sleep(1.5)
             except Exception:
-                TG_LAST_TS = time.time()
+                TG_LAST_TS = CLOCK()
                 raise
     async with TG_RATE_LOCK:
-        now = time.time()
+        now = CLOCK()
         wait = TG_MIN_INTERVAL - (now - TG_LAST_TS)
         if wait > 0:
             await asyncio.sleep(wait)
-        res = await call(*args, **kwargs)
-        TG_LAST_TS = time.time()
+        res = await timed_telegram_call(name, call, *args, **kwargs)
+        TG_LAST_TS = CLOCK()
         return res
 
+# Time one Telegram API call, including failed ones.
+async def timed_telegram_call(name, call, *args, **kwargs):
+    start = time.perf_counter()
+    try:
+        return await call(*args, **kwargs)
+    finally:
+        metrics_observe("telegram_call_seconds", name, time.perf_counter() - start)
+
+# Start a new generation for a keyed task; older tasks with the key become stale.
+def supersede_io(key):
+    with IO_STATS_LOCK:
+        gen = IO_GENERATIONS.get(key, 0) + 1
+        IO_GENERATIONS[key] = gen
+    cancel_ws_waiters(key)
+    return gen
+
+# Check whether a keyed task is still the latest of its kind.
+def io_current(key, token):
+    return IO_GENERATIONS.get(key) == token
+
+# Run blocking I/O on the shared executor.
+def submit_io(fn, *args, key=None, token=None, **kwargs):
+    with IO_STATS_LOCK:
+        IO_STATS["submitted"] += 1
+
+    def _run():
+        if key is not None and not io_current(key, token):
+            with IO_STATS_LOCK:
+                IO_STATS["superseded"] += 1
+                IO_STATS["done"] += 1
+            return None
+        with IO_STATS_LOCK:
+            IO_STATS["running"] += 1
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            log("IO TASK ERROR", f"fn={getattr(fn, '__name__', fn)} err={e}", level=logging.ERROR)
+            return None
+        finally:
+            with IO_STATS_LOCK:
+                IO_STATS["running"] -= 1
+                IO_STATS["done"] += 1
+    return IO_EXECUTOR.submit(_run)
+
+# Snapshot executor load: queued work includes asyncio.to_thread calls.
+def io_executor_stats():
+    with IO_STATS_LOCK:
+        stats = dict(IO_STATS)
+    stats["queued"] = IO_EXECUTOR._work_queue.qsize()
+    stats["threads"] = len(IO_EXECUTOR._threads)
+    stats["workers"] = IO_EXECUTOR_WORKERS
+    return stats
+
+# Add one observation to a histogram; a no-op unless METRICS_PORT is set.
+def metrics_observe(name, labels, value):
+    if not METRICS_PORT:
+        return
+    i = bisect.bisect_left(METRICS_BUCKETS, value)
+    with METRICS_LOCK:
+        hist = METRICS_HIST.get((name, labels))
+        if hist is None:
+            hist = METRICS_HIST[(name, labels)] = [[0] * (len(METRICS_BUCKETS) + 1), 0.0]
+        hist[0][i] += 1
+        hist[1] += value
+
+# Bump a counter; a no-op unless METRICS_PORT is set.
+def metrics_inc(name, labels=(), n=1):
+    if not METRICS_PORT:
+        return
+    with METRICS_LOCK:
+        METRICS_COUNTERS[(name, labels)] = METRICS_COUNTERS.get((name, labels), 0) + n
+
+# Label set for a sample; values are method/cache names and flags, so no escaping is needed.
+def metrics_labels(name, values):
+    names = METRICS_HELP[name][2]
+    if not names:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(names, values)) + "}"
+
+# Render all metrics in the Prometheus text format; gauges are read at scrape time.
+def render_metrics():
+    with METRICS_LOCK:
+        hists = {k: (list(v[0]), v[1]) for k, v in METRICS_HIST.items()}
+        counters = dict(METRICS_COUNTERS)
+    lines = []
+    for name, (kind, help_text, _) in METRICS_HELP.items():
+        lines.append(f"# HELP kodi_bot_{name} {help_text}")
+        lines.append(f"# TYPE kodi_bot_{name} {kind}")
+        if kind == "histogram":
+            for (hname, labels), (buckets, total) in sorted(hists.items()):
+                if hname != name:
+                    continue
+                base = metrics_labels(name, labels)
+                prefix = base[:-1] + "," if base else "{"
+                acc = 0
+                for le, n in zip(METRICS_BUCKETS + ("+Inf",), buckets):
+                    acc += n
+                    lines.append(f'kodi_bot_{name}_bucket{prefix}le="{le}"}} {acc}')
+                lines.append(f"kodi_bot_{name}_sum{base} {total:.6f}")
+                lines.append(f"kodi_bot_{name}_count{base} {acc}")
+        else:
+            for (cname, labels), n in sorted(counters.items()):
+                if cname == name:
+                    lines.append(f"kodi_bot_{name}{metrics_labels(name, labels)} {n}")
+
+    io = io_executor_stats()
+    gauges = [
+        ("queue_length", "Items in the queue.", len(QUEUE)),
+        ("queue_upcoming", "Queue items after the current one.", max(len(QUEUE) - NEXT_INDEX, 0)),
+        ("io_executor_queued", "Jobs waiting for the shared I/O executor.", io["queued"]),
+        ("io_executor_running", "Jobs running on the shared I/O executor.", io["running"]),
+        ("io_executor_threads", "Threads started by the shared I/O executor.", io["threads"]),
+        ("io_executor_workers", "Maximum threads of the shared I/O executor.", io["workers"]),
+        ("threads", "Live Python threads.", threading.active_count()),
+        ("extract_workers_idle", "Idle extraction worker processes.", len(EXTRACT_IDLE)),
+        ("kodi_ws_connected", "1 while the Kodi WebSocket is connected.", int(WS_CONNECTED)),
+        ("uptime_seconds", "Seconds since the bot started.", round(CLOCK() - STARTUP_TS, 1)),
+    ]
+    for name, help_text, value in gauges:
+        lines.append(f"# HELP kodi_bot_{name} {help_text}")
+        lines.append(f"# TYPE kodi_bot_{name} gauge")
+        lines.append(f"kodi_bot_{name} {value}")
+    # functools caches keep their own hit counts, so they cost nothing until scraped.
+    lines.append("# HELP kodi_bot_lru_cache_lookups_total Memoized link parser lookups by result.")
+    lines.append("# TYPE kodi_bot_lru_cache_lookups_total counter")
+    for fn in (extract_youtube_id, extract_soundcloud_url, resolve_file_link):
+        info = fn.cache_info()
+        lines.append(f'kodi_bot_lru_cache_lookups_total{{cache="{fn.__name__}",result="hit"}} {info.hits}')
+        lines.append(f'kodi_bot_lru_cache_lookups_total{{cache="{fn.__name__}",result="miss"}} {info.misses}')
+    return "\n".join(lines) + "\n"
+
+# Answer one HTTP request on the metrics port; anything but GET /metrics is a 404.
+async def handle_metrics_request(reader, writer):
+    try:
+        request = await asyncio.wait_for(reader.readline(), 5)
+        while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request.split()
+        if len(parts) >= 2 and parts[0] in (b"GET", b"HEAD") and parts[1].split(b"?")[0] == b"/metrics":
+            status, body = "200 OK", render_metrics().encode()
+        else:
+            status, body = "404 Not Found", b"not found\n"
+        head = (
+            f"HTTP/1.1 {status}\r\n"
+            "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n"
+        ).encode()
+        writer.write(head if parts[:1] == [b"HEAD"] else head + body)
+        await writer.drain()
+    except Exception as e:
+        log("METRICS", f"request failed err={e}", level=logging.WARNING)
+    finally:
+        writer.close()
+
+# Base path for a profile's output files; PROFILE_DIR is created on first use.
+def profile_path(kind):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    return os.path.join(PROFILE_DIR, f"{kind}-{time.strftime('%Y%m%d-%H%M%S')}")
+
+# Sample every thread's Python stack for a while; parked threads only count towards their total.
+def sample_stacks(seconds, interval=PROFILE_INTERVAL):
+    me = threading.get_ident()
+    folded, self_hits, incl, busy, total = Counter(), Counter(), Counter(), Counter(), Counter()
+    samples = 0
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            name = names.get(ident, str(ident))
+            stack = []
+            while frame is not None:
+                stack.append((os.path.basename(frame.f_code.co_filename), frame.f_code.co_name, frame.f_lineno))
+                frame = frame.f_back
+            total[name] += 1
+            if not stack or stack[0][:2] in PROFILE_IDLE_FRAMES:
+                continue
+            busy[name] += 1
+            self_hits["%s:%s:%d" % stack[0]] += 1
+            for fn in {f"{f}:{c}" for f, c, _ in stack}:
+                incl[fn] += 1
+            folded[";".join([name] + [f"{f}:{c}" for f, c, _ in reversed(stack)])] += 1
+        samples += 1
+        time.sleep(interval)
+    return {"samples": samples, "folded": folded, "self": self_hits, "incl": incl, "busy": busy, "total": total}
+
+# CPU profile: folded stacks (flamegraph.pl / speedscope input) plus a text summary.
+def profile_cpu(seconds):
+    res = sample_stacks(seconds)
+    busy_all = sum(res["busy"].values()) or 1
+    main_name = threading.main_thread().name
+    loop_busy = res["busy"][main_name] / max(res["total"][main_name], 1)
+    lines = [
+        f"🔬 CPU profile {seconds}s, {res['samples']} samples @ {PROFILE_INTERVAL * 1000:.0f}ms",
+        f"Event loop busy: {loop_busy:.0%}",
+        "Busy threads: " + (", ".join(
+            f"{name} {n / max(res['total'][name], 1):.0%}" for name, n in res["busy"].most_common(5)
+        ) or "none"),
+        "",
+        "Top lines (self):",
+    ]
+    lines += [f"{n / busy_all:5.1%} {key}" for key, n in res["self"].most_common(PROFILE_TOP)]
+    lines += ["", "Top functions (incl.):"]
+    lines += [f"{n / busy_all:5.1%} {key}" for key, n in res["incl"].most_common(PROFILE_TOP)]
+    summary = "\n".join(lines)
+    base = profile_path("cpu")
+    with open(base + ".folded", "w", encoding="utf-8") as f:
+        for stack, n in res["folded"].most_common():
+            f.write(f"{stack} {n}\n")
+    with open(base + ".txt", "w", encoding="utf-8") as f:
+        f.write(summary + "\n")
+    return summary, base + ".folded"
+
+# Allocation profile: what grew between two tracemalloc snapshots taken seconds apart.
+def profile_memory(seconds):
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start(PROFILE_MEM_FRAMES)
+    try:
+        before = tracemalloc.take_snapshot()
+        time.sleep(seconds)
+        after = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started:
+            tracemalloc.stop()
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")]
+    stats = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), "lineno")
+    grown = sum(st.size_diff for st in stats)
+    lines = [
+        f"🧠 Allocation diff {seconds}s: {grown / 1024:+.0f} KiB, traced now {current / 1024:.0f} KiB, peak {peak / 1024:.0f} KiB",
+        "",
+        "Top growth:",
+    ]
+    for st in stats[:PROFILE_TOP]:
+        frame = st.traceback[0]
+        lines.append(f"{st.size_diff / 1024:+8.1f} KiB {st.count_diff:+6d} {os.path.basename(frame.filename)}:{frame.lineno}")
+    summary = "\n".join(lines)
+    base = profile_path("mem")
+    after.dump(base + ".tracemalloc")
+    with open(base + ".txt", "w", encoding="utf-8") as f:
+        f.write(summary + "\n\n")
+        for st in stats[:200]:
+            f.write(f"{st}\n")
+    return summary, base + ".txt"
+
+# Run one profile on its own thread (the I/O pool may be the thing that is stuck); returns the chat summary.
+async def run_profile(kind, seconds):
+    global PROFILE_ACTIVE
+    if PROFILE_ACTIVE:
+        return f"⚠ A {PROFILE_ACTIVE} profile is already running."
+    PROFILE_ACTIVE = kind
+    fut = concurrent.futures.Future()
+
+    def _run():
+        try:
+            fut.set_result(profile_cpu(seconds) if kind == "cpu" else profile_memory(seconds))
+        except Exception as e:
+            fut.set_exception(e)
+    try:
+        threading.Thread(target=_run, name="profiler", daemon=True).start()
+        summary, path = await asyncio.wrap_future(fut)
+    except Exception as e:
+        log("PROFILE", f"failed kind={kind} err={e}", level=logging.WARNING)
+        return f"⚠ Profile failed: {e}"
+    finally:
+        PROFILE_ACTIVE = None
+    log("PROFILE", f"done kind={kind} seconds={seconds} file={path}")
+    return f"{summary}\n\n📄 {path}"
+
+# Profile, then post the summary to each chat (admins' private chats for signal triggers).
+async def profile_and_report(bot, kind, seconds, chat_ids):
+    summary = await run_profile(kind, seconds)
+    if not chat_ids:
+        log("PROFILE", summary)
+    for chat_id in chat_ids:
+        try:
+            await telegram_request(bot.send_message, chat_id=chat_id, text=summary[:TG_MAX_TEXT])
+        except Exception as e:
+            log("PROFILE", f"report failed chat_id={chat_id} err={e}", level=logging.WARNING)
+
+# SIGUSR1 starts a CPU profile, SIGUSR2 an allocation diff.
+def on_profile_signal(kind):
+    log("PROFILE", f"signal kind={kind} seconds={PROFILE_DEFAULT_SEC}")
+    MAIN_LOOP.create_task(profile_and_report(APP_INSTANCE.bot, kind, PROFILE_DEFAULT_SEC, sorted(ADMIN_USER_IDS)))
+
+# Serve /metrics on the bot's event loop when METRICS_PORT is set.
+async def start_metrics_server():
+    global METRICS_SERVER
+    if not METRICS_PORT:
+        return
+    try:
+        METRICS_SERVER = await asyncio.start_server(handle_metrics_request, METRICS_HOST, METRICS_PORT)
+        log("METRICS", f"listening on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    except Exception as e:
+        log("METRICS", f"start failed host={METRICS_HOST} port={METRICS_PORT} err={e}", level=logging.WARNING)
+
+# Start a time-to-first-audio trace for a user request.
+def new_trace(t0=None):
+    now = CLOCK()
+    return {"id": secrets.token_hex(4), "t0": t0 or now, "last": t0 or now}
+
+# Give each item expanded from one request its own trace with the shared start time.
+# Fork right before the item's own work begins: its next stage is timed from here.
+def fork_trace(trace, n):
+    if not trace:
+        return None
+    return {"id": f"{trace['id']}.{n}", "t0": trace["t0"], "last": CLOCK()}
+
+# Close a trace stage: log it and feed the rolling per-stage percentiles; returns the stage ms.
+def trace_mark(trace, stage, start=None, level=logging.INFO):
+    if not trace:
+        return None
+    now = CLOCK()
+    ms = (now - (trace["last"] if start is None else start)) * 1000.0
+    trace["last"] = now
+    # Stages are closed from I/O threads as well as the loop.
+    with TRACE_LOCK:
+        window = TRACE_STATS.get(stage)
+        if window is None:
+            window = TRACE_STATS[stage] = deque(maxlen=TRACE_WINDOW)
+        window.append(ms)
+    log("TRACE", json.dumps({"id": trace["id"], "stage": stage, "ms": round(ms, 1)}), level=level)
+    return ms
+
+# Rolling p50/p95 per trace stage.
+def trace_summary():
+    out = {}
+    with TRACE_LOCK:
+        snapshot = [(stage, list(window)) for stage, window in TRACE_STATS.items()]
+    for stage, vals in snapshot:
+        vals.sort()
+        if not vals:
+            continue
+        out[stage] = {
+            "p50": round(vals[len(vals) // 2], 1),
+            "p95": round(vals[min(len(vals) - 1, int(len(vals) * 0.95))], 1),
+            "n": len(vals),
+        }
+    return out
+
+# Note that a traced item is being started by Kodi.
+def trace_play_started(item):
+    global TRACE_ACTIVE
+    trace = item.get("trace")
+    if not trace or trace.get("played"):
+        TRACE_ACTIVE = None
+        return
+    trace["played"] = True
+    trace_mark(trace, "pickup", start=trace.get("queued_ts"))
+    TRACE_ACTIVE = trace
+
+# Finish the active trace when Kodi reports audio/video start.
+def trace_first_audio():
+    global TRACE_ACTIVE, TRACE_COMPLETED
+    trace = TRACE_ACTIVE
+    if not trace:
+        return
+    TRACE_ACTIVE = None
+    trace_mark(trace, "av_start")
+    trace_mark(trace, "first_audio", start=trace["t0"])
+    with TRACE_LOCK:
+        TRACE_COMPLETED += 1
+        completed = TRACE_COMPLETED
+    if completed % TRACE_SUMMARY_EVERY == 0:
+        log("TRACE SUMMARY", json.dumps(trace_summary()))
+
+# Import yt-dlp on first use; it dominates cold start time.
+def load_yt_dlp():
+    global YT_DLP_MODULE
+    if YT_DLP_MODULE is None:
+        import yt_dlp
+        YT_DLP_MODULE = yt_dlp
+    return YT_DLP_MODULE
+
+# Import pytube on first use.
+def load_pytube():
+    global PYTUBE_MODULE
+    if PYTUBE_MODULE is None:
+        import pytube
+        PYTUBE_MODULE = pytube
+    return PYTUBE_MODULE
+
+# Load the extractors in the background once the bot is up, when extraction runs in-process.
+def prewarm_extractors():
+    start = CLOCK()
+    load_yt_dlp()
+    load_pytube()
+    log("STARTUP", f"extractors loaded in {CLOCK() - start:.2f}s")
+
 # Mark the playlist display as needing refresh.
 def mark_list_dirty():
     global LIST_DIRTY
@@ -189,12 +808,49 @@ def control_panel():
         ],
     ])
 
+# Open the opt-in Kodi trace file (JSON lines, gzip when the name ends in .gz).
+def open_kodi_trace():
+    global KODI_TRACE
+    if not KODI_TRACE_FILE:
+        return
+    try:
+        if KODI_TRACE_FILE.endswith(".gz"):
+            KODI_TRACE = gzip.open(KODI_TRACE_FILE, "at", encoding="utf-8")
+        else:
+            KODI_TRACE = open(KODI_TRACE_FILE, "a", encoding="utf-8")
+        log("KODI TRACE", f"recording to {KODI_TRACE_FILE}")
+    except Exception as e:
+        log("KODI TRACE", f"open failed path={KODI_TRACE_FILE} err={e}", level=logging.WARNING)
+
+# Append one record to the Kodi trace; a no-op unless KODI_TRACE_FILE is set.
+def record_kodi_trace(kind, **fields):
+    global KODI_TRACE_FLUSH_TS
+    if KODI_TRACE is None:
+        return
+    now = CLOCK()
+    line = json.dumps({"t": round(now, 3), "k": kind, **fields}, separators=(",", ":"), default=str)
+    with KODI_TRACE_LOCK:
+        KODI_TRACE.write(line + "\n")
+        if now - KODI_TRACE_FLUSH_TS >= KODI_TRACE_FLUSH_SEC:
+            KODI_TRACE.flush()
+            KODI_TRACE_FLUSH_TS = now
+
 # Send a JSON-RPC request to Kodi and return the response JSON.
 def kodi_call(method: str, params: dict | None = None):
     payload = {"jsonrpc": "2.0", "method": method, "id": 1}
     if params:
         payload["params"] = params
-    return requests.post(KODI_URL, auth=AUTH, json=payload, timeout=5).json()
+    start = time.perf_counter()
+    try:
+        res = requests.post(KODI_URL, auth=AUTH, json=payload, timeout=5).json()
+    except Exception:
+        metrics_inc("kodi_call_errors_total", (method,))
+        raise
+    finally:
+        metrics_observe("kodi_call_seconds", (method,), time.perf_counter() - start)
+    if KODI_TRACE is not None:
+        record_kodi_trace("rpc", m=method, p=params, r=res)
+    return res
 
 
 def kodi_call_with_props(method, id_key, id_value, properties):
@@ -203,8 +859,7 @@ def kodi_call_with_props(method, id_key, id_value, properties):
         res = kodi_call(method, {id_key: id_value, "properties": props})
         if not res.get("error"):
             return res
-        if DEBUG_WS:
-            print(f"LIB FETCH retry method={method} props={props} err={res.get('error')}", flush=True)
+        log("LIB FETCH", f"retry method={method} props={props} err={res.get('error')}", level=logging.DEBUG)
         props = props[:-1]
     return kodi_call(method, {id_key: id_value, "properties": []})
 
@@ -232,67 +887,310 @@ def pick_playerid(players):
             return p.get("playerid")
     return players[0].get("playerid")
 
-# Send repeated CEC volume commands over SSH.
-def run_cec_volume(times: int, cmd_hex: str) -> bool:
-    cmd = (
-        f"ssh -o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null root@{CEC_HOST} seq {times} | "
-        f"ssh -o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null root@{CEC_HOST} "
-        f"xargs -Iz cec-ctl --user-control-pressed ui-cmd={cmd_hex} -t5"
-    )
-    try:
-        res = subprocess.run(cmd, shell=True, check=False, capture_output=True, text=True)
-        if res.returncode != 0:
-            print(f"CEC FAIL rc={res.returncode} stderr={res.stderr.strip()}", flush=True)
+# SSH options shared by the CEC master connection and the commands riding on it.
+def cec_ssh_options():
+    opts = ["-o", "StrictHostKeyChecking=no", "-o", "UserKnownHostsFile=/dev/null"]
+    if CEC_SSH_MUX:
+        opts += ["-o", f"ControlPath={CEC_SSH_CONTROL_PATH}"]
+    return opts
+
+# Keep one authenticated SSH connection to the CEC host open, reconnecting when it drops.
+def ensure_cec_master():
+    global CEC_SSH_MASTER, CEC_SSH_MASTER_TS
+    if not CEC_SSH_MUX or not CEC_HOST:
+        return False
+    with CEC_SSH_LOCK:
+        proc = CEC_SSH_MASTER
+        if proc is not None and proc.poll() is None:
+            return os.path.exists(CEC_SSH_CONTROL_PATH)
+        if proc is not None:
+            log("CEC SSH", f"master exited rc={proc.returncode}; reconnecting", level=logging.WARNING)
+            CEC_SSH_MASTER = None
+        if CLOCK() - CEC_SSH_MASTER_TS < CEC_SSH_RETRY_SEC:
             return False
-        return True
-    except Exception as e:
-        print(f"CEC ERROR err={e}", flush=True)
+        CEC_SSH_MASTER_TS = CLOCK()
+        try:
+            os.unlink(CEC_SSH_CONTROL_PATH)
+        except FileNotFoundError:
+            pass
+        argv = ["ssh", *cec_ssh_options(), "-o", "ControlMaster=yes", "-o", "BatchMode=yes",
+                "-o", "ServerAliveInterval=15", "-o", "ServerAliveCountMax=3",
+                "-N", f"root@{CEC_HOST}"]
+        try:
+            proc = subprocess.Popen(
+                argv,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+        except Exception as e:
+            log("CEC SSH", f"master start failed err={e}", level=logging.WARNING)
+            return False
+        CEC_SSH_MASTER = proc
+        deadline = CLOCK() + CEC_SSH_CONNECT_TIMEOUT
+        while CLOCK() < deadline and proc.poll() is None:
+            if os.path.exists(CEC_SSH_CONTROL_PATH):
+                log("CEC SSH", f"master up in {CLOCK() - CEC_SSH_MASTER_TS:.2f}s")
+                return True
+            time.sleep(0.05)
+        log("CEC SSH", f"master not ready rc={proc.poll()}", level=logging.WARNING)
         return False
 
+# Argument vector for an ssh call that runs a remote command over the shared connection.
+def cec_ssh_argv(remote: str):
+    # Without a live master, ssh falls back to a direct connection.
+    mux = ["-o", "ControlMaster=no"] if CEC_SSH_MUX else []
+    return ["ssh", *cec_ssh_options(), *mux, "-T", f"root@{CEC_HOST}", remote]
+
+# Rolling p50/p95 CEC command latency per command type.
+def cec_latency_summary():
+    out = {}
+    for kind, window in list(CEC_LATENCY.items()):
+        vals = sorted(window)
+        if not vals:
+            continue
+        out[kind] = {
+            "p50": round(vals[len(vals) // 2], 2),
+            "p95": round(vals[min(len(vals) - 1, int(len(vals) * 0.95))], 2),
+            "n": len(vals),
+        }
+    return out
+
+# Run a command on the CEC host; returns rc (None on timeout/spawn failure), stdout, stderr and duration.
+async def run_cec_command(kind, remote, timeout=None):
+    if CEC_SSH_MUX and (CEC_SSH_MASTER is None or CEC_SSH_MASTER.poll() is not None):
+        await asyncio.to_thread(ensure_cec_master)
+    timeout = timeout or CEC_TIMEOUTS.get(kind, 20)
+    start = time.monotonic()
+    rc, out, err, timed_out = None, "", "", False
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *cec_ssh_argv(remote),
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            out_b, err_b = await asyncio.wait_for(proc.communicate(), timeout)
+            rc = proc.returncode
+            out = out_b.decode("utf-8", "replace")
+            err = err_b.decode("utf-8", "replace").strip()
+        except asyncio.TimeoutError:
+            timed_out = True
+            proc.kill()
+            await proc.wait()
+            err = f"timed out after {timeout}s"
+    except Exception as e:
+        err = str(e)
+    duration = time.monotonic() - start
+    CEC_LATENCY.setdefault(kind, deque(maxlen=50)).append(duration)
+    stats = cec_latency_summary().get(kind, {})
+    log(
+        "CEC CMD",
+        f"kind={kind} rc={rc} took={duration:.2f}s p50={stats.get('p50')} p95={stats.get('p95')}"
+        + (f" stderr={err}" if rc != 0 else ""),
+        level=logging.INFO if rc == 0 else logging.WARNING,
+    )
+    return {"kind": kind, "rc": rc, "stdout": out, "stderr": err, "duration": duration, "timed_out": timed_out}
+
+# Send repeated CEC volume commands over SSH.
+async def run_cec_volume(times: int, cmd_hex: str) -> bool:
+    res = await run_cec_command(
+        "volume",
+        f"seq {int(times)} | xargs -Iz cec-ctl --user-control-pressed ui-cmd={cmd_hex} -t5",
+    )
+    return res["rc"] == 0
+
 # Turn the audio system on or off via CEC over SSH.
-def run_cec_power(on: bool) -> bool:
+async def run_cec_power(on: bool) -> bool:
     if on:
-        cmd = (
-            f"ssh -o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null root@{CEC_HOST} "
-            f"cec-ctl --user-control-pressed ui-cmd=power-on-function -t0 && "
-            f"ssh -o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null root@{CEC_HOST} "
-            f"cec-ctl --user-control-pressed ui-cmd=power-on-function -t5"
+        remote = (
+            "cec-ctl --user-control-pressed ui-cmd=power-on-function -t0 && "
+            "cec-ctl --user-control-pressed ui-cmd=power-on-function -t5"
         )
     else:
-        cmd = (
-            f"ssh -o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null root@{CEC_HOST} "
-            f"cec-ctl --standby -t0 && "
-            f"ssh -o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null root@{CEC_HOST} "
-            f"cec-ctl --standby -t5"
-        )
-    try:
-        res = subprocess.run(cmd, shell=True, check=False, capture_output=True, text=True)
-        if res.returncode != 0:
-            print(f"CEC FAIL rc={res.returncode} stderr={res.stderr.strip()}", flush=True)
-            return False
-        return True
-    except Exception as e:
-        print(f"CEC ERROR err={e}", flush=True)
-        return False
+        remote = "cec-ctl --standby -t0 && cec-ctl --standby -t5"
+    res = await run_cec_command("power", remote)
+    return res["rc"] == 0
+
+# Query the audio system power state via a CEC topology scan.
+async def get_hifi_power_status():
+    res = await run_cec_command("topology", "cec-ctl --show-topology")
+    if res["rc"] != 0:
+        return None
+    in_audio = False
+    for line in res["stdout"].splitlines():
+        if "Audio System" in line:
+            in_audio = True
+        elif in_audio and "Power Status" in line:
+            val = line.split()[-1]
+            return val if val in ("On", "Standby") else None
+    return None
+
+# Whether the cec-ctl monitor stream is connected.
+def cec_monitor_healthy():
+    proc = CEC_MONITOR_PROC
+    return CEC_MONITOR_UP and proc is not None and proc.returncode is None
+
+# Apply one line of cec-ctl --monitor output to the hifi status; returns the current message header.
+def parse_cec_monitor_line(line, header):
+    m = CEC_MSG_RE.search(line)
+    if m:
+        src, dst, op = m.groups()
+        if op == "STANDBY" and dst in (CEC_AUDIO_LA, "15"):
+            if set_hifi_status("Standby", "monitor"):
+                schedule_now_playing_refresh()
+        return (src, dst, op)
+    if header and header[0] == CEC_AUDIO_LA and header[2] == "REPORT_POWER_STATUS":
+        p = CEC_PWR_RE.search(line)
+        if p and set_hifi_status(CEC_PWR_STATES.get(p.group(1)), "monitor"):
+            schedule_now_playing_refresh()
+    return header
+
+# Ask the audio system to report its power state; the monitor picks up the reply.
+async def request_hifi_power_report():
+    await run_cec_command("report", f"cec-ctl --give-device-power-status -t{CEC_AUDIO_LA}")
+
+# Keep cec-ctl --monitor running on the CEC host and follow the audio system's power state.
+async def cec_monitor():
+    global CEC_MONITOR_PROC, CEC_MONITOR_UP
+    backoff = 2
+    while True:
+        if CEC_SSH_MUX:
+            await asyncio.to_thread(ensure_cec_master)
+        argv = cec_ssh_argv("cec-ctl --monitor")
+        argv[1:1] = ["-o", "ServerAliveInterval=15"]
+        started = CLOCK()
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *argv,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+        except Exception as e:
+            log("CEC MONITOR", f"start failed err={e}", level=logging.WARNING)
+            await asyncio.sleep(60)
+            continue
+        CEC_MONITOR_PROC = proc
+        header = None
+        while True:
+            raw = await proc.stdout.readline()
+            if not raw:
+                break
+            if not CEC_MONITOR_UP:
+                CEC_MONITOR_UP = True
+                log("CEC MONITOR", "connected")
+                asyncio.get_running_loop().create_task(request_hifi_power_report())
+            header = parse_cec_monitor_line(raw.decode("utf-8", "replace"), header)
+        await proc.wait()
+        CEC_MONITOR_UP = False
+        log("CEC MONITOR", f"exited rc={proc.returncode}", level=logging.WARNING)
+        backoff = 2 if CLOCK() - started > 60 else min(backoff * 2, 60)
+        await asyncio.sleep(backoff)
+
+# Hand a CEC command to the worker; the future resolves with its result.
+def cec_submit(kind, arg=None):
+    fut = asyncio.get_running_loop().create_future()
+    CEC_QUEUE.put_nowait((kind, arg, fut))
+    return fut
+
+# Run CEC commands one at a time, merging volume presses that arrive close together.
+async def cec_worker():
+    held = None
+    while True:
+        job = held or await CEC_QUEUE.get()
+        held = None
+        kind, arg, fut = job
+        # Every job merged into this run; all of them are answered, even on failure.
+        batch = [job]
+        try:
+            if kind == "volume":
+                await asyncio.sleep(CEC_COALESCE_SEC)
+                while not CEC_QUEUE.empty():
+                    nxt = CEC_QUEUE.get_nowait()
+                    if nxt[0] != "volume":
+                        held = nxt
+                        break
+                    batch.append(nxt)
+                presses = sum(j[1][0] for j in batch)
+                units = sum(j[1][1] for j in batch)
+                ok = True
+                if presses:
+                    cmd_hex = CEC_CMD_VOL_UP if presses > 0 else CEC_CMD_VOL_DOWN
+                    ok = await run_cec_volume(abs(presses), cmd_hex)
+                log("CEC VOLUME", f"merged={len(batch)} presses={presses:+d} ok={ok}")
+                result = {"ok": ok, "units": units, "merged": len(batch)}
+                for _, _, f in batch:
+                    if not f.done():
+                        f.set_result(result)
+            elif kind == "power":
+                ok = await run_cec_power(arg)
+                if not fut.done():
+                    fut.set_result(ok)
+        except Exception as e:
+            log("CEC WORKER ERROR", f"kind={kind} merged={len(batch)} err={e}", level=logging.ERROR)
+            for _, _, f in batch:
+                if not f.done():
+                    f.set_result(None)
+
+# Queue a volume change and post the outcome once the worker has sent it.
+def queue_cec_volume_reply(ctx, chat_id, presses, units):
+    fut = cec_submit("volume", (presses, units))
+    prev_id = LAST_BOT_ID.get(chat_id)
+
+    async def _reply():
+        res = await fut
+        icon = "🔊" if units > 0 else "🔉"
+        if res and res["ok"]:
+            text = f"{icon} {units:+d}"
+            if res["merged"] > 1:
+                text += f" (sent together: {res['units']:+d})"
+        else:
+            text = f"⚠ Volume {units:+d} failed"
+        await send_and_track(ctx, chat_id, text)
+        schedule_cleanup(ctx, chat_id, prev_id)
+        await update_list_message(ctx, chat_id)
+
+    asyncio.get_running_loop().create_task(_reply())
 
-# Query the audio system power state via CEC.
-def get_hifi_power_status():
-    cmd = (
-        f"ssh -o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null root@{CEC_HOST} "
-        f"cec-ctl --show-topology | awk '/Audio System/{{f=1}} f && /Power Status/{{print $NF; exit}}'"
+# Switch the hifi on or off without holding up the update handler.
+def queue_hifi_power(ctx, chat_id, on):
+    global HIFI_CONFIRM_TASK
+    fut = cec_submit("power", on)
+    prev_id = LAST_BOT_ID.get(chat_id)
+    # A newer press decides the target state; drop the older confirmation.
+    if HIFI_CONFIRM_TASK is not None and not HIFI_CONFIRM_TASK.done():
+        HIFI_CONFIRM_TASK.cancel()
+    HIFI_CONFIRM_TASK = asyncio.get_running_loop().create_task(
+        confirm_hifi_power(ctx, chat_id, prev_id, fut, on)
     )
-    try:
-        res = subprocess.run(cmd, shell=True, check=False, capture_output=True, text=True)
-        if res.returncode != 0:
-            print(f"CEC FAIL rc={res.returncode} stderr={res.stderr.strip()}", flush=True)
-            return None
-        val = (res.stdout or "").strip()
-        if val in ("On", "Standby"):
-            return val
-        return None
-    except Exception as e:
-        print(f"CEC ERROR err={e}", flush=True)
-        return None
+
+# Report the power command, then poll with backoff until the hifi reaches the target state.
+async def confirm_hifi_power(ctx, chat_id, prev_id, fut, on):
+    label = "On" if on else "Off"
+    ok = await fut
+    await send_and_track(ctx, chat_id, f"🔌 Hifi {label}" if ok else f"⚠ Hifi {label} failed")
+    schedule_cleanup(ctx, chat_id, prev_id)
+    await update_list_message(ctx, chat_id)
+    if not ok:
+        return
+    want = "On" if on else "Standby"
+    start = CLOCK()
+    status = None
+    for delay in HIFI_CONFIRM_DELAYS:
+        await asyncio.sleep(delay)
+        if cec_monitor_healthy():
+            # The monitor stores the reply; only nudge the audio system to send one.
+            await request_hifi_power_report()
+            status = HIFI_STATUS
+        else:
+            status = await get_hifi_power_status()
+            set_hifi_status(status, "confirm")
+        if status == want:
+            break
+    log("HIFI CONFIRM", f"want={want} got={status} after={CLOCK() - start:.1f}s")
+    await update_now_playing_message(ctx, chat_id)
 
 # Send a Telegram message and track its message id.
 async def send_and_track(ctx, chat_id, text, **kwargs):
@@ -303,7 +1201,7 @@ async def send_and_track(ctx, chat_id, text, **kwargs):
         FIRST_BOT_ID[chat_id] = msg.message_id
     PREV_BOT_ID[chat_id] = LAST_BOT_ID.get(chat_id)
     LAST_BOT_ID[chat_id] = msg.message_id
-    print(f"BOT MSG chat_id={chat_id} message_id={msg.message_id}", flush=True)
+    log("BOT MSG", f"chat_id={chat_id} message_id={msg.message_id}", level=logging.DEBUG)
     return msg
 
 # Send the queue list and control panel messages.
@@ -312,8 +1210,7 @@ async def send_info_list_panel(ctx, chat_id):
         if not QUEUE:
             out = "Queue empty."
         else:
-            lines = [format_item_line(i, it) for i, it in enumerate(QUEUE)]
-            out = "\n".join(lines)
+            out = "\n".join(queue_list_lines(TG_MAX_TEXT))
     list_msg = await send_and_track(ctx, chat_id, out, parse_mode="HTML")
     LIST_MSG_ID[chat_id] = list_msg.message_id
     panel_msg = await send_and_track(ctx, chat_id, "🎛 Kodi Remote - Current track:", reply_markup=control_panel())
@@ -329,13 +1226,43 @@ def format_item_line(i, it):
         return f"{mark}{i+1}. <a href=\"{safe_link}\">{title}</a>"
     return f"{mark}{i+1}. {title}"
 
-# Build the full queue list text for display.
+# Queue lines that fit one Telegram message: a few before the current track, then upcoming; call with LOCK held.
+def queue_list_lines(budget):
+    n = len(QUEUE)
+    anchor = DISPLAY_INDEX if DISPLAY_INDEX is not None else NEXT_INDEX
+    start = max(0, min(anchor, n - 1) - LIST_CONTEXT_BEFORE)
+    # Leave room for the "… N earlier" / "… N more" markers.
+    budget -= 40
+    lines = []
+    end = start
+    while end < n:
+        line = format_item_line(end, QUEUE[end])
+        if len(line) + 1 > budget:
+            break
+        lines.append(line)
+        budget -= len(line) + 1
+        end += 1
+    # Near the end of the queue, use the rest of the space for earlier tracks.
+    while start > 0 and end == n:
+        line = format_item_line(start - 1, QUEUE[start - 1])
+        if len(line) + 1 > budget:
+            break
+        lines.insert(0, line)
+        budget -= len(line) + 1
+        start -= 1
+    if start > 0:
+        lines.insert(0, f"… {start} earlier")
+    if end < n:
+        lines.append(f"… {n - end} more")
+    return lines
+
+# Build the queue list text for display, trimmed to one Telegram message.
 def build_list_text():
+    header = "🎵 Playlist:\n\n"
     with LOCK:
         if not QUEUE:
             return "Queue empty."
-        lines = [format_item_line(i, it) for i, it in enumerate(QUEUE)]
-        return "🎵 Playlist:\n\n" + "\n".join(lines)
+        return header + "\n".join(queue_list_lines(TG_MAX_TEXT - len(header)))
 
 # Update or create the queue list message.
 async def update_list_message(ctx, chat_id):
@@ -455,8 +1382,8 @@ def fetch_library_item(item_type, item_id):
             item_id,
             ["title", "year", "originaltitle", "uniqueid", "imdbnumber"],
         )
-        if DEBUG_WS and res.get("error"):
-            print(f"LIB FETCH movie error={res.get('error')} id={item_id}", flush=True)
+        if res.get("error"):
+            log("LIB FETCH", f"movie error={res.get('error')} id={item_id}", level=logging.DEBUG)
         return (res.get("result", {}) or {}).get("moviedetails", {}) or {}
     if itype == "episode":
         res = kodi_call_with_props(
@@ -465,8 +1392,8 @@ def fetch_library_item(item_type, item_id):
             item_id,
             ["title", "showtitle", "season", "episode", "uniqueid", "imdbnumber"],
         )
-        if DEBUG_WS and res.get("error"):
-            print(f"LIB FETCH episode error={res.get('error')} id={item_id}", flush=True)
+        if res.get("error"):
+            log("LIB FETCH", f"episode error={res.get('error')} id={item_id}", level=logging.DEBUG)
         return (res.get("result", {}) or {}).get("episodedetails", {}) or {}
     if itype == "tvshow":
         res = kodi_call_with_props(
@@ -475,11 +1402,12 @@ def fetch_library_item(item_type, item_id):
             item_id,
             ["title", "year", "uniqueid", "imdbnumber"],
         )
-        if DEBUG_WS and res.get("error"):
-            print(f"LIB FETCH tvshow error={res.get('error')} id={item_id}", flush=True)
+        if res.get("error"):
+            log("LIB FETCH", f"tvshow error={res.get('error')} id={item_id}", level=logging.DEBUG)
         return (res.get("result", {}) or {}).get("tvshowdetails", {}) or {}
     return {}
 
+@functools.lru_cache(maxsize=256)
 def extract_youtube_id(url):
     if not url:
         return ""
@@ -492,17 +1420,17 @@ def extract_youtube_id(url):
         return ""
     qs = parse_qs(parsed.query)
     vid_param = (qs.get("video_id") or [""])[0]
-    if vid_param and re.match(r"^[A-Za-z0-9_-]{11}$", vid_param):
+    if vid_param and YT_ID.match(vid_param):
         return vid_param
     file_param = (qs.get("file") or [""])[0]
     if file_param:
         base = file_param.split("/")[-1]
         if "." in base:
             base = base.split(".", 1)[0]
-        if re.match(r"^[A-Za-z0-9_-]{11}$", base):
+        if YT_ID.match(base):
             return base
     for part in parsed.path.split("/"):
-        if re.match(r"^[A-Za-z0-9_-]{11}$", part):
+        if YT_ID.match(part):
             return part
     return ""
 
@@ -534,6 +1462,7 @@ def guess_soundcloud_link(artist, title):
         return ""
     return f"https://soundcloud.com/{a}/{t}"
 
+@functools.lru_cache(maxsize=256)
 def extract_soundcloud_url(file_url):
     if not file_url:
         return ""
@@ -543,7 +1472,7 @@ def extract_soundcloud_url(file_url):
             qs = parse_qs(parsed.query)
             raw = (qs.get("url") or [""])[0]
             if raw:
-                clean = re.sub(r"\?.*$", "", unquote(raw))
+                clean = SC_QUERY.sub("", unquote(raw))
                 if SC.match(clean):
                     return clean
                 return unquote(raw)
@@ -553,7 +1482,7 @@ def extract_soundcloud_url(file_url):
 
 def read_soundcloud_client_id():
     global SC_CLIENT_ID_CACHE, SC_CLIENT_ID_TS
-    now = time.time()
+    now = CLOCK()
     if SC_CLIENT_ID_CACHE and now - SC_CLIENT_ID_TS < 300:
         return SC_CLIENT_ID_CACHE
     env_id = os.environ.get("SC_CLIENT_ID")
@@ -576,12 +1505,9 @@ def read_soundcloud_client_id():
 def extract_soundcloud_track_id(text):
     if not text:
         return ""
-    m = re.search(r"soundcloud:tracks:(\d+)", text)
+    m = SC_TRACK_ID.search(text)
     if m:
-        return m.group(1)
-    m = re.search(r"/tracks/(\d+)", text)
-    if m:
-        return m.group(1)
+        return m.group(1) or m.group(2)
     return ""
 
 def get_cached_soundcloud_permalink(track_id):
@@ -589,17 +1515,20 @@ def get_cached_soundcloud_permalink(track_id):
         return ""
     hit = SC_PERMALINK_CACHE.get(track_id)
     if not hit:
+        metrics_inc("cache_lookups_total", ("sc_permalink", "miss"))
         return ""
     url, ts = hit
-    if time.time() - ts > SC_PERMALINK_TTL:
+    if CLOCK() - ts > SC_PERMALINK_TTL:
         SC_PERMALINK_CACHE.pop(track_id, None)
+        metrics_inc("cache_lookups_total", ("sc_permalink", "expired"))
         return ""
+    metrics_inc("cache_lookups_total", ("sc_permalink", "hit"))
     return url
 
 def cache_soundcloud_permalink(track_id, url):
     if not track_id or not url:
         return
-    SC_PERMALINK_CACHE[track_id] = (url, time.time())
+    SC_PERMALINK_CACHE[track_id] = (url, CLOCK())
 
 def fetch_soundcloud_permalink(track_id):
     if not track_id:
@@ -623,6 +1552,186 @@ def fetch_soundcloud_permalink(track_id):
     except Exception as e:
         return ""
 
+# Work out when a signed stream URL stops being valid.
+def stream_url_expiry(url):
+    try:
+        qs = parse_qs(urlparse(url).query)
+    except Exception:
+        qs = {}
+    expires = (qs.get("Expires") or [""])[0]
+    if expires.isdigit():
+        return float(expires)
+    policy = (qs.get("Policy") or [""])[0]
+    if policy:
+        # CloudFront policies use a URL-safe base64 variant.
+        raw = policy.replace("-", "+").replace("_", "=").replace("~", "/")
+        try:
+            doc = json.loads(base64.b64decode(raw + "=" * (-len(raw) % 4)))
+            cond = doc["Statement"][0]["Condition"]["DateLessThan"]
+            return float(cond["AWS:EpochTime"])
+        except Exception:
+            pass
+    return CLOCK() + STREAM_DEFAULT_TTL
+
+# Resolve a SoundCloud permalink to a directly playable stream URL.
+def resolve_soundcloud_stream_url(link):
+    if not link:
+        return ""
+    client_id = read_soundcloud_client_id()
+    if not client_id:
+        return ""
+    try:
+        resp = requests.get(
+            "https://api-v2.soundcloud.com/resolve",
+            params={"url": link, "client_id": client_id},
+            timeout=6,
+        )
+        if not resp.ok:
+            return ""
+        data = resp.json() or {}
+        transcodings = (data.get("media") or {}).get("transcodings") or []
+        picked = None
+        for proto in ("progressive", "hls"):
+            for t in transcodings:
+                if (t.get("format") or {}).get("protocol") == proto and t.get("url"):
+                    picked = t
+                    break
+            if picked:
+                break
+        if not picked:
+            return ""
+        params = {"client_id": client_id}
+        if data.get("track_authorization"):
+            params["track_authorization"] = data["track_authorization"]
+        resp = requests.get(picked["url"], params=params, timeout=6)
+        if not resp.ok:
+            return ""
+        return (resp.json() or {}).get("url") or ""
+    except Exception:
+        return ""
+
+# Resolve a SoundCloud permalink to a stream URL with yt-dlp.
+def resolve_soundcloud_stream_url_ytdlp(link):
+    ydl_opts = {
+        "quiet": True,
+        "skip_download": True,
+        "format": "bestaudio[protocol=https]/bestaudio[protocol=http]/bestaudio/best",
+    }
+    try:
+        with load_yt_dlp().YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(link, download=False)
+    except Exception:
+        return ""
+    return (info or {}).get("url") or ""
+
+# Resolve a playable stream for a SoundCloud link, trying the API before yt-dlp.
+# Blocks on network and the extraction pool: call it from I/O threads only.
+def resolve_soundcloud_stream(link):
+    url = resolve_soundcloud_stream_url(link)
+    source = "api"
+    if not url and SC_DIRECT_STREAM:
+        try:
+            url = run_extract_job_blocking("sc_stream", link, timeout=30)
+        except Exception as e:
+            log("SC STREAM", f"yt-dlp failed link={link} err={e}", level=logging.WARNING)
+            url = ""
+        source = "yt-dlp"
+    if url:
+        cache_stream_url(link, url)
+        log("SC STREAM", f"resolved source={source} link={link}")
+    return url
+
+# Return a cached stream URL for a permalink if it is still valid.
+def get_cached_stream_url(link):
+    if not link:
+        return ""
+    with LOCK:
+        hit = STREAM_CACHE.get(link)
+        if not hit:
+            return ""
+        url, expires = hit
+        if expires - CLOCK() < STREAM_EXPIRY_MARGIN:
+            STREAM_CACHE.pop(link, None)
+            return ""
+    return url
+
+# Store a resolved stream URL with its expiry; the cache is shared by I/O threads and the loop.
+def cache_stream_url(link, url):
+    if not link or not url:
+        return
+    expires = stream_url_expiry(url)
+    with LOCK:
+        STREAM_CACHE[link] = (url, expires)
+
+# Return the queue item autoplay will start next, if any.
+def peek_next_queue_item():
+    with LOCK:
+        if not QUEUE:
+            return None
+        if REPEAT_MODE == "one" and DISPLAY_INDEX is not None:
+            i = DISPLAY_INDEX
+        else:
+            i = NEXT_INDEX
+        if i >= len(QUEUE) and REPEAT_MODE == "all":
+            i = 0
+        if 0 <= i < len(QUEUE):
+            return QUEUE[i]
+    return None
+
+# Resolve the next SoundCloud item's stream in the background while the current one plays.
+def maybe_prefetch_next_stream():
+    if not (STREAM_PREFETCH or SC_DIRECT_STREAM):
+        return
+    item = peek_next_queue_item()
+    if not item or item.get("kind") != "audio":
+        return
+    link = item.get("link") or ""
+    if not link or get_cached_stream_url(link):
+        return
+    # Check and claim in one step so two callers never resolve the same link.
+    with LOCK:
+        if link in STREAM_PREFETCH_INFLIGHT:
+            return
+        if CLOCK() - STREAM_PREFETCH_FAILED.get(link, 0.0) < STREAM_PREFETCH_RETRY_SEC:
+            return
+        STREAM_PREFETCH_INFLIGHT.add(link)
+
+    def _run():
+        try:
+            url = resolve_soundcloud_stream(link)
+            with LOCK:
+                if url:
+                    STREAM_PREFETCH_FAILED.pop(link, None)
+                else:
+                    STREAM_PREFETCH_FAILED[link] = CLOCK()
+            if url:
+                log("PREFETCH", f"ok link={link} ttl={stream_url_expiry(url) - CLOCK():.0f}s")
+            else:
+                log("PREFETCH", f"failed link={link}", level=logging.WARNING)
+        finally:
+            with LOCK:
+                STREAM_PREFETCH_INFLIGHT.discard(link)
+    submit_io(_run)
+
+# Remember when a track transition started so the gap can be logged.
+def begin_transition(direct):
+    global TRANSITION_TS, TRANSITION_DIRECT
+    if WS_STATE == "stopped" and WS_LAST_EVENT_TS:
+        TRANSITION_TS = WS_LAST_EVENT_TS
+    else:
+        TRANSITION_TS = CLOCK()
+    TRANSITION_DIRECT = direct
+
+# Log the time from the previous track ending (or the user's request) to audio start.
+def finish_transition():
+    global TRANSITION_TS
+    if not TRANSITION_TS:
+        return
+    gap = CLOCK() - TRANSITION_TS
+    TRANSITION_TS = 0.0
+    metrics_observe("track_gap_seconds", (TRANSITION_DIRECT,), gap)
+    log("TRACK GAP", f"gap={gap:.2f}s direct={TRANSITION_DIRECT}")
+
 def maybe_cache_soundcloud_url(file_url):
     global LAST_WS_SC_URL
     sc_url = extract_soundcloud_url(file_url)
@@ -694,7 +1803,7 @@ def resolve_soundcloud_link_from_kodi():
 
 def schedule_soundcloud_permalink_probe(timeout_s=2.0, interval_s=0.2):
     global LAST_WS_SC_PROBE_TS, LAST_WS_SC_PROBE_ACTIVE, LAST_WS_SC_URL, LAST_WS_SC_TRACK_ID
-    now = time.time()
+    now = CLOCK()
     if LAST_WS_SC_PROBE_ACTIVE and now - LAST_WS_SC_PROBE_TS < timeout_s:
         return
     LAST_WS_SC_PROBE_TS = now
@@ -702,8 +1811,8 @@ def schedule_soundcloud_permalink_probe(timeout_s=2.0, interval_s=0.2):
 
     def _run():
         global LAST_WS_SC_PROBE_ACTIVE, LAST_WS_SC_URL
-        end = time.time() + timeout_s
-        while time.time() < end:
+        end = CLOCK() + timeout_s
+        while CLOCK() < end:
             try:
                 pid = get_active_playerid()
                 if pid is None:
@@ -730,13 +1839,44 @@ def schedule_soundcloud_permalink_probe(timeout_s=2.0, interval_s=0.2):
             time.sleep(interval_s)
         LAST_WS_SC_PROBE_ACTIVE = False
 
-    threading.Thread(target=_run, daemon=True).start()
+    submit_io(_run)
+
+# Derive the public link for a playing file from its URL and ids alone.
+# Returns (link, is_sndcdn_stream, soundcloud_track_id, imdb_link); memoized per playing item.
+@functools.lru_cache(maxsize=64)
+def resolve_file_link(file_url, imdbnumber="", imdb_id=""):
+    link = None
+    sndcdn = False
+    track_id = ""
+    yt_id = extract_youtube_id(file_url) if file_url else ""
+    if yt_id and (file_url.startswith("plugin://plugin.video.youtube/") or "/youtube/manifest/" in file_url):
+        link = f"https://youtu.be/{yt_id}"
+    sc_from_plugin = extract_soundcloud_url(file_url)
+    if sc_from_plugin:
+        link = sc_from_plugin
+    if file_url.startswith("http"):
+        link = file_url
+        if yt_id:
+            link = f"https://youtu.be/{yt_id}"
+        elif "sndcdn" in file_url:
+            # Bare SoundCloud CDN stream; the caller maps it back to a permalink.
+            link = None
+            sndcdn = True
+            track_id = extract_soundcloud_track_id(file_url)
+        elif "/youtube/manifest/" in file_url and ("127.0.0.1" in file_url or "localhost" in file_url):
+            link = None
+    imdb_link = ""
+    for cand in (imdbnumber, imdb_id):
+        if cand and IMDB_ID.match(cand):
+            imdb_link = f"https://www.imdb.com/title/{cand}/"
+            break
+    return link, sndcdn, track_id, imdb_link
 
 def external_item_display(item):
     global LAST_WS_SC_LOOKUP_TS, LAST_WS_SC_URL, LAST_WS_SC_TRACK_ID
     if not item:
         if DEBUG_WS:
-            print("EXT ITEM display: empty item", flush=True)
+            log("EXT ITEM", "display: empty item", level=logging.DEBUG)
         return None, None
     itype = (item.get("type") or "").lower()
     title = item.get("title") or ""
@@ -754,61 +1894,29 @@ def external_item_display(item):
     album = item.get("album") or ""
     channel = item.get("channel") or ""
 
-    link = None
-    # If Kodi gives a plugin youtube URL, derive a public link.
-    if not link and file_url.startswith("plugin://plugin.video.youtube/"):
-        yt_id = extract_youtube_id(file_url)
-        if yt_id:
-            link = f"https://youtu.be/{yt_id}"
-    # If Kodi gives a local youtube manifest URL, derive a public link.
-    yt_id_from_file = extract_youtube_id(file_url) if file_url else ""
-    if yt_id_from_file and "/youtube/manifest/" in file_url:
-        link = f"https://youtu.be/{yt_id_from_file}"
-    # If Kodi gives a plugin.video.youtube URL, derive a public link.
-    if not link and file_url.startswith("plugin://plugin.video.youtube/"):
-        yt_id = extract_youtube_id(file_url)
-        if yt_id:
-            link = f"https://youtu.be/{yt_id}"
-    sc_from_plugin = extract_soundcloud_url(file_url)
-    if sc_from_plugin:
-        link = sc_from_plugin
-    if file_url.startswith("http"):
-        link = file_url
-        yt_id = extract_youtube_id(link)
-        if yt_id:
-            link = f"https://youtu.be/{yt_id}"
-        elif "sndcdn" in link:
-            track_id = extract_soundcloud_track_id(file_url)
-            if LAST_WS_SC_URL and LAST_WS_SC_TRACK_ID and track_id and track_id == LAST_WS_SC_TRACK_ID:
-                link = LAST_WS_SC_URL
+    link, sndcdn, track_id, imdb_link = resolve_file_link(file_url, imdbnumber, imdb_id)
+    if sndcdn:
+        if LAST_WS_SC_URL and LAST_WS_SC_TRACK_ID and track_id and track_id == LAST_WS_SC_TRACK_ID:
+            link = LAST_WS_SC_URL
+            return label or title or None, link
+        schedule_soundcloud_permalink_probe()
+        now = CLOCK()
+        if now - LAST_WS_SC_LOOKUP_TS > 2.0:
+            LAST_WS_SC_LOOKUP_TS = now
+            sc = resolve_soundcloud_link_from_kodi()
+            if sc:
+                LAST_WS_SC_URL = sc
+                link = sc
                 return label or title or None, link
-            schedule_soundcloud_permalink_probe()
-            now = time.time()
-            if now - LAST_WS_SC_LOOKUP_TS > 2.0:
-                LAST_WS_SC_LOOKUP_TS = now
-                sc = resolve_soundcloud_link_from_kodi()
-                if sc:
-                    LAST_WS_SC_URL = sc
-                    link = sc
-                    return label or title or None, link
-            sc_link = guess_soundcloud_link(artist, title)
-            link = sc_link or None
-        elif "/youtube/manifest/" in link and ("127.0.0.1" in link or "localhost" in link):
-            # If we can extract a video id, prefer the public link instead of hiding.
-            yt_id = extract_youtube_id(link)
-            if yt_id:
-                link = f"https://youtu.be/{yt_id}"
-            else:
-                link = None
+        sc_link = guess_soundcloud_link(artist, title)
+        link = sc_link or None
     if not link and itype in ("video", "movie") and LAST_WS_YT_ID:
         if "youtube" in (file_url or "") or "manifest" in (file_url or "") or "youtube" in (LAST_WS_PLAYING_FILE or ""):
             link = f"https://youtu.be/{LAST_WS_YT_ID}"
     if link and ("youtu" in link or "soundcloud" in link):
         pass
-    elif imdbnumber and re.match(r"^tt\d+$", imdbnumber):
-        link = f"https://www.imdb.com/title/{imdbnumber}/"
-    elif imdb_id and re.match(r"^tt\d+$", imdb_id):
-        link = f"https://www.imdb.com/title/{imdb_id}/"
+    elif imdb_link:
+        link = imdb_link
     elif itype in ("movie", "episode", "tvshow"):
         q = showtitle or title or label
         if q:
@@ -839,19 +1947,127 @@ def kodi_item_matches_queue(item, qitem):
     q_url = qitem.get("url") or ""
     if item_file and q_url and item_file == q_url:
         return True
+    keys = qitem.get("keys") or queue_match_keys(qitem)
     # SoundCloud: match by track slug even if the artist differs.
-    q_link = qitem.get("link") or ""
-    if q_link and "soundcloud.com" in q_link:
-        item_title = item.get("title") or item.get("label") or ""
-        q_slug = soundcloud_track_slug_from_url(q_link)
-        t_slug = soundcloud_slug(item_title)
-        if q_slug and t_slug and (q_slug == t_slug or q_slug in t_slug or t_slug in q_slug):
+    q_slug = keys["slug"]
+    if q_slug:
+        t_slug = soundcloud_slug(item.get("title") or item.get("label") or "")
+        if t_slug and (q_slug == t_slug or q_slug in t_slug or t_slug in q_slug):
             return True
     item_name = normalize_title(kodi_item_name(item))
-    q_title = normalize_title(qitem.get("title") or "")
+    q_title = keys["norm"]
     if not item_name or not q_title:
         return False
     return item_name in q_title or q_title in item_name
+
+# Match keys for a queue item; computed once when the item is created.
+def queue_match_keys(item):
+    url = item.get("url") or ""
+    link = item.get("link") or ""
+    slug = soundcloud_track_slug_from_url(link) if "soundcloud.com" in link else ""
+    index = []
+    if url:
+        index.append(f"url:{url}")
+        if url.startswith("plugin://plugin.video.youtube/"):
+            yt_id = extract_youtube_id(url)
+            if yt_id:
+                index.append(f"yt:{yt_id}")
+    if slug:
+        index.append(f"slug:{slug}")
+    return {"norm": normalize_title(item.get("title") or ""), "slug": slug, "index": index}
+
+# Index keys for a Kodi player item, in order of confidence.
+def kodi_item_keys(item):
+    keys = []
+    file_url = item.get("file") or ""
+    if file_url:
+        keys.append(f"url:{file_url}")
+        if "youtube" in file_url:
+            yt_id = extract_youtube_id(file_url)
+            if yt_id:
+                keys.append(f"yt:{yt_id}")
+        sc_slug = soundcloud_track_slug_from_url(extract_soundcloud_url(file_url))
+        if sc_slug:
+            keys.append(f"slug:{sc_slug}")
+    t_slug = soundcloud_slug(item.get("title") or item.get("label") or "")
+    if t_slug:
+        keys.append(f"slug:{t_slug}")
+    return keys
+
+# Give appended items increasing sequence numbers and index their match keys; call with LOCK held.
+def index_queue_items(items):
+    global QUEUE_SEQ
+    for item in items:
+        QUEUE_SEQ += 1
+        item["seq"] = QUEUE_SEQ
+        if "keys" not in item:
+            item["keys"] = queue_match_keys(item)
+        for key in item["keys"]["index"]:
+            QUEUE_KEYS.setdefault(key, []).append(item)
+
+# Drop one removed item from the match index; call with LOCK held.
+def unindex_queue_item(item):
+    for key in item["keys"]["index"]:
+        rest = [it for it in QUEUE_KEYS.get(key, ()) if it is not item]
+        if rest:
+            QUEUE_KEYS[key] = rest
+        else:
+            QUEUE_KEYS.pop(key, None)
+
+# Current position of a queued item: QUEUE stays sorted by seq, so deletes need no renumbering; call with LOCK held.
+def queue_position(item):
+    return bisect.bisect_left(QUEUE, item["seq"], key=lambda it: it["seq"])
+
+# Queue position for a set of Kodi item keys, preferring the shown and upcoming entries; call with LOCK held.
+def find_queue_index(keys):
+    for key in keys:
+        found = QUEUE_KEYS.get(key)
+        if not found:
+            continue
+        positions = [queue_position(it) for it in found]
+        if DISPLAY_INDEX in positions:
+            return DISPLAY_INDEX
+        upcoming = [p for p in positions if p >= NEXT_INDEX]
+        return min(upcoming) if upcoming else positions[0]
+    return None
+
+# The shown queue entry if the Kodi item is it; read-only, for rendering.
+def displayed_queue_item(item):
+    if not item:
+        return None
+    with LOCK:
+        if DISPLAY_INDEX is not None and 0 <= DISPLAY_INDEX < len(QUEUE):
+            qitem = QUEUE[DISPLAY_INDEX]
+        else:
+            qitem = None
+    if qitem and kodi_item_matches_queue(item, qitem):
+        return qitem
+    return None
+
+# Match a Kodi player item against the shown track, then the whole queue; re-sync DISPLAY_INDEX on a hit.
+# Only the WS OnPlay handler calls this; it leaves AUTOPLAY_ENABLED as the user set it.
+def match_queue_item(item):
+    global CURRENT_INDEX, DISPLAY_INDEX, NEXT_INDEX, EXTERNAL_PLAYBACK
+    if not item:
+        return None
+    keys = kodi_item_keys(item)
+    with LOCK:
+        if DISPLAY_INDEX is not None and 0 <= DISPLAY_INDEX < len(QUEUE):
+            qitem = QUEUE[DISPLAY_INDEX]
+            if kodi_item_matches_queue(item, qitem):
+                return qitem
+        i = find_queue_index(keys)
+        if i is None:
+            return None
+        qitem = QUEUE[i]
+        CURRENT_INDEX = i
+        DISPLAY_INDEX = i
+        NEXT_INDEX = i + 1
+        EXTERNAL_PLAYBACK = False
+        RESUME_ATTEMPTS.clear()
+    log("QUEUE RESYNC", f"index={i} title={qitem.get('title')}")
+    mark_list_dirty()
+    return qitem
 # Assemble the now-playing display text.
 def get_now_playing_text():
     global LAST_PROGRESS_TS, LAST_PROGRESS_TIME, LAST_PROGRESS_TOTAL, LAST_PROGRESS_INDEX, EXTERNAL_PLAYBACK
@@ -914,7 +2130,7 @@ def get_now_playing_text():
         ws_type = LAST_WS_ITEM.get("type")
         ws_title = LAST_WS_ITEM.get("title")
         if DEBUG_WS:
-            print(f"EXT ITEM fallback ws_id={ws_id} ws_type={ws_type} ws_title={ws_title}", flush=True)
+            log("EXT ITEM", f"fallback ws_id={ws_id} ws_type={ws_type} ws_title={ws_title}", level=logging.DEBUG)
         if ws_id is not None and ws_type:
             lib_item = fetch_library_item(ws_type, ws_id)
             if lib_item:
@@ -927,12 +2143,8 @@ def get_now_playing_text():
             item = {"type": ws_type, "title": ws_title}
 
         # If the current item matches the queue, prefer the queue link/title.
-        with LOCK:
-            if DISPLAY_INDEX is not None and 0 <= DISPLAY_INDEX < len(QUEUE):
-                qitem = QUEUE[DISPLAY_INDEX]
-            else:
-                qitem = None
-        if qitem and kodi_item_matches_queue(item, qitem):
+        qitem = displayed_queue_item(item)
+        if qitem:
             EXTERNAL_PLAYBACK = False
             name = qitem.get("title") or None
             link = qitem.get("link")
@@ -940,12 +2152,12 @@ def get_now_playing_text():
             name, link = external_item_display(item)
         if not name:
             if DEBUG_WS:
-                print(f"EXT ITEM unknown item={item}", flush=True)
+                log("EXT ITEM", f"unknown item={item}", level=logging.DEBUG)
             name = "Unknown"
 
     cur = format_kodi_time(props.get("time"))
     total = format_kodi_time(props.get("totaltime"))
-    LAST_PROGRESS_TS = time.time()
+    LAST_PROGRESS_TS = CLOCK()
     LAST_PROGRESS_TIME = props.get("time")
     LAST_PROGRESS_TOTAL = props.get("totaltime")
     LAST_PROGRESS_INDEX = DISPLAY_INDEX
@@ -983,19 +2195,440 @@ async def update_now_playing_message(ctx, chat_id):
     except Exception:
         pass
 
-# Refresh cached hifi power status with throttling.
-async def refresh_hifi_status_cache(force=False):
-    global HIFI_STATUS_CACHE, HIFI_STATUS_TS
-    now = time.time()
-    if not force and now - HIFI_STATUS_TS < 300:
+# Store a hifi power state ("On"/"Standby"); returns True when the panel text changed.
+def set_hifi_status(status, source):
+    global HIFI_STATUS_CACHE, HIFI_STATUS_TS, HIFI_STATUS
+    if status == "On":
+        text = "🟢 Hifi: On"
+    elif status == "Standby":
+        text = "🔴 Hifi: Standby"
+    else:
+        return False
+    HIFI_STATUS_TS = CLOCK()
+    HIFI_STATUS = status
+    if text == HIFI_STATUS_CACHE:
+        return False
+    HIFI_STATUS_CACHE = text
+    log("HIFI STATUS", f"{status} source={source}")
+    return True
+
+# Refresh cached hifi power status with throttling; the topology scan is a fallback for the monitor.
+async def refresh_hifi_status_cache(force=False):
+    global HIFI_STATUS_TS
+    now = CLOCK()
+    if cec_monitor_healthy() and HIFI_STATUS_TS:
+        return
+    if not force and now - HIFI_STATUS_TS < 300:
+        return
+    status = await get_hifi_power_status()
+    set_hifi_status(status, "topology")
+    # If unknown/None, keep previous value but still advance timestamp
+    HIFI_STATUS_TS = now
+
+# Build a predicate matching a Kodi notification by method and optional ids.
+def ws_event_matcher(method, playerid=None, playlistid=None):
+    def _match(msg):
+        if msg.get("method") != method:
+            return False
+        data = (msg.get("params", {}) or {}).get("data", {}) or {}
+        if playerid is not None and (data.get("player", {}) or {}).get("playerid") != playerid:
+            return False
+        if playlistid is not None and data.get("playlistid") != playlistid:
+            return False
+        return True
+    return _match
+
+# Register a waiter for a Kodi notification; events newer than `since` count too.
+# A waiter with a key is cancelled when supersede_io(key) starts a newer task.
+def subscribe_ws_event(predicate, since=None, key=None):
+    fut = concurrent.futures.Future()
+    with WS_WAITERS_LOCK:
+        if since is not None:
+            for ts, msg in WS_RECENT_EVENTS:
+                if ts >= since and predicate(msg):
+                    fut.set_result(msg)
+                    return fut
+        WS_WAITERS.append((predicate, fut, key))
+    return fut
+
+def unsubscribe_ws_event(fut):
+    with WS_WAITERS_LOCK:
+        WS_WAITERS[:] = [w for w in WS_WAITERS if w[1] is not fut]
+
+# Resolve waiters whose predicate matches an incoming notification.
+def dispatch_ws_event(msg):
+    with WS_WAITERS_LOCK:
+        WS_RECENT_EVENTS.append((CLOCK(), msg))
+        matched = []
+        for w in WS_WAITERS:
+            try:
+                if w[0](msg):
+                    matched.append(w)
+            except Exception:
+                pass
+        if matched:
+            WS_WAITERS[:] = [w for w in WS_WAITERS if w not in matched]
+    for _, fut, _ in matched:
+        if not fut.done():
+            fut.set_result(msg)
+
+# Release all waiters with None so they fall back to polling.
+def fail_ws_waiters():
+    with WS_WAITERS_LOCK:
+        waiters = list(WS_WAITERS)
+        WS_WAITERS.clear()
+    for _, fut, _ in waiters:
+        if not fut.done():
+            fut.set_result(None)
+
+# Cancel waiters of a superseded task so its I/O thread is released at once.
+def cancel_ws_waiters(key):
+    with WS_WAITERS_LOCK:
+        stale = [w for w in WS_WAITERS if w[2] == key]
+        if stale:
+            WS_WAITERS[:] = [w for w in WS_WAITERS if w[2] != key]
+    # Removed under the lock, so dispatch can no longer resolve them.
+    for _, fut, _ in stale:
+        fut.cancel()
+
+# Block until a matching notification arrives; None on timeout, if the socket is down,
+# or once the keyed task owning `token` is superseded.
+def wait_for_ws_event(predicate, timeout, since=None, key=None, token=None):
+    if not WS_CONNECTED:
+        return None
+    fut = subscribe_ws_event(predicate, since=since, key=key)
+    try:
+        # supersede_io bumps the generation before cancelling, so this closes the gap.
+        if key is not None and not io_current(key, token):
+            return None
+        return fut.result(timeout=max(timeout, 0))
+    except (concurrent.futures.TimeoutError, concurrent.futures.CancelledError):
+        return None
+    finally:
+        unsubscribe_ws_event(fut)
+
+# Await a matching notification from the event loop; None on timeout or if the socket is down.
+async def wait_for_ws_event_async(predicate, timeout, since=None):
+    if not WS_CONNECTED:
+        return None
+    fut = subscribe_ws_event(predicate, since=since)
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(fut), max(timeout, 0))
+    except asyncio.TimeoutError:
+        return None
+    finally:
+        unsubscribe_ws_event(fut)
+
+# Convert seconds into a Kodi time dict.
+def seconds_to_kodi_time(sec):
+    sec = max(float(sec), 0.0)
+    whole = int(sec)
+    return {
+        "hours": whole // 3600,
+        "minutes": (whole % 3600) // 60,
+        "seconds": whole % 60,
+        "milliseconds": int((sec - whole) * 1000),
+    }
+
+# Load checkpoints left by the previous run, keeping only ones recent enough to restore.
+def load_checkpoints():
+    if not CHECKPOINT_FILE:
+        return
+    try:
+        with open(CHECKPOINT_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return
+    except Exception as e:
+        log("CHECKPOINT", f"load failed file={CHECKPOINT_FILE} err={e}", level=logging.WARNING)
+        return
+    cutoff = CLOCK() - CHECKPOINT_RESTORE_SEC
+    with CHECKPOINTS_LOCK:
+        for key, cp in (data if isinstance(data, dict) else {}).items():
+            if isinstance(cp, dict) and cp.get("t") is not None and cp.get("url") and cp.get("ts", 0) >= cutoff:
+                CHECKPOINTS[key] = cp
+        count = len(CHECKPOINTS)
+    log("CHECKPOINT", f"loaded entries={count} file={CHECKPOINT_FILE}")
+
+# Write changed checkpoints to disk in one atomic replace.
+def flush_checkpoints():
+    global CHECKPOINT_DIRTY, CHECKPOINT_FLUSH_TS
+    with CHECKPOINTS_LOCK:
+        if not CHECKPOINT_DIRTY:
+            return
+        CHECKPOINT_DIRTY = False
+        if len(CHECKPOINTS) > CHECKPOINT_MAX_ENTRIES:
+            keep = sorted(CHECKPOINTS.items(), key=lambda kv: kv[1].get("ts", 0), reverse=True)
+            CHECKPOINTS.clear()
+            CHECKPOINTS.update(keep[:CHECKPOINT_MAX_ENTRIES])
+        payload = json.dumps(CHECKPOINTS, separators=(",", ":"))
+    CHECKPOINT_FLUSH_TS = CLOCK()
+    if not CHECKPOINT_FILE:
+        return
+    tmp = f"{CHECKPOINT_FILE}.tmp"
+    try:
+        os.makedirs(os.path.dirname(CHECKPOINT_FILE) or ".", exist_ok=True)
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(payload)
+        os.replace(tmp, CHECKPOINT_FILE)
+    except Exception as e:
+        log("CHECKPOINT", f"write failed file={CHECKPOINT_FILE} err={e}", level=logging.ERROR)
+
+# Checkpoint key of a queued item: this run's session plus the entry's sequence number.
+def checkpoint_key(item):
+    seq = (item or {}).get("seq")
+    if not seq:
+        return None
+    return f"{CHECKPOINT_SESSION}:{seq}"
+
+# Saved checkpoint for a queue entry, if any.
+def get_checkpoint(item):
+    key = checkpoint_key(item)
+    if key is None:
+        return None
+    with CHECKPOINTS_LOCK:
+        cp = CHECKPOINTS.get(key)
+        return dict(cp) if cp else None
+
+# Record a playback position (seconds) for the live queue entry.
+def record_checkpoint(live, pos, total=None):
+    global CHECKPOINT_DIRTY
+    if pos is None or pos < CHECKPOINT_MIN_SEC:
+        return
+    cp = {"t": round(pos, 1), "ts": int(CLOCK())}
+    if total:
+        cp["d"] = int(total)
+    # Enough of the entry to queue it again after a restart.
+    cp.update(live["entry"])
+    with CHECKPOINTS_LOCK:
+        CHECKPOINTS[live["key"]] = cp
+        CHECKPOINT_DIRTY = True
+
+# Forget the checkpoint stored under a key.
+def clear_checkpoint(key):
+    global CHECKPOINT_DIRTY
+    with CHECKPOINTS_LOCK:
+        if CHECKPOINTS.pop(key, None) is not None:
+            CHECKPOINT_DIRTY = True
+
+# Seconds left after a checkpoint, if the duration is known.
+def checkpoint_remaining(cp):
+    if not cp or not cp.get("d"):
+        return None
+    return max(cp["d"] - cp["t"], 0)
+
+# Kodi time to resume a queue item at, or None to start from the top.
+def checkpoint_resume_time(item):
+    cp = get_checkpoint(item)
+    if not cp or cp["t"] < CHECKPOINT_MIN_SEC:
+        return None
+    remaining = checkpoint_remaining(cp)
+    if remaining is not None and remaining <= RESUME_MIN_REMAINING_SEC:
+        return None
+    return seconds_to_kodi_time(cp["t"])
+
+# Interpolated position of the live track in seconds.
+def checkpoint_live_position(live):
+    pos = live["pos"]
+    if live["playing"]:
+        pos += CLOCK() - live["ts"]
+    if live["total"]:
+        pos = min(pos, live["total"])
+    return pos
+
+# Start tracking the position of a queue item the bot is opening.
+def checkpoint_start(item, resume_time=None):
+    global CHECKPOINT_LIVE
+    key = checkpoint_key(item)
+    if key is None:
+        CHECKPOINT_LIVE = None
+        return
+    hold = kodi_time_seconds(resume_time)
+    CHECKPOINT_LIVE = {
+        "key": key,
+        "entry": {k: item.get(k) for k in ("title", "url", "kind", "link")},
+        "pos": float(hold or 0),
+        "total": None,
+        "ts": CLOCK(),
+        "playing": False,
+        "sync_ts": 0.0,
+        # Kodi reports the top of the track until the resume seek lands; keep the saved point.
+        "hold": hold,
+    }
+
+# Move the live position to a value reported by Kodi.
+def checkpoint_anchor(pos, total=None, playing=None):
+    live = CHECKPOINT_LIVE
+    if live is None or pos is None:
+        return
+    if total:
+        live["total"] = total
+    if live["hold"] and pos < live["hold"] - CHECKPOINT_MIN_SEC:
+        return
+    live["hold"] = None
+    live["pos"] = pos
+    live["ts"] = CLOCK()
+    if playing is not None:
+        live["playing"] = playing
+    record_checkpoint(live, pos, live["total"])
+
+# Stop the live clock at the interpolated position and record it.
+def checkpoint_freeze(live):
+    live["pos"] = checkpoint_live_position(live)
+    live["ts"] = CLOCK()
+    live["playing"] = False
+    if not live["hold"]:
+        record_checkpoint(live, live["pos"], live["total"])
+
+# Forget the live track's checkpoint when the user deliberately leaves it.
+def drop_live_checkpoint(keep=None):
+    global CHECKPOINT_LIVE
+    live = CHECKPOINT_LIVE
+    if live is None or (keep is not None and live["key"] == checkpoint_key(keep)):
+        return
+    CHECKPOINT_LIVE = None
+    clear_checkpoint(live["key"])
+
+# Queue entry the current playback belongs to, if any.
+def checkpoint_current_item():
+    with LOCK:
+        if EXTERNAL_PLAYBACK or DISPLAY_INDEX is None or not (0 <= DISPLAY_INDEX < len(QUEUE)):
+            return None
+        return QUEUE[DISPLAY_INDEX]
+
+# Feed a Kodi player notification into the live checkpoint.
+def checkpoint_on_ws_event(method, data):
+    global CHECKPOINT_LIVE, CHECKPOINT_FLUSH_TS
+    live = CHECKPOINT_LIVE
+    if method in ("Player.OnPlay", "Player.OnAVStart"):
+        item = checkpoint_current_item()
+        if item is None:
+            CHECKPOINT_LIVE = None
+            return
+        if live is None or live["key"] != checkpoint_key(item):
+            # Kodi advanced through the mirrored playlist; the previous track ran out.
+            if live is not None:
+                clear_checkpoint(live["key"])
+            checkpoint_start(item)
+            live = CHECKPOINT_LIVE
+        if method == "Player.OnAVStart":
+            live["ts"] = CLOCK()
+            live["playing"] = True
+            live["sync_ts"] = 0.0
+    elif live is None:
+        return
+    elif method == "Player.OnSeek":
+        checkpoint_anchor(kodi_time_seconds((data.get("player") or {}).get("time")))
+    elif method == "Player.OnPause":
+        checkpoint_freeze(live)
+        CHECKPOINT_FLUSH_TS = 0.0
+    elif method == "Player.OnResume":
+        live["ts"] = CLOCK()
+        live["playing"] = True
+    elif method == "Player.OnStop":
+        if data.get("end"):
+            clear_checkpoint(live["key"])
+            CHECKPOINT_LIVE = None
+        else:
+            checkpoint_freeze(live)
+        CHECKPOINT_FLUSH_TS = 0.0
+
+# Move the live checkpoint to the entry shown after an off-loop index resync.
+def checkpoint_follow_display():
+    checkpoint_on_ws_event("Player.OnPlay", {})
+    if WS_PLAYING and CHECKPOINT_LIVE is not None and not CHECKPOINT_LIVE["playing"]:
+        checkpoint_on_ws_event("Player.OnAVStart", {})
+
+# Re-anchor the live checkpoint from Kodi's reported position.
+def checkpoint_sync_position():
+    live = CHECKPOINT_LIVE
+    if live is None:
+        return
+    live["sync_ts"] = CLOCK()
+    pid = get_active_playerid()
+    if pid is None:
+        return
+    props = kodi_call(
+        "Player.GetProperties",
+        {"playerid": pid, "properties": ["time", "totaltime", "speed"]},
+    ).get("result", {})
+    if CHECKPOINT_LIVE is not live or not props:
+        return
+    checkpoint_anchor(
+        kodi_time_seconds(props.get("time")),
+        kodi_time_seconds(props.get("totaltime")),
+        playing=props.get("speed", 0) != 0,
+    )
+
+# Advance the live checkpoint every tick, re-anchor it now and then, and flush in batches.
+async def checkpoint_ticker():
+    while True:
+        await asyncio.sleep(CHECKPOINT_TICK_SEC)
+        try:
+            live = CHECKPOINT_LIVE
+            if live is not None and live["playing"] and WS_CONNECTED:
+                if CLOCK() - live["sync_ts"] >= CHECKPOINT_SYNC_SEC:
+                    await asyncio.to_thread(checkpoint_sync_position)
+                elif not live["hold"]:
+                    record_checkpoint(live, checkpoint_live_position(live), live["total"])
+            if CHECKPOINT_DIRTY and CLOCK() - CHECKPOINT_FLUSH_TS >= CHECKPOINT_FLUSH_SEC:
+                await asyncio.to_thread(flush_checkpoints)
+        except Exception as e:
+            log("CHECKPOINT", f"tick failed err={e}", level=logging.ERROR)
+
+# Queue the entry the previous run was interrupted in and resume it once Kodi is idle.
+async def restore_checkpoint_entry():
+    global CURRENT_INDEX, DISPLAY_INDEX, NEXT_INDEX, AUTOPLAY_ENABLED, CHECKPOINT_DIRTY
+    with CHECKPOINTS_LOCK:
+        old = [(k, cp) for k, cp in CHECKPOINTS.items() if not k.startswith(f"{CHECKPOINT_SESSION}:")]
+        for k, _ in old:
+            del CHECKPOINTS[k]
+        CHECKPOINT_DIRTY = CHECKPOINT_DIRTY or bool(old)
+    if not old:
         return
-    status = await asyncio.to_thread(get_hifi_power_status)
-    if status == "On":
-        HIFI_STATUS_CACHE = "🟢 Hifi: On"
-    elif status == "Standby":
-        HIFI_STATUS_CACHE = "🔴 Hifi: Standby"
-    # If unknown/None, keep previous value but still advance timestamp
-    HIFI_STATUS_TS = now
+    _, cp = max(old, key=lambda kv: kv[1].get("ts", 0))
+    item = make_item(cp.get("title") or cp["url"], cp["url"], cp.get("kind") or "video", cp.get("link"))
+    queue_items([item])
+    with CHECKPOINTS_LOCK:
+        CHECKPOINTS[checkpoint_key(item)] = cp
+    resume_time = checkpoint_resume_time(item)
+    log("CHECKPOINT", f"restored title={item['title']} t={cp['t']}")
+    start = CLOCK()
+    while not WS_CONNECTED and CLOCK() - start < CHECKPOINT_RESTORE_WAIT_SEC:
+        await asyncio.sleep(0.5)
+    if resume_time is None or not WS_CONNECTED or await asyncio.to_thread(get_active_playerid) is not None:
+        return
+    with LOCK:
+        i = queue_position(item)
+        if i >= len(QUEUE) or QUEUE[i] is not item or DISPLAY_INDEX is not None:
+            return
+        CURRENT_INDEX = i
+        DISPLAY_INDEX = i
+        NEXT_INDEX = i + 1
+        AUTOPLAY_ENABLED = True
+    mark_list_dirty()
+    await asyncio.to_thread(play_queue_item, i, item, resume_time)
+    autoplay_notify()
+
+# Reconcile bot indices with a track Kodi started; runs on an I/O thread since it queries Kodi.
+def follow_kodi_play(method, pid, expected):
+    shown = DISPLAY_INDEX
+    mirrored = False
+    if KODI_PLAYLIST_SYNC and method == "Player.OnPlay":
+        mirrored = kodi_mirror_track_position(pid)
+    if not expected and not mirrored:
+        item = None
+        if pid is not None:
+            item = kodi_call(
+                "Player.GetItem",
+                {"playerid": pid, "properties": ["title", "artist", "file"]},
+            ).get("result", {}).get("item", {})
+        if match_queue_item(item) is None:
+            clear_bot_playback_state()
+    if DISPLAY_INDEX != shown:
+        schedule_now_playing_refresh()
+        if MAIN_LOOP is not None:
+            MAIN_LOOP.call_soon_threadsafe(checkpoint_follow_display)
 
 # Listen for Kodi playback events via WebSocket.
 async def kodi_ws_listener():
@@ -1007,14 +2640,19 @@ async def kodi_ws_listener():
         try:
             async with websockets.connect(KODI_WS_URL, ping_interval=20, ping_timeout=20) as ws:
                 WS_CONNECTED = True
+                autoplay_notify()
                 async for raw in ws:
                     try:
                         msg = json.loads(raw)
                     except Exception:
                         continue
                     method = msg.get("method")
+                    if KODI_TRACE is not None and method:
+                        record_kodi_trace("ws", msg=msg)
                     if DEBUG_WS and method:
-                        print(f"WS EVENT method={method} msg={msg}", flush=True)
+                        log("WS EVENT", f"method={method} msg={msg}")
+                    if method:
+                        dispatch_ws_event(msg)
                     if method == "Other.playback_init":
                         data = msg.get("params", {}).get("data", {}) or {}
                         vid = data.get("video_id") or ""
@@ -1023,8 +2661,11 @@ async def kodi_ws_listener():
                             LAST_WS_YT_ID = vid
                         if playing_file:
                             LAST_WS_PLAYING_FILE = playing_file
+                    if method == "Player.OnAVStart":
+                        finish_transition()
+                        trace_first_audio()
                     if method in ("Player.OnPlay", "Player.OnAVStart"):
-                        now = time.time()
+                        now = CLOCK()
                         WS_PLAYING = True
                         WS_STATE = "playing"
                         WS_LAST_EVENT_TS = now
@@ -1039,59 +2680,58 @@ async def kodi_ws_listener():
                             for k in ("id", "type", "title"):
                                 if k in item_params:
                                     LAST_WS_ITEM[k] = item_params.get(k)
-                        if BOT_EXPECTING_WS > 0:
+                        expected = BOT_EXPECTING_WS > 0
+                        if expected:
                             BOT_EXPECTING_WS -= 1
                             if DEBUG_WS:
-                                print(
-                                    f"WS EXPECT dec method={method} remaining={BOT_EXPECTING_WS}",
-                                    flush=True,
-                                )
-                        else:
-                            player = data.get("player", {}) or {}
-                            pid = player.get("playerid")
-                            item = None
-                            if pid is not None:
-                                item = kodi_call(
-                                    "Player.GetItem",
-                                    {"playerid": pid, "properties": ["title", "artist", "file"]},
-                                ).get("result", {}).get("item", {})
-                            with LOCK:
-                                if DISPLAY_INDEX is not None and 0 <= DISPLAY_INDEX < len(QUEUE):
-                                    qitem = QUEUE[DISPLAY_INDEX]
-                                else:
-                                    qitem = None
-                            if not kodi_item_matches_queue(item, qitem):
-                                clear_bot_playback_state()
-                                schedule_now_playing_refresh()
+                                log("WS EXPECT", f"dec method={method} remaining={BOT_EXPECTING_WS}")
+                        if not expected or (KODI_PLAYLIST_SYNC and method == "Player.OnPlay"):
+                            # Asking Kodi what it started blocks; keep it off the event loop.
+                            submit_io(
+                                follow_kodi_play, method, player_params.get("playerid"), expected,
+                                key="ws_play", token=supersede_io("ws_play"),
+                            )
                         schedule_playback_refresh()
+                    elif method == "Playlist.OnAdd" and KODI_PLAYLIST_SYNC:
+                        if not take_expected_mirror_add():
+                            # Someone else edited the playlist; reconcile it with the queue.
+                            schedule_kodi_playlist_sync()
                     elif method == "Player.OnPause":
                         WS_PLAYING = False
                         WS_STATE = "paused"
-                        WS_LAST_EVENT_TS = time.time()
+                        WS_LAST_EVENT_TS = CLOCK()
                         schedule_now_playing_refresh()
                     elif method == "Player.OnResume":
                         WS_PLAYING = True
                         WS_STATE = "playing"
-                        WS_LAST_EVENT_TS = time.time()
+                        WS_LAST_EVENT_TS = CLOCK()
                         schedule_now_playing_refresh()
                     elif method == "Player.OnStop":
                         WS_PLAYING = False
                         WS_STATE = "stopped"
-                        WS_LAST_EVENT_TS = time.time()
+                        WS_LAST_EVENT_TS = CLOCK()
                         schedule_now_playing_refresh()
+                    if method and method.startswith("Player."):
+                        checkpoint_on_ws_event(method, msg.get("params", {}).get("data", {}) or {})
+                    if method:
+                        autoplay_notify()
         except Exception:
             WS_CONNECTED = False
             WS_STATE = "unknown"
+            metrics_inc("kodi_ws_reconnects_total")
+            fail_ws_waiters()
+            autoplay_notify()
             await asyncio.sleep(3)
 
 # Background task to refresh list and now-playing messages.
 async def list_refresher(ctx):
     last_np = 0.0
     last_hifi = 0.0
+    last_io = 0.0
     while True:
         if LIST_DIRTY:
             await update_list_message(ctx, STARTUP_CHAT_ID)
-        now = time.time()
+        now = CLOCK()
         if now - last_np >= 5:
             await update_now_playing_message(ctx, STARTUP_CHAT_ID)
             last_np = now
@@ -1099,6 +2739,15 @@ async def list_refresher(ctx):
             await refresh_hifi_status_cache(force=True)
             await update_now_playing_message(ctx, STARTUP_CHAT_ID)
             last_hifi = now
+        if now - last_io >= 60:
+            stats = io_executor_stats()
+            if stats["queued"] or stats["running"]:
+                log(
+                    "IO POOL",
+                    f"queued={stats['queued']} running={stats['running']} "
+                    f"threads={stats['threads']}/{stats['workers']} superseded={stats['superseded']}",
+                )
+            last_io = now
         await asyncio.sleep(2)
 
 # Ensure the startup panel is posted once.
@@ -1113,7 +2762,7 @@ def record_last_seen(ctx, update):
     msg = update.effective_message
     if msg:
         LAST_SEEN_ID[update.effective_chat.id] = msg.message_id
-        print(f"SEEN chat_id={update.effective_chat.id} message_id={msg.message_id}", flush=True)
+        log("SEEN", f"chat_id={update.effective_chat.id} message_id={msg.message_id}", level=logging.DEBUG)
 
 # Schedule deletion of recent messages after a delay.
 def schedule_cleanup(ctx, chat_id, prev_id):
@@ -1133,8 +2782,11 @@ def schedule_cleanup(ctx, chat_id, prev_id):
     else:
         prev_id = FIRST_BOT_ID.get(chat_id)
     end_id = max(x for x in [last_seen, last_bot] if x is not None)
-    print(f"SCHEDULE CLEANUP chat_id={chat_id} prev_id={prev_id} end_id={end_id} inclusive={start_inclusive} last_cleanup={LAST_CLEANUP_ID.get(chat_id)}", flush=True)
+    log("SCHEDULE CLEANUP", f"chat_id={chat_id} prev_id={prev_id} end_id={end_id} inclusive={start_inclusive} last_cleanup={LAST_CLEANUP_ID.get(chat_id)}", level=logging.DEBUG)
     if hasattr(ctx, "application"):
+        if not ctx.application.running:
+            # Shutting down; the delayed cleanup would never be awaited.
+            return
         ctx.application.create_task(_cleanup_after_delay(ctx, chat_id, prev_id, end_id, start_inclusive))
     elif MAIN_LOOP is not None:
         asyncio.run_coroutine_threadsafe(
@@ -1146,12 +2798,12 @@ def schedule_cleanup(ctx, chat_id, prev_id):
             loop = asyncio.get_running_loop()
             loop.create_task(_cleanup_after_delay(ctx, chat_id, prev_id, end_id, start_inclusive))
         except RuntimeError:
-            print("SCHEDULE CLEANUP skipped: no running event loop", flush=True)
+            log("SCHEDULE CLEANUP", "skipped: no running event loop", level=logging.DEBUG)
 
 # Delete a range of messages after a delay.
 async def _cleanup_after_delay(ctx, chat_id, start_id, end_id, start_inclusive):
     await asyncio.sleep(4)
-    print(f"RUN CLEANUP chat_id={chat_id} start_id={start_id} end_id={end_id} inclusive={start_inclusive}", flush=True)
+    log("RUN CLEANUP", f"chat_id={chat_id} start_id={start_id} end_id={end_id} inclusive={start_inclusive}", level=logging.DEBUG)
     if start_id is not None:
         begin = start_id if start_inclusive else start_id + 1
         for mid in range(begin, end_id + 1):
@@ -1162,7 +2814,7 @@ async def _cleanup_after_delay(ctx, chat_id, start_id, end_id, start_inclusive):
                     continue
                 await telegram_request(ctx.bot.delete_message, chat_id=chat_id, message_id=mid)
             except Exception as e:
-                print(f"DELETE FAIL chat_id={chat_id} message_id={mid} err={e}", flush=True)
+                log("DELETE FAIL", f"chat_id={chat_id} message_id={mid} err={e}", level=logging.WARNING)
     LAST_CLEANUP_ID[chat_id] = end_id
 
 # Warn about off-topic chat and remove both messages.
@@ -1176,96 +2828,138 @@ async def warn_and_cleanup_chat(ctx, chat_id, user_msg_id, delay=5):
     try:
         await telegram_request(ctx.bot.delete_message, chat_id=chat_id, message_id=warn.message_id)
     except Exception as e:
-        print(f"DELETE FAIL chat_id={chat_id} message_id={warn.message_id} err={e}", flush=True)
+        log("DELETE FAIL", f"chat_id={chat_id} message_id={warn.message_id} err={e}", level=logging.WARNING)
     try:
         await telegram_request(ctx.bot.delete_message, chat_id=chat_id, message_id=user_msg_id)
     except Exception as e:
-        print(f"DELETE FAIL chat_id={chat_id} message_id={user_msg_id} err={e}", flush=True)
+        log("DELETE FAIL", f"chat_id={chat_id} message_id={user_msg_id} err={e}", level=logging.WARNING)
+
+# Seek a player to a saved time if it supports seeking.
+def seek_player_to(pid, t, context=""):
+    try:
+        props = kodi_call(
+            "Player.GetProperties",
+            {"playerid": pid, "properties": ["totaltime", "canseek"]}
+        ).get("result", {})
+        if not props.get("canseek"):
+            log("RESUME SEEK", f"skip canseek=false playerid={pid} ctx={context}")
+            return
+        target_sec = kodi_time_seconds(t)
+        if target_sec is None:
+            log("RESUME SEEK", f"skip invalid times playerid={pid} ctx={context} target={t}", level=logging.WARNING)
+            return
+        log("RESUME SEEK", f"playerid={pid} ctx={context} target_sec={target_sec}")
+        kodi_call(
+            "Player.Seek",
+            {"playerid": pid, "value": {"time": t}}
+        )
+    except Exception:
+        pass
 
 # Try to seek to a time once a player is available.
-def seek_when_player_ready(t, context=""):
+def seek_when_player_ready(t, context="", since=None):
+    token = supersede_io("seek")
+    if since is None:
+        since = CLOCK()
+
     def _seek():
-        end = time.time() + RESUME_SEEK_WAIT_SEC
-        start_ts = time.time()
+        end = CLOCK() + RESUME_SEEK_WAIT_SEC
+        start_ts = CLOCK()
         last_log_ts = 0.0
-        while time.time() < end:
+        while CLOCK() < end:
+            if not io_current("seek", token):
+                log("RESUME SEEK", f"superseded ctx={context}")
+                return
+            if WS_CONNECTED:
+                # Kodi announces a seekable stream with Player.OnAVStart.
+                msg = wait_for_ws_event(
+                    ws_event_matcher("Player.OnAVStart"), end - CLOCK(), since=since, key="seek", token=token,
+                )
+                if not io_current("seek", token):
+                    log("RESUME SEEK", f"superseded ctx={context}")
+                    return
+                if msg is not None:
+                    data = (msg.get("params", {}) or {}).get("data", {}) or {}
+                    pid = (data.get("player", {}) or {}).get("playerid")
+                    if pid is None:
+                        pid = get_active_playerid()
+                    if pid is not None:
+                        seek_player_to(pid, t, context)
+                        return
+                if WS_CONNECTED:
+                    break
+                continue
             players = get_active_players()
             pid = players[0]["playerid"] if players else None
             if pid is not None:
-                try:
-                    props = kodi_call(
-                        "Player.GetProperties",
-                        {"playerid": pid, "properties": ["totaltime", "canseek"]}
-                    ).get("result", {})
-                    if not props.get("canseek"):
-                        print(f"RESUME SEEK skip canseek=false playerid={pid} ctx={context}", flush=True)
-                        return
-                    target_sec = kodi_time_seconds(t)
-                    if target_sec is None:
-                        print(
-                            f"RESUME SEEK skip invalid times playerid={pid} ctx={context} "
-                            f"target={t}",
-                            flush=True
-                        )
-                        return
-                    print(
-                        f"RESUME SEEK playerid={pid} ctx={context} target_sec={target_sec}",
-                        flush=True
-                    )
-                    kodi_call(
-                        "Player.Seek",
-                        {"playerid": pid, "value": {"time": t}}
-                    )
-                except Exception:
-                    pass
+                seek_player_to(pid, t, context)
                 return
-            now = time.time()
+            now = CLOCK()
             if now - last_log_ts >= 1.0:
                 elapsed = now - start_ts
-                print(
-                    f"RESUME SEEK waiting for playerid ctx={context} elapsed={elapsed:.1f}s players={players}",
-                    flush=True
-                )
+                log("RESUME SEEK", f"waiting for playerid ctx={context} elapsed={elapsed:.1f}s players={players}", level=logging.DEBUG)
                 last_log_ts = now
             time.sleep(0.3)
-        print(f"RESUME SEEK gave up: no playerid ctx={context}", flush=True)
-    threading.Thread(target=_seek, daemon=True).start()
+        log("RESUME SEEK", f"gave up: no playerid ctx={context}", level=logging.WARNING)
+    submit_io(_seek, key="seek", token=token)
 
 # Start playback of a queue item via Kodi.
 def play_item(item: dict, resume_time=None):
     # Stop + clear Kodi state, but leave bot state unchanged.
     global BOT_EXPECTING_WS
+    kind = item.get("kind", "video")
+    stream = ""
+    if kind == "audio" and (STREAM_PREFETCH or SC_DIRECT_STREAM):
+        stream = get_cached_stream_url(item.get("link"))
+    if kind == "audio" and not stream and SC_DIRECT_STREAM and item.get("link"):
+        # This can run on the event loop; resolving here would stall the bot, so use the addon.
+        log("SC STREAM", f"not resolved yet; using addon link={item.get('link')}")
+    begin_transition(bool(stream))
+    trace_play_started(item)
+    checkpoint_start(item, resume_time)
+    # Waiters for the previous track must not act on this one.
+    supersede_io("seek")
+    supersede_io("audio_resolve")
     stop_all_players()
     kodi_clear_all_playlists()
-    kind = item.get("kind", "video")
     BOT_EXPECTING_WS = 2
-    print(
-        f"PLAY_ITEM start kind={item.get('kind')} title={item.get('title')} url={item.get('url')}",
-        flush=True,
-    )
+    log("PLAY_ITEM", f"start kind={item.get('kind')} title={item.get('title')} url={item.get('url')}")
 
     # Explicitly use audio (0) vs video (1) playlists.
     if kind == "audio":
-        # Start SoundCloud via the audio playlist, then switch to the real stream.
         playlistid = 0
         maybe_cache_soundcloud_url(item.get("url"))
-        kodi_add_to_playlist(item["url"], playlistid)
-        res = kodi_call("Player.Open", {"item": {"playlistid": playlistid, "position": 0}})
-        print(f"PLAY_ITEM open audio res={res}", flush=True)
-        schedule_audio_resolve_and_open(playlistid, resume_time=resume_time)
+        if stream:
+            # Stream was resolved by the bot; open it directly.
+            opened_ts = CLOCK()
+            res = kodi_call("Player.Open", {"item": {"file": stream}})
+            log("PLAY_ITEM", f"open audio direct res={res}")
+            schedule_playback_refresh()
+            if resume_time is not None:
+                seek_when_player_ready(resume_time, context="audio", since=opened_ts)
+        else:
+            # Start SoundCloud via the audio playlist, then switch to the real stream.
+            kodi_add_to_playlist(item["url"], playlistid)
+            res = kodi_call("Player.Open", {"item": {"playlistid": playlistid, "position": 0}})
+            log("PLAY_ITEM", f"open audio res={res}")
+            schedule_audio_resolve_and_open(playlistid, resume_time=resume_time)
     else:
         playlistid = 1
         kodi_add_to_playlist(item["url"], playlistid)
+        opened_ts = CLOCK()
         res = kodi_call("Player.Open", {"item": {"playlistid": playlistid}})
-        print(f"PLAY_ITEM open video res={res}", flush=True)
+        log("PLAY_ITEM", f"open video res={res}")
         schedule_playback_refresh()
         if resume_time is not None:
-            seek_when_player_ready(resume_time, context="video")
+            seek_when_player_ready(resume_time, context="video", since=opened_ts)
+    trace_mark(item.get("trace"), "kodi_open")
     players = get_active_players()
-    print(f"PLAY_ITEM active_players={players}", flush=True)
+    log("PLAY_ITEM", f"active_players={players}", level=logging.DEBUG)
 
-# Start playback and then seek to a saved timestamp.
-def resume_item_at_time(item: dict, t):
+# Start playback and then seek to a saved timestamp or the entry's checkpoint.
+def resume_item_at_time(item: dict, t=None):
+    if not t:
+        t = checkpoint_resume_time(item)
     if not t:
         play_item(item)
         return
@@ -1288,6 +2982,7 @@ def stop_player_and_clear_playlists():
 def hard_stop_and_clear():
     global AUTOPLAY_ENABLED, CURRENT_INDEX, DISPLAY_INDEX, NEXT_INDEX, LAST_PROGRESS_TS, LAST_PROGRESS_TIME, LAST_PROGRESS_TOTAL, LAST_PROGRESS_INDEX, EXTERNAL_PLAYBACK, BOT_EXPECTING_WS
     AUTOPLAY_ENABLED = False
+    drop_live_checkpoint()
     stop_all_players()
     kodi_clear_all_playlists()
     CURRENT_INDEX = None
@@ -1307,11 +3002,235 @@ def kodi_clear_all_playlists():
     kodi_call("Playlist.Clear", {"playlistid": 0})
     # Video
     kodi_call("Playlist.Clear", {"playlistid": 1})
+    reset_kodi_mirror()
+
+# Kodi playlist id used for a queue item kind.
+def playlist_for_kind(kind):
+    return 0 if kind == "audio" else 1
+
+# Pick the queue indices Kodi should hold: the same-kind run around the anchor.
+def kodi_mirror_window(kinds, anchor):
+    if anchor is None or not (0 <= anchor < len(kinds)):
+        return None, []
+    kind = kinds[anchor]
+    start = anchor
+    while start > 0 and anchor - start < KODI_MIRROR_MAX_BEHIND and kinds[start - 1] == kind:
+        start -= 1
+    end = anchor + 1
+    while end < len(kinds) and end - anchor < KODI_MIRROR_MAX_AHEAD and kinds[end] == kind:
+        end += 1
+    return playlist_for_kind(kind), list(range(start, end))
+
+# Adjust the count of Playlist.OnAdd notifications the bot's own inserts will cause.
+def expect_mirror_adds(n):
+    global KODI_MIRROR_EXPECT_ADDS
+    with KODI_MIRROR_ADDS_LOCK:
+        KODI_MIRROR_EXPECT_ADDS = max(KODI_MIRROR_EXPECT_ADDS + n, 0)
+
+# Consume one expected add; False means someone else edited the playlist.
+def take_expected_mirror_add():
+    global KODI_MIRROR_EXPECT_ADDS
+    with KODI_MIRROR_ADDS_LOCK:
+        if KODI_MIRROR_EXPECT_ADDS > 0:
+            KODI_MIRROR_EXPECT_ADDS -= 1
+            return True
+    return False
+
+# Bring one Kodi playlist in line with the target files using minimal edits.
+def sync_kodi_playlist(playlistid, target):
+    res = kodi_call("Playlist.GetItems", {"playlistid": playlistid, "properties": ["file"]})
+    actual = [it.get("file") or "" for it in (res.get("result", {}) or {}).get("items") or []]
+    need = Counter(target)
+    seen = Counter()
+    keep = []
+    for f in actual:
+        keep.append(seen[f] < need[f])
+        seen[f] += 1
+    ops = 0
+    if actual and not any(keep):
+        kodi_call("Playlist.Clear", {"playlistid": playlistid})
+        ops += 1
+    else:
+        # Remove from the end so earlier positions stay valid.
+        for pos in range(len(actual) - 1, -1, -1):
+            if not keep[pos]:
+                res = kodi_call("Playlist.Remove", {"playlistid": playlistid, "position": pos})
+                if res.get("error"):
+                    # Kodi refuses to remove the playing item; the local model no longer holds.
+                    raise RuntimeError(f"remove position={pos} err={res.get('error')}")
+                ops += 1
+    actual = [f for f, k in zip(actual, keep) if k]
+    for pos, f in enumerate(target):
+        if pos < len(actual) and actual[pos] == f:
+            continue
+        other = next((j for j in range(pos + 1, len(actual)) if actual[j] == f), None)
+        if other is not None:
+            kodi_call("Playlist.Swap", {"playlistid": playlistid, "position1": pos, "position2": other})
+            actual[pos], actual[other] = actual[other], actual[pos]
+        else:
+            expect_mirror_adds(1)
+            try:
+                res = kodi_call("Playlist.Insert", {"playlistid": playlistid, "position": pos, "item": {"file": f}})
+            except Exception:
+                expect_mirror_adds(-1)
+                raise
+            if res.get("error"):
+                # No OnAdd will come for a rejected insert.
+                expect_mirror_adds(-1)
+                raise RuntimeError(f"insert position={pos} err={res.get('error')}")
+            actual.insert(pos, f)
+        ops += 1
+    return ops
+
+# Kodi repeat mode matching the bot's repeat mode for the mirrored run.
+def kodi_mirror_repeat(window_len, queue_len):
+    if REPEAT_MODE == "one":
+        return "one"
+    if REPEAT_MODE == "all" and window_len == queue_len:
+        return "all"
+    return "off"
+
+# Mirror the queue run around the anchor index into Kodi's playlist.
+def sync_kodi_playlists(anchor=None):
+    if not KODI_PLAYLIST_SYNC:
+        return None
+    with KODI_SYNC_RUN_LOCK:
+        with LOCK:
+            kinds = [it.get("kind", "video") for it in QUEUE]
+            files = [it.get("url") or "" for it in QUEUE]
+            if anchor is None:
+                anchor = DISPLAY_INDEX if DISPLAY_INDEX is not None else NEXT_INDEX
+        playlistid, indices = kodi_mirror_window(kinds, anchor)
+        if playlistid is None:
+            for pid in (0, 1):
+                if KODI_MIRROR[pid]:
+                    kodi_call("Playlist.Clear", {"playlistid": pid})
+                    KODI_MIRROR[pid] = []
+            return None
+        try:
+            ops = sync_kodi_playlist(playlistid, [files[i] for i in indices])
+        except Exception as e:
+            log("KODI SYNC", f"error playlist={playlistid} err={e}", level=logging.ERROR)
+            # The playlist is partly edited; forget the mirror so the next sync rebuilds it.
+            KODI_MIRROR[playlistid] = []
+            return None
+        KODI_MIRROR[playlistid] = indices
+        other = 1 - playlistid
+        if KODI_MIRROR[other]:
+            kodi_call("Playlist.Clear", {"playlistid": other})
+            KODI_MIRROR[other] = []
+        for p in get_active_players():
+            if p.get("playerid") == playlistid:
+                kodi_call("Player.SetRepeat", {
+                    "playerid": p["playerid"],
+                    "repeat": kodi_mirror_repeat(len(indices), len(kinds)),
+                })
+        if ops:
+            log("KODI SYNC", f"playlist={playlistid} ops={ops} size={len(indices)}")
+        return playlistid
+
+# Coalesce queue changes into one background playlist sync.
+def schedule_kodi_playlist_sync():
+    global KODI_SYNC_PENDING
+    if not KODI_PLAYLIST_SYNC:
+        return
+    with KODI_SYNC_STATE_LOCK:
+        if KODI_SYNC_PENDING:
+            return
+        KODI_SYNC_PENDING = True
+
+    def _run():
+        global KODI_SYNC_PENDING
+        time.sleep(0.2)
+        with KODI_SYNC_STATE_LOCK:
+            KODI_SYNC_PENDING = False
+        sync_kodi_playlists()
+    submit_io(_run)
+
+# Forget the mirrored state after Kodi playlists were cleared.
+def reset_kodi_mirror():
+    KODI_MIRROR[0] = []
+    KODI_MIRROR[1] = []
+
+# Map the item Kodi is playing back to a queue index via the mirror.
+def kodi_mirror_queue_index(playerid):
+    if playerid not in KODI_MIRROR or not KODI_MIRROR[playerid]:
+        return None
+    props = kodi_call(
+        "Player.GetProperties",
+        {"playerid": playerid, "properties": ["playlistid", "position"]},
+    ).get("result", {}) or {}
+    pos = props.get("position")
+    indices = KODI_MIRROR.get(props.get("playlistid"), [])
+    if isinstance(pos, int) and 0 <= pos < len(indices):
+        return indices[pos]
+    return None
+
+# Follow Kodi's own playlist advancement by syncing the bot's indices.
+def kodi_mirror_track_position(playerid):
+    global CURRENT_INDEX, DISPLAY_INDEX, NEXT_INDEX, EXTERNAL_PLAYBACK
+    try:
+        i = kodi_mirror_queue_index(playerid)
+    except Exception:
+        return False
+    if i is None:
+        return False
+    with LOCK:
+        if i >= len(QUEUE):
+            return False
+        changed = DISPLAY_INDEX != i
+        CURRENT_INDEX = i
+        DISPLAY_INDEX = i
+        NEXT_INDEX = i + 1
+        EXTERNAL_PLAYBACK = False
+    if changed:
+        log("KODI SYNC", f"position idx={i}")
+        mark_list_dirty()
+        # Keep the mirrored window moving with playback.
+        schedule_kodi_playlist_sync()
+    return True
+
+# Start a queue index through the mirrored Kodi playlist.
+def mirror_play_index(i, item, resume_time=None):
+    global BOT_EXPECTING_WS
+    playlistid = sync_kodi_playlists(anchor=i)
+    indices = KODI_MIRROR.get(playlistid, []) if playlistid is not None else []
+    if i not in indices:
+        play_item(item, resume_time=resume_time)
+        return
+    pos = indices.index(i)
+    begin_transition(False)
+    trace_play_started(item)
+    checkpoint_start(item, resume_time)
+    supersede_io("seek")
+    supersede_io("audio_resolve")
+    BOT_EXPECTING_WS = 2
+    opened_ts = CLOCK()
+    players = get_active_players()
+    if any(p.get("playerid") == playlistid for p in players):
+        res = kodi_call("Player.GoTo", {"playerid": playlistid, "to": pos})
+        log("PLAY_ITEM", f"goto playlist={playlistid} position={pos} res={res}")
+    else:
+        stop_all_players()
+        res = kodi_call("Player.Open", {"item": {"playlistid": playlistid, "position": pos}})
+        log("PLAY_ITEM", f"open playlist={playlistid} position={pos} res={res}")
+    trace_mark(item.get("trace"), "kodi_open")
+    schedule_playback_refresh()
+    if resume_time is not None:
+        seek_when_player_ready(resume_time, context="mirror", since=opened_ts)
+
+# Start a queue item, through the Kodi playlist mirror when enabled.
+def play_queue_item(i, item, resume_time=None):
+    if KODI_PLAYLIST_SYNC and i is not None:
+        mirror_play_index(i, item, resume_time=resume_time)
+    else:
+        play_item(item, resume_time=resume_time)
 
 # Advance to the next queue item and start playback.
 def skip_queue():
     global CURRENT_INDEX, DISPLAY_INDEX, NEXT_INDEX, AUTOPLAY_ENABLED
 
+    drop_live_checkpoint()
     with LOCK:
         if not QUEUE:
             AUTOPLAY_ENABLED = False
@@ -1341,6 +3260,8 @@ def skip_queue():
     return True
 
 QUEUE = []
+QUEUE_KEYS = {}
+QUEUE_SEQ = 0
 CURRENT_INDEX = None
 DISPLAY_INDEX = None
 NEXT_INDEX = 0
@@ -1350,13 +3271,15 @@ REPEAT_MODE = "off"
 
 # Create a queue item dict.
 def make_item(title, url, kind, link=None):
-    return {"title": title, "url": url, "kind": kind, "link": link}
+    item = {"title": title, "url": url, "kind": kind, "link": link}
+    item["keys"] = queue_match_keys(item)
+    return item
 
 # Fetch a YouTube title and author for display.
 def fetch_youtube_title(vid):
     url = f"https://youtu.be/{vid}"
     try:
-        yt = YouTube(url)
+        yt = load_pytube().YouTube(url)
         author = yt.author or ""
         title = yt.title or ""
         if author and title:
@@ -1417,9 +3340,6 @@ def is_sc_track_url(url):
     # Accept only artist/track links; reject discover/sets and other non-track paths
     return bool(re.match(r"^https?://(www\.)?soundcloud\.com/[^/]+/[^/?#]+", url)) and "discover/sets" not in url
 
-def is_sc_set_url(url):
-    return bool(re.match(r"^https?://(www\.)?soundcloud\.com/[^/]+/sets/[^/?#]+", url)) and "discover/sets" not in url
-
 # Resolve a SoundCloud short link to a full track URL.
 def resolve_sc_short(url):
     try:
@@ -1427,22 +3347,22 @@ def resolve_sc_short(url):
             "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"
         }
         r = requests.get(url, allow_redirects=True, timeout=8, headers=headers)
-        print(f"SC_SHORT RESOLVE start={url} final={r.url} history={[h.url for h in r.history]}", flush=True)
+        log("SC_SHORT RESOLVE", f"start={url} final={r.url} history={[h.url for h in r.history]}", level=logging.DEBUG)
         # Prefer a real soundcloud.com target (avoid /discover/sets fallback)
         candidates = [h.url for h in r.history] + [r.url]
         for u in candidates:
             if re.match(r"^https?://(www\.)?soundcloud\.com/", u) and "discover/sets" not in u:
-                print(f"SC_SHORT RESOLVE pick={u}", flush=True)
+                log("SC_SHORT RESOLVE", f"pick={u}", level=logging.DEBUG)
                 return u
         # Try to extract canonical/og:url from HTML
         m = re.search(r'https?://soundcloud\.com/[^\s"\'<>]+', r.text)
         if m:
-            print(f"SC_SHORT RESOLVE html={m.group(0)}", flush=True)
+            log("SC_SHORT RESOLVE", f"html={m.group(0)}", level=logging.DEBUG)
             return m.group(0)
-        print("SC_SHORT RESOLVE failed", flush=True)
+        log("SC_SHORT RESOLVE", "failed", level=logging.WARNING)
         return None
     except Exception as e:
-        print(f"SC_SHORT RESOLVE error={e}", flush=True)
+        log("SC_SHORT RESOLVE", f"error={e}", level=logging.WARNING)
         return None
 
 # Add a file URL to a Kodi playlist.
@@ -1460,10 +3380,13 @@ def kodi_play_playlist(playlistid):
     )
 
 # Poll the Kodi playlist for the resolved SoundCloud stream URL.
-def resolve_soundcloud_media_url(playlistid, timeout_s=6.0, interval_s=0.5):
+def resolve_soundcloud_media_url(playlistid, timeout_s=6.0, interval_s=0.5, token=None):
     # Wait until the addon creates the real stream entry.
-    end = time.time() + timeout_s
-    while time.time() < end:
+    end = CLOCK() + timeout_s
+    while CLOCK() < end:
+        if token is not None and not io_current("audio_resolve", token):
+            return None
+        checked_ts = CLOCK()
         res = kodi_call(
             "Playlist.GetItems",
             {"playlistid": playlistid, "properties": ["file", "title"]}
@@ -1473,54 +3396,279 @@ def resolve_soundcloud_media_url(playlistid, timeout_s=6.0, interval_s=0.5):
             f = it.get("file", "")
             if "media_url=" in f:
                 return f
-        time.sleep(interval_s)
+        if WS_CONNECTED:
+            # Re-check only when Kodi reports an addition to this playlist.
+            wait_for_ws_event(
+                ws_event_matcher("Playlist.OnAdd", playlistid=playlistid),
+                end - CLOCK(),
+                since=checked_ts,
+                key="audio_resolve" if token is not None else None,
+                token=token,
+            )
+        else:
+            time.sleep(interval_s)
     return None
 
 # Resolve SoundCloud stream URL asynchronously and open it.
 def schedule_audio_resolve_and_open(playlistid, resume_time=None):
     # As soon as the real stream is available, open it and clear the playlist.
     # Worker to resolve and open the real SoundCloud stream.
+    token = supersede_io("audio_resolve")
+
     def _run():
-        url = resolve_soundcloud_media_url(playlistid)
-        if not url:
+        url = resolve_soundcloud_media_url(
+            playlistid,
+            token=token,
+        )
+        if not url or not io_current("audio_resolve", token):
             return
+        opened_ts = CLOCK()
         kodi_call("Player.Open", {"item": {"file": url}})
+        trace_mark(TRACE_ACTIVE, "addon_resolve")
         kodi_call("Playlist.Clear", {"playlistid": playlistid})
         schedule_playback_refresh()
         if resume_time is not None:
-            print("PLAY_ITEM audio stream opened; seeking...", flush=True)
-            seek_when_player_ready(resume_time, context="audio")
-    threading.Thread(target=_run, daemon=True).start()
+            log("PLAY_ITEM", "audio stream opened; seeking...")
+            seek_when_player_ready(resume_time, context="audio", since=opened_ts)
+    submit_io(_run, key="audio_resolve", token=token)
+
+# Resolve SoundCloud track ids to permalinks, batching API lookups.
+def fetch_soundcloud_permalinks(track_ids):
+    out = {}
+    missing = []
+    for track_id in track_ids:
+        cached = get_cached_soundcloud_permalink(track_id)
+        if cached:
+            out[track_id] = cached
+        elif track_id not in missing:
+            missing.append(track_id)
+    if not missing:
+        return out
+    client_id = read_soundcloud_client_id()
+    if not client_id:
+        return out
+    for start in range(0, len(missing), SC_API_BATCH_SIZE):
+        chunk = missing[start:start + SC_API_BATCH_SIZE]
+        try:
+            resp = requests.get(
+                "https://api-v2.soundcloud.com/tracks",
+                params={"ids": ",".join(chunk), "client_id": client_id},
+                timeout=8,
+            )
+            data = resp.json() if resp.ok else []
+        except Exception:
+            data = []
+        for t in data if isinstance(data, list) else []:
+            track_id = str(t.get("id") or "")
+            url = t.get("permalink_url") or ""
+            if track_id and url:
+                cache_soundcloud_permalink(track_id, url)
+                out[track_id] = url
+    # Tracks the batch endpoint skipped (e.g. geo-blocked) get a bounded per-id lookup.
+    left = [t for t in missing if t not in out]
+    if left:
+        with ThreadPoolExecutor(max_workers=SC_RESOLVE_WORKERS) as pool:
+            for track_id, url in zip(left, pool.map(fetch_soundcloud_permalink, left)):
+                if url:
+                    out[track_id] = url
+    log("SC_SET", f"permalinks resolved={len(out)}/{len(track_ids)} api_lookups={len(missing)}")
+    return out
+
+# Run a yt-dlp extraction of a SoundCloud URL and return its entries.
+def extract_soundcloud_entries(url, flat=True):
+    ydl_opts = {"quiet": True, "skip_download": True, "extract_flat": flat}
+    try:
+        with load_yt_dlp().YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(url, download=False)
+    except Exception:
+        return None
+    return info.get("entries") or []
+
+# Cached track URLs of a SoundCloud set, if still fresh.
+def get_cached_soundcloud_set(clean):
+    hit = SC_SET_CACHE.get(clean)
+    if hit and CLOCK() - hit[1] < SC_SET_TTL:
+        return list(hit[0])
+    return None
 
-# Expand a SoundCloud set into track URLs using yt-dlp.
+# Remember the complete track list of a SoundCloud set, evicting the oldest set when full.
+def cache_soundcloud_set(clean, urls):
+    SC_SET_CACHE.pop(clean, None)
+    if len(SC_SET_CACHE) >= SC_SET_CACHE_MAX:
+        SC_SET_CACHE.pop(next(iter(SC_SET_CACHE)))
+    SC_SET_CACHE[clean] = (list(urls), CLOCK())
+
+# Extract the track URLs of a SoundCloud set; also reports whether every track was named.
+def extract_soundcloud_set(url):
+    clean = re.sub(r"\?.*$", "", url)
+    entries = extract_soundcloud_entries(clean, flat=True)
+    if entries is None:
+        return [], False
+    # Flat extraction returns api-v2 URLs for tracks it could not name; resolve only those.
+    slots = []
+    for e in entries:
+        u = e.get("url") or e.get("webpage_url") or ""
+        if not u.startswith("http"):
+            continue
+        if u.startswith("https://api-v2.soundcloud.com/") or u.startswith("https://api.soundcloud.com/"):
+            slots.append(("id", extract_soundcloud_track_id(unquote(u)) or str(e.get("id") or "")))
+        else:
+            slots.append(("url", u))
+    unresolved = [v for kind, v in slots if kind == "id" and v]
+    links = fetch_soundcloud_permalinks(unresolved) if unresolved else {}
+    complete = bool(slots) and all(kind == "url" or v in links for kind, v in slots)
+    if not complete:
+        # Some tracks stayed unnamed (or the flat pass listed none); a full pass names them all.
+        full = extract_soundcloud_entries(clean, flat=False)
+        if full is not None:
+            slots = [("url", e.get("webpage_url") or e.get("url") or "") for e in full]
+            complete = True
+    urls = []
+    for kind, v in slots:
+        u = links.get(v, "") if kind == "id" else v
+        if u and u.startswith("http") and is_sc_track_url(u):
+            urls.append(u)
+    if not complete:
+        log("SC_SET", f"incomplete url={clean} tracks={len(urls)} listed={len(slots)}", level=logging.WARNING)
+    return urls, complete
+
+# Expand a SoundCloud set into track URLs, caching only complete lists.
 def expand_soundcloud_set(url):
     clean = re.sub(r"\?.*$", "", url)
-    ydl_opts = {"quiet": True, "skip_download": True, "extract_flat": True}
+    cached = get_cached_soundcloud_set(clean)
+    if cached is not None:
+        return cached
+    urls, complete = extract_soundcloud_set(clean)
+    if urls and complete:
+        cache_soundcloud_set(clean, urls)
+    return urls
+
+# Serve extraction jobs in a worker process until the pipe closes.
+def extract_worker_main(conn):
+    setup_worker_logging()
+    # Pay the import cost once per worker, before the first job arrives.
+    load_yt_dlp()
+    load_pytube()
+    while True:
+        try:
+            msg = conn.recv()
+        except (EOFError, OSError):
+            return
+        if msg is None:
+            return
+        name, args = msg
+        # Counters bumped here (e.g. permalink cache lookups) travel back with the result.
+        with METRICS_LOCK:
+            METRICS_COUNTERS.clear()
+        try:
+            res = (True, globals()[EXTRACT_JOBS[name]](*args))
+        except Exception as e:
+            res = (False, repr(e))
+        with METRICS_LOCK:
+            counts = dict(METRICS_COUNTERS)
+        conn.send(res + (counts,))
+
+# Spawn a warm extraction worker process.
+def start_extract_worker():
+    ctx = multiprocessing.get_context("spawn")
+    parent_conn, child_conn = ctx.Pipe()
+    proc = ctx.Process(target=extract_worker_main, args=(child_conn,), name="extract-worker", daemon=True)
+    proc.start()
+    child_conn.close()
+    return {"proc": proc, "conn": parent_conn}
+
+# Hard-kill a worker whose job timed out or was cancelled.
+def kill_extract_worker(worker):
     try:
-        with YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(clean, download=False)
+        worker["proc"].kill()
+        worker["proc"].join(timeout=1)
     except Exception:
-        return []
-    entries = info.get("entries") or []
-    urls = []
-    for e in entries:
-        u = e.get("url") or e.get("webpage_url")
-        if u and u.startswith("http"):
-            urls.append(u)
-    if not urls or any(u.startswith("https://api-v2.soundcloud.com/") for u in urls):
-        ydl_opts = {"quiet": True, "skip_download": True, "extract_flat": False}
+        pass
+    try:
+        worker["conn"].close()
+    except Exception:
+        pass
+
+# Start the extraction workers ahead of the first job; spawning blocks, so this runs on an I/O thread.
+def prewarm_extract_pool():
+    for _ in range(EXTRACT_POOL_SIZE - len(EXTRACT_IDLE)):
+        # EXTRACT_IDLE belongs to the loop; hand the worker over there.
+        MAIN_LOOP.call_soon_threadsafe(add_idle_extract_worker, start_extract_worker())
+
+# Park a prewarmed worker unless jobs already brought the pool to its size; runs on the loop.
+def add_idle_extract_worker(worker):
+    if len(EXTRACT_IDLE) + EXTRACT_BUSY >= EXTRACT_POOL_SIZE:
+        kill_extract_worker(worker)
+        return
+    EXTRACT_IDLE.append(worker)
+
+# Run an extraction job in the process pool with a timeout.
+async def run_extract_job(name, *args, timeout=None):
+    global EXTRACT_SEM, EXTRACT_BUSY
+    if EXTRACT_POOL_SIZE <= 0:
+        return await asyncio.to_thread(globals()[EXTRACT_JOBS[name]], *args)
+    if EXTRACT_SEM is None:
+        EXTRACT_SEM = asyncio.Semaphore(EXTRACT_POOL_SIZE)
+    async with EXTRACT_SEM:
+        worker = EXTRACT_IDLE.pop() if EXTRACT_IDLE else None
+        if worker is None or not worker["proc"].is_alive():
+            if worker is not None:
+                kill_extract_worker(worker)
+            worker = start_extract_worker()
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        fd = worker["conn"].fileno()
+
+        def _ready():
+            loop.remove_reader(fd)
+            if fut.done():
+                return
+            try:
+                fut.set_result(worker["conn"].recv())
+            except Exception as e:
+                fut.set_exception(e)
+
+        start = CLOCK()
+        loop.add_reader(fd, _ready)
+        EXTRACT_BUSY += 1
         try:
-            with YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(clean, download=False)
-        except Exception:
-            return []
-        entries = info.get("entries") or []
-        urls = []
-        for e in entries:
-            u = e.get("webpage_url") or e.get("url")
-            if u and u.startswith("http"):
-                urls.append(u)
-    return [u for u in urls if is_sc_track_url(u)]
+            worker["conn"].send((name, args))
+            ok, res, counts = await asyncio.wait_for(fut, timeout or EXTRACT_JOB_TIMEOUT)
+        except BaseException as e:
+            loop.remove_reader(fd)
+            kill_extract_worker(worker)
+            log("EXTRACT FAIL", f"job={name} elapsed={CLOCK() - start:.1f}s err={e!r}", level=logging.WARNING)
+            raise
+        finally:
+            EXTRACT_BUSY -= 1
+        EXTRACT_IDLE.append(worker)
+    for (metric, labels), n in counts.items():
+        metrics_inc(metric, labels, n)
+    log("EXTRACT", f"job={name} ok={ok} elapsed={CLOCK() - start:.1f}s")
+    if not ok:
+        raise RuntimeError(res)
+    return res
+
+# Run an extraction job from an I/O thread on the loop's process pool and wait for it.
+def run_extract_job_blocking(name, *args, timeout=None):
+    if MAIN_LOOP is None:
+        return globals()[EXTRACT_JOBS[name]](*args)
+    fut = asyncio.run_coroutine_threadsafe(run_extract_job(name, *args, timeout=timeout), MAIN_LOOP)
+    return fut.result()
+
+# Track URLs of a SoundCloud set, from the cache or the extraction pool.
+async def soundcloud_set_tracks_async(url):
+    clean = re.sub(r"\?.*$", "", url)
+    cached = get_cached_soundcloud_set(clean)
+    if cached is not None:
+        return cached
+    try:
+        tracks, complete = await run_extract_job("sc_set", url)
+    except Exception:
+        tracks, complete = [], False
+    if tracks and complete:
+        cache_soundcloud_set(clean, tracks)
+    return tracks
 
 def queue_soundcloud_set(url):
     tracks = expand_soundcloud_set(url)
@@ -1529,40 +3677,77 @@ def queue_soundcloud_set(url):
     mark_list_dirty()
     return len(tracks)
 
-async def queue_soundcloud_set_async(url):
-    try:
-        tracks = await asyncio.to_thread(expand_soundcloud_set, url)
-    except Exception:
-        tracks = []
-    for t in tracks:
-        queue_item(make_soundcloud(t))
+async def queue_soundcloud_set_async(url, trace=None):
+    tracks = await soundcloud_set_tracks_async(url)
+    trace_mark(trace, "metadata")
+    for n, t in enumerate(tracks):
+        item = make_soundcloud(t)
+        item["trace"] = fork_trace(trace, n)
+        queue_item(item)
     mark_list_dirty()
     return len(tracks)
 
 # Append an item to the queue and mark list dirty.
 def queue_item(item):
+    queue_items([item])
+
+# Append several items in order under one lock, with a single list/mirror/autoplay update.
+def queue_items(items):
+    if not items:
+        return
     with LOCK:
-        QUEUE.append(item)
+        QUEUE.extend(items)
+        index_queue_items(items)
+    if KODI_TRACE is not None:
+        record_kodi_trace("q", items=[{k: it.get(k) for k in ("title", "url", "kind", "link")} for it in items])
+    queued = []
+    for item in items:
+        trace = item.get("trace")
+        if trace:
+            # One line per item would flood INFO on a big paste; summarize the batch instead.
+            queued.append(trace_mark(trace, "queue", level=logging.DEBUG))
+            trace["queued_ts"] = trace["last"]
+    if queued:
+        log("TRACE", json.dumps({
+            "stage": "queue", "n": len(queued), "min_ms": round(min(queued), 1), "max_ms": round(max(queued), 1),
+        }))
     mark_list_dirty()
+    schedule_kodi_playlist_sync()
+    autoplay_notify()
 
 # Expand a YouTube playlist into video ids.
 def expand_playlist(pid):
-    pl = Playlist(f"https://www.youtube.com/playlist?list={pid}")
+    pl = load_pytube().Playlist(f"https://www.youtube.com/playlist?list={pid}")
     return [YT.search(v).group(1) for v in pl.video_urls if YT.search(v)]
 
 # Append a YouTube video to the queue.
-def queue_video(vid, title=None):
-    with LOCK:
-        QUEUE.append(make_youtube(vid, title=title))
-    mark_list_dirty()
+def queue_video(vid, title=None, trace=None):
+    item = make_youtube(vid, title=title)
+    item["trace"] = trace
+    queue_item(item)
 
 # Fetch YouTube title asynchronously and queue the video.
-async def queue_video_async(vid):
+async def queue_video_async(vid, trace=None):
+    title = await fetch_youtube_title_async(vid)
+    trace_mark(trace, "metadata")
+    queue_video(vid, title=title, trace=trace)
+
+# Fetch a YouTube title in the extraction pool, caching real titles.
+async def fetch_youtube_title_async(vid):
+    cached = YT_TITLE_CACHE.get(vid)
+    if cached:
+        metrics_inc("cache_lookups_total", ("yt_title", "hit"))
+        return cached
+    metrics_inc("cache_lookups_total", ("yt_title", "miss"))
     try:
-        title = await asyncio.to_thread(fetch_youtube_title, vid)
+        title = await run_extract_job("yt_title", vid, timeout=30)
     except Exception:
-        title = None
-    queue_video(vid, title=title)
+        return None
+    if title and title != f"https://youtu.be/{vid}":
+        if len(YT_TITLE_CACHE) >= YT_TITLE_CACHE_MAX:
+            YT_TITLE_CACHE.pop(next(iter(YT_TITLE_CACHE)))
+        YT_TITLE_CACHE[vid] = title
+    return title
 
 
 # Queue all items from a YouTube playlist.
@@ -1571,22 +3756,123 @@ def queue_playlist(pid):
         queue_video(vid)
     mark_list_dirty()
 
-# Asynchronously queue all items from a YouTube playlist.
-async def queue_playlist_async(pid):
+# Video ids of a YouTube playlist, expanded in the extraction pool.
+async def youtube_playlist_vids_async(pid):
     try:
-        vids = await asyncio.to_thread(expand_playlist, pid)
+        return await run_extract_job("yt_playlist", pid)
     except Exception:
-        vids = []
-    for vid in vids:
-        await queue_video_async(vid)
+        return []
+
+# Asynchronously queue all items from a YouTube playlist.
+async def queue_playlist_async(pid, trace=None):
+    vids = await youtube_playlist_vids_async(pid)
+    trace_mark(trace, "expand")
+    for n, vid in enumerate(vids):
+        await queue_video_async(vid, trace=fork_trace(trace, n))
     mark_list_dirty()
     return len(vids)
 
+# Split a message into typed, canonical links in the order they appear.
+def classify_links(text):
+    links = []
+    for m in LINK.finditer(text):
+        if m.group("sc_short"):
+            links.append({"type": "sc_short", "url": m.group("sc_short")})
+        elif m.group("sc_user"):
+            user, path, sub = m.group("sc_user"), m.group("sc_path"), m.group("sc_sub")
+            if user == "discover" or (path == "sets" and not sub):
+                # Discover pages and a profile's bare /sets tab are not playable on their own.
+                links.append({"type": "sc_invalid", "url": m.group(0)})
+            elif path == "sets" and sub:
+                links.append({"type": "sc_set", "url": f"https://soundcloud.com/{user}/sets/{sub}"})
+            else:
+                links.append({"type": "sc_track", "url": f"https://soundcloud.com/{user}/{path}"})
+        else:
+            token = m.group("yt")
+            vid = YT.search(token)
+            pl = PL.search(token)
+            if vid and pl:
+                links.append({"type": "yt_video_list", "video": vid.group(1), "list": pl.group(1)})
+            elif vid:
+                links.append({"type": "yt_video", "video": vid.group(1)})
+            elif pl:
+                links.append({"type": "yt_playlist", "list": pl.group(1)})
+    return links
+
+# Turn a video-with-playlist link into the track or the playlist the user picked.
+def choose_video_list(link, choice):
+    if link["type"] != "yt_video_list":
+        return link
+    if choice == "l":
+        return {"type": "yt_playlist", "list": link["list"]}
+    return {"type": "yt_video", "video": link["video"]}
+
+# Queue the links of a multi-link message and report the outcome in one reply.
+async def queue_links_and_report(ctx, chat_id, links, trace=None):
+    added, failed = await queue_links_async(links, trace=trace)
+    text = f"✔ {added} tracks from {len(links) - failed} links added."
+    if failed:
+        text += f"\n⚠ {failed} links could not be added."
+    await send_and_track(ctx, chat_id, text)
+
+# Resolve SoundCloud short links concurrently and classify their targets.
+async def resolve_short_links(links):
+    short = [l for l in links if l["type"] == "sc_short"]
+    if not short:
+        return links
+    targets = await asyncio.gather(
+        *(asyncio.to_thread(resolve_sc_short, l["url"]) for l in short),
+        return_exceptions=True,
+    )
+    resolved = {}
+    for link, target in zip(short, targets):
+        found = classify_links(target) if isinstance(target, str) else []
+        if found and found[0]["type"] in ("sc_track", "sc_set"):
+            resolved[id(link)] = found[0]
+        else:
+            resolved[id(link)] = {"type": "sc_invalid", "url": link["url"]}
+    return [resolved.get(id(l), l) for l in links]
+
+# Build queue items for YouTube videos, fetching titles concurrently.
+async def youtube_items_async(vids):
+    titles = await asyncio.gather(*(fetch_youtube_title_async(v) for v in vids))
+    return [make_youtube(v, title=t) for v, t in zip(vids, titles)]
+
+# Queue every link of a multi-link message in one step; returns (items added, links that failed).
+async def queue_links_async(links, trace=None):
+    async def _items(link):
+        kind = link["type"]
+        if kind == "yt_video":
+            return await youtube_items_async([link["video"]])
+        if kind == "yt_playlist":
+            return await youtube_items_async(await youtube_playlist_vids_async(link["list"]))
+        if kind == "sc_track":
+            return [make_soundcloud(link["url"])]
+        if kind == "sc_set":
+            return [make_soundcloud(t) for t in await soundcloud_set_tracks_async(link["url"])]
+        return []
+
+    results = await asyncio.gather(*(_items(l) for l in links), return_exceptions=True)
+    trace_mark(trace, "metadata")
+    items = []
+    failed = 0
+    for res in results:
+        if isinstance(res, BaseException) or not res:
+            failed += 1
+            continue
+        items.extend(res)
+    for n, item in enumerate(items):
+        item["trace"] = fork_trace(trace, n)
+    queue_items(items)
+    return len(items), failed
+
 # Clear the queue and reset indices.
 def clear_queue():
     global CURRENT_INDEX, NEXT_INDEX, LAST_PROGRESS_TS, LAST_PROGRESS_TIME, LAST_PROGRESS_TOTAL, LAST_PROGRESS_INDEX, EXTERNAL_PLAYBACK, BOT_EXPECTING_WS
+    record_kodi_trace("clear")
     with LOCK:
         QUEUE.clear()
+        QUEUE_KEYS.clear()
         CURRENT_INDEX = None
         NEXT_INDEX = 0
         LAST_PROGRESS_TS = 0.0
@@ -1597,6 +3883,7 @@ def clear_queue():
         BOT_EXPECTING_WS = 0
         RESUME_ATTEMPTS.clear()
     mark_list_dirty()
+    schedule_kodi_playlist_sync()
 
 # Remove a queue item by index with safety checks.
 def delete_index(i):
@@ -1612,7 +3899,8 @@ def delete_index(i):
             return False, "You cannot delete the currently playing title. Use /skip or /stop first."
 
         # Remove the item.
-        QUEUE.pop(i)
+        unindex_queue_item(QUEUE.pop(i))
+        record_kodi_trace("del", i=i)
 
         # Adjust indices after removal.
         if DISPLAY_INDEX is not None and i < DISPLAY_INDEX:
@@ -1625,7 +3913,8 @@ def delete_index(i):
             NEXT_INDEX -= 1
 
         mark_list_dirty()
-        return True, None
+    schedule_kodi_playlist_sync()
+    return True, None
 
 # Play a specific queue index and update state.
 def play_index(i):
@@ -1641,7 +3930,9 @@ def play_index(i):
         item = QUEUE[i]
         RESUME_ATTEMPTS.clear()
     mark_list_dirty()
-    play_item(item)
+    drop_live_checkpoint(keep=item)
+    play_queue_item(i, item)
+    autoplay_notify()
 
 # Check if the requested index is already playing or starting.
 def is_requested_track_already_playing(i):
@@ -1656,6 +3947,7 @@ def is_requested_track_already_playing(i):
 def back_queue():
     global CURRENT_INDEX, DISPLAY_INDEX, NEXT_INDEX, AUTOPLAY_ENABLED
 
+    drop_live_checkpoint()
     with LOCK:
         if not QUEUE:
             return False
@@ -1676,151 +3968,176 @@ def back_queue():
     return True
 
 
-# Background loop that advances playback automatically.
-def autoplay_loop():
-    global CURRENT_INDEX, NEXT_INDEX, AUTOPLAY_ENABLED, DISPLAY_INDEX
-    global LAST_PROGRESS_INDEX, LAST_PROGRESS_TIME, LAST_PROGRESS_TOTAL, WS_PLAYING, WS_LAST_EVENT_TS, WS_CONNECTED, WS_STATE, BOT_EXPECTING_WS
+# Move the autoplay state machine to a new state and log the transition.
+def set_autoplay_state(state):
+    global AUTOPLAY_STATE, AUTOPLAY_STATE_TS
+    if state == AUTOPLAY_STATE:
+        return
+    log("AUTOPLAY STATE", f"{AUTOPLAY_STATE} -> {state}")
+    AUTOPLAY_STATE = state
+    AUTOPLAY_STATE_TS = CLOCK()
 
-    while True:
-        try:
-            now = time.time()
+# Wake the autoplay state machine; safe to call from any thread.
+def autoplay_notify():
+    if MAIN_LOOP is None or AUTOPLAY_WAKE is None:
+        return
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is MAIN_LOOP:
+        AUTOPLAY_WAKE.set()
+    else:
+        MAIN_LOOP.call_soon_threadsafe(AUTOPLAY_WAKE.set)
 
-            if not WS_CONNECTED:
-                time.sleep(0.5)
-                continue
+# Seconds left in the last reported track, if known.
+def last_progress_remaining():
+    if not LAST_PROGRESS_TOTAL:
+        return None
+    cur_sec = kodi_time_seconds(LAST_PROGRESS_TIME)
+    total_sec = kodi_time_seconds(LAST_PROGRESS_TOTAL)
+    if cur_sec is None or total_sec is None:
+        return None
+    return max(total_sec - cur_sec, 0)
 
-            if not AUTOPLAY_ENABLED:
-                time.sleep(0.5)
-                continue
+# Evaluate playback state once and act; returns seconds until the next timer or None.
+async def autoplay_step():
+    global CURRENT_INDEX, NEXT_INDEX, AUTOPLAY_ENABLED, DISPLAY_INDEX
+    global LAST_PROGRESS_INDEX, LAST_PROGRESS_TIME, LAST_PROGRESS_TOTAL, BOT_EXPECTING_WS
 
-            # Wait for the bot-initiated WS events before acting.
-            if BOT_EXPECTING_WS > 0:
-                time.sleep(0.2)
-                continue
+    if not WS_CONNECTED or not AUTOPLAY_ENABLED:
+        set_autoplay_state("idle")
+        return AUTOPLAY_WATCHDOG_SEC
 
-            if WS_STATE == "playing":
-                time.sleep(0.5)
-                continue
+    # Wait for the bot-initiated WS events before acting.
+    if BOT_EXPECTING_WS > 0:
+        set_autoplay_state("starting")
+        left = AUTOPLAY_START_TIMEOUT_SEC - (CLOCK() - AUTOPLAY_STATE_TS)
+        if left > 0:
+            return left
+        log("AUTOPLAY", f"start timed out expecting={BOT_EXPECTING_WS}", level=logging.WARNING)
+        BOT_EXPECTING_WS = 0
 
-            if WS_STATE == "paused":
-                time.sleep(0.5)
-                continue
+    if WS_STATE == "playing":
+        set_autoplay_state("playing")
+        maybe_prefetch_next_stream()
+        return AUTOPLAY_PREFETCH_RECHECK_SEC
 
-            resume_pending = False
-            if WS_STATE == "stopped" and DISPLAY_INDEX is not None and LAST_PROGRESS_INDEX == DISPLAY_INDEX and LAST_PROGRESS_TIME:
-                remaining = None
-                if LAST_PROGRESS_TOTAL:
-                    cur_sec = kodi_time_seconds(LAST_PROGRESS_TIME)
-                    total_sec = kodi_time_seconds(LAST_PROGRESS_TOTAL)
-                    if cur_sec is not None and total_sec is not None:
-                        remaining = max(total_sec - cur_sec, 0)
-                if remaining is None or remaining > RESUME_MIN_REMAINING_SEC:
-                    attempts = RESUME_ATTEMPTS.get(DISPLAY_INDEX, 0)
-                    resume_pending = attempts < RESUME_MAX_ATTEMPTS
-                    if resume_pending:
-                        print(
-                            f"RESUME PENDING idx={DISPLAY_INDEX} attempts={attempts} remaining={remaining}",
-                            flush=True,
-                        )
-
-            # If a track marker is still present but progress stopped updating, try to resume.
-            if WS_STATE == "stopped" and DISPLAY_INDEX is not None:
-                if LAST_PROGRESS_INDEX == DISPLAY_INDEX and LAST_PROGRESS_TIME:
-                    remaining = None
-                    if LAST_PROGRESS_TOTAL:
-                        cur_sec = kodi_time_seconds(LAST_PROGRESS_TIME)
-                        total_sec = kodi_time_seconds(LAST_PROGRESS_TOTAL)
-                        if cur_sec is not None and total_sec is not None:
-                            remaining = max(total_sec - cur_sec, 0)
-                    if remaining is not None and remaining <= RESUME_MIN_REMAINING_SEC:
-                        # Track effectively ended; advance to next item.
-                        if REPEAT_MODE == "one":
-                            NEXT_INDEX = CURRENT_INDEX
-                        CURRENT_INDEX = None
-                        DISPLAY_INDEX = None
-                        LAST_PROGRESS_TIME = None
-                        LAST_PROGRESS_INDEX = None
-                        LAST_PROGRESS_TOTAL = None
-                        mark_list_dirty()
-                        continue
-                    attempts = RESUME_ATTEMPTS.get(DISPLAY_INDEX, 0)
-                    if attempts < RESUME_MAX_ATTEMPTS:
-                        RESUME_ATTEMPTS[DISPLAY_INDEX] = attempts + 1
-                        print(
-                            f"RESUME ATTEMPT idx={DISPLAY_INDEX} attempt={RESUME_ATTEMPTS[DISPLAY_INDEX]} "
-                            f"remaining={remaining}",
-                            flush=True,
-                        )
-                        with LOCK:
-                            if DISPLAY_INDEX is not None and DISPLAY_INDEX < len(QUEUE):
-                                item = QUEUE[DISPLAY_INDEX]
-                            else:
-                                item = None
-                        if item:
-                            resume_item_at_time(item, LAST_PROGRESS_TIME)
-                            time.sleep(0.3)
-                            continue
-                    else:
-                        # Resume attempts exhausted; treat as failed so autoplay can advance.
-                        CURRENT_INDEX = None
-                        DISPLAY_INDEX = None
-                        mark_list_dirty()
+    if WS_STATE == "paused":
+        set_autoplay_state("paused")
+        return None
 
-            if resume_pending:
-                time.sleep(0.3)
-                continue
+    if WS_STATE != "stopped":
+        set_autoplay_state("idle")
+        return AUTOPLAY_WATCHDOG_SEC
 
-            if WS_STATE == "stopped":
-                if CURRENT_INDEX is not None:
-                    if REPEAT_MODE == "one":
-                        NEXT_INDEX = CURRENT_INDEX
-                    CURRENT_INDEX = None
-                    time.sleep(0.3)
-                    continue
+    # A Player.Open replacing the current item also emits OnStop; let it settle.
+    settle = AUTOPLAY_STOP_SETTLE_SEC - (CLOCK() - WS_LAST_EVENT_TS)
+    if settle > 0:
+        return settle
 
-                with LOCK:
-                    if NEXT_INDEX < len(QUEUE):
-                        CURRENT_INDEX = NEXT_INDEX
-                        DISPLAY_INDEX = CURRENT_INDEX
-                        item = QUEUE[CURRENT_INDEX]
-                        NEXT_INDEX += 1
-                        mark_list_dirty()
-                    else:
-                        if REPEAT_MODE == "all":
-                            NEXT_INDEX = 0
-                            CURRENT_INDEX = None
-                            DISPLAY_INDEX = None
-                        else:
-                            AUTOPLAY_ENABLED = False
-                            CURRENT_INDEX = None
-                            DISPLAY_INDEX = None
-                        item = None
+    # If a track marker is still present but progress stopped early, try to resume.
+    shown = None
+    if DISPLAY_INDEX is not None:
+        with LOCK:
+            shown = QUEUE[DISPLAY_INDEX] if DISPLAY_INDEX < len(QUEUE) else None
+    cp = get_checkpoint(shown)
+    if shown and (cp or (LAST_PROGRESS_INDEX == DISPLAY_INDEX and LAST_PROGRESS_TIME)):
+        if cp:
+            remaining = checkpoint_remaining(cp)
+            resume_t = seconds_to_kodi_time(cp["t"])
+        else:
+            remaining = last_progress_remaining()
+            resume_t = LAST_PROGRESS_TIME
+        if remaining is not None and remaining <= RESUME_MIN_REMAINING_SEC:
+            # Track effectively ended; advance to next item.
+            clear_checkpoint(checkpoint_key(shown))
+            if REPEAT_MODE == "one":
+                NEXT_INDEX = CURRENT_INDEX
+            CURRENT_INDEX = None
+            DISPLAY_INDEX = None
+            LAST_PROGRESS_TIME = None
+            LAST_PROGRESS_INDEX = None
+            LAST_PROGRESS_TOTAL = None
+            mark_list_dirty()
+        else:
+            attempts = RESUME_ATTEMPTS.get(DISPLAY_INDEX, 0)
+            if attempts < RESUME_MAX_ATTEMPTS:
+                idx = DISPLAY_INDEX
+                RESUME_ATTEMPTS[idx] = attempts + 1
+                log("RESUME ATTEMPT", f"idx={idx} attempt={RESUME_ATTEMPTS[idx]} remaining={remaining}")
+                set_autoplay_state("resuming")
+                if KODI_PLAYLIST_SYNC:
+                    await asyncio.to_thread(play_queue_item, idx, shown, resume_t)
+                else:
+                    await asyncio.to_thread(resume_item_at_time, shown, resume_t)
+                return 0
+            else:
+                # Resume attempts exhausted; treat as failed so autoplay can advance.
+                CURRENT_INDEX = None
+                DISPLAY_INDEX = None
+                mark_list_dirty()
 
-                if item:
-                    play_item(item)
+    if CURRENT_INDEX is not None:
+        if REPEAT_MODE == "one":
+            NEXT_INDEX = CURRENT_INDEX
+        CURRENT_INDEX = None
 
+    with LOCK:
+        if NEXT_INDEX < len(QUEUE):
+            CURRENT_INDEX = NEXT_INDEX
+            DISPLAY_INDEX = CURRENT_INDEX
+            idx = CURRENT_INDEX
+            item = QUEUE[CURRENT_INDEX]
+            NEXT_INDEX += 1
+            mark_list_dirty()
+        else:
+            if REPEAT_MODE == "all":
+                NEXT_INDEX = 0
+            else:
+                AUTOPLAY_ENABLED = False
+            CURRENT_INDEX = None
+            DISPLAY_INDEX = None
+            item = None
+
+    if item:
+        set_autoplay_state("advancing")
+        await asyncio.to_thread(play_queue_item, idx, item)
+        return 0
+    if REPEAT_MODE == "all" and AUTOPLAY_ENABLED and QUEUE:
+        return 0
+    set_autoplay_state("idle")
+    return AUTOPLAY_WATCHDOG_SEC
+
+# Drive autoplay from WebSocket events and timers on the event loop.
+async def autoplay_machine():
+    global AUTOPLAY_WAKE
+    AUTOPLAY_WAKE = asyncio.Event()
+    delay = 0
+    while True:
+        if delay is None:
+            await AUTOPLAY_WAKE.wait()
+        elif delay > 0:
+            try:
+                await asyncio.wait_for(AUTOPLAY_WAKE.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+        AUTOPLAY_WAKE.clear()
+        try:
+            delay = await autoplay_step()
         except Exception as e:
-            print("AUTOPLAY ERROR:", e)
-
-        time.sleep(1)
-
-
-def start_autoplay_thread():
-    global AUTOPLAY_THREAD_STARTED, AUTOPLAY_THREAD
-    if AUTOPLAY_THREAD_STARTED and AUTOPLAY_THREAD and AUTOPLAY_THREAD.is_alive():
-        return
-    AUTOPLAY_THREAD_STARTED = True
-    AUTOPLAY_THREAD = threading.Thread(target=autoplay_loop, daemon=True)
-    AUTOPLAY_THREAD.start()
+            log("AUTOPLAY ERROR", f"err={e}", level=logging.ERROR)
+            delay = 1.0
 
 # Handle inline keyboard button callbacks.
 async def on_button(update, ctx):
     q = update.callback_query
     await q.answer()
     cmd = q.data
+    record_kodi_trace("cmd", c=cmd)
     if q.message:
         LAST_SEEN_ID[update.effective_chat.id] = q.message.message_id
-        print(f"SEEN chat_id={update.effective_chat.id} message_id={q.message.message_id}", flush=True)
+        log("SEEN", f"chat_id={update.effective_chat.id} message_id={q.message.message_id}", level=logging.DEBUG)
     chat_id = update.effective_chat.id
     prev_id = LAST_BOT_ID.get(chat_id)
     sent = False
@@ -1894,6 +4211,8 @@ async def on_button(update, ctx):
     elif cmd == "repeat":
         global REPEAT_MODE
         REPEAT_MODE = {"off":"one","one":"all","all":"off"}[REPEAT_MODE]
+        schedule_kodi_playlist_sync()
+        autoplay_notify()
         await send_and_track(ctx, chat_id, f"🔁 Repeat: {REPEAT_MODE}")
         sent = True
 
@@ -1928,36 +4247,19 @@ async def on_button(update, ctx):
         await send_and_track(ctx, chat_id, "🗑 Which number should be deleted? (e.g. 3)")
         ctx.user_data["await_delete_index"] = True
         sent = True
+    # Volume replies are posted by the CEC worker once the (possibly merged) presses are sent.
     elif cmd == "vol:up5":
-        ok = await asyncio.to_thread(run_cec_volume, 9, CEC_CMD_VOL_UP)
-        await send_and_track(ctx, chat_id, "🔊 +5" if ok else "⚠ Volume +5 failed")
-        sent = True
+        queue_cec_volume_reply(ctx, chat_id, 9, 5)
     elif cmd == "vol:up10":
-        ok = await asyncio.to_thread(run_cec_volume, 18, CEC_CMD_VOL_UP)
-        await send_and_track(ctx, chat_id, "🔊 +10" if ok else "⚠ Volume +10 failed")
-        sent = True
+        queue_cec_volume_reply(ctx, chat_id, 18, 10)
     elif cmd == "vol:down5":
-        ok = await asyncio.to_thread(run_cec_volume, 9, CEC_CMD_VOL_DOWN)
-        await send_and_track(ctx, chat_id, "🔉 -5" if ok else "⚠ Volume -5 failed")
-        sent = True
+        queue_cec_volume_reply(ctx, chat_id, -9, -5)
     elif cmd == "vol:down10":
-        ok = await asyncio.to_thread(run_cec_volume, 18, CEC_CMD_VOL_DOWN)
-        await send_and_track(ctx, chat_id, "🔉 -10" if ok else "⚠ Volume -10 failed")
-        sent = True
+        queue_cec_volume_reply(ctx, chat_id, -18, -10)
     elif cmd == "hifi:on":
-        ok = await asyncio.to_thread(run_cec_power, True)
-        await send_and_track(ctx, chat_id, "🔌 Hifi On" if ok else "⚠ Hifi On failed")
-        await asyncio.sleep(10)
-        await refresh_hifi_status_cache(force=True)
-        await update_now_playing_message(ctx, chat_id)
-        sent = True
+        queue_hifi_power(ctx, chat_id, True)
     elif cmd == "hifi:off":
-        ok = await asyncio.to_thread(run_cec_power, False)
-        await send_and_track(ctx, chat_id, "🔌 Hifi Off" if ok else "⚠ Hifi Off failed")
-        await asyncio.sleep(10)
-        await refresh_hifi_status_cache(force=True)
-        await update_now_playing_message(ctx, chat_id)
-        sent = True
+        queue_hifi_power(ctx, chat_id, False)
 
     if sent:
         schedule_cleanup(ctx, chat_id, prev_id)
@@ -1968,6 +4270,7 @@ async def on_button(update, ctx):
 
 # Handle text messages and URL inputs.
 async def handle_text(update, ctx):
+    trace = new_trace()
     record_last_seen(ctx, update)
     chat_id = update.effective_chat.id
     prev_id = LAST_BOT_ID.get(chat_id)
@@ -1986,6 +4289,7 @@ async def handle_text(update, ctx):
             elif is_requested_track_already_playing(i):
                 await send_and_track(ctx, chat_id, "▶ Dieser Track läuft bereits.")
             else:
+                record_kodi_trace("cmd", c=f"play:{i}")
                 play_index(i)
                 await send_and_track(ctx, chat_id, f"▶ Playing track {txt}.")
         else:
@@ -2033,12 +4337,19 @@ async def handle_text(update, ctx):
     txt = update.message.text.strip()
 
     if uid in pending:
-        if txt.lower() == "1":
-            await queue_video_async(pending[uid]["video"])
+        if txt.lower() in ("1", "l") and "links" in pending[uid]:
+            trace_mark(trace, "ingest")
+            links = [choose_video_list(l, txt.lower()) for l in pending[uid]["links"]]
+            await queue_links_and_report(ctx, chat_id, links, trace=trace)
+            pending.pop(uid)
+        elif txt.lower() == "1":
+            trace_mark(trace, "ingest")
+            await queue_video_async(pending[uid]["video"], trace=trace)
             await send_and_track(ctx, chat_id, "✔ Track added to the queue.")
             pending.pop(uid)
         elif txt.lower() == "l":
-            count = await queue_playlist_async(pending[uid]["list"])
+            trace_mark(trace, "ingest")
+            count = await queue_playlist_async(pending[uid]["list"], trace=trace)
             await send_and_track(ctx, chat_id, f"✔ Playlist with {count} tracks added.")
             pending.pop(uid)
         sent = True
@@ -2047,82 +4358,60 @@ async def handle_text(update, ctx):
             await update_list_message(ctx, chat_id)
         return
 
-    # ---- Check SoundCloud first ----
-    sc_set = SC_SET.search(txt)
-    if sc_set and is_sc_set_url(sc_set.group(0)):
-        count = await queue_soundcloud_set_async(sc_set.group(0))
+    # ---- Classify every link in the message in one pass ----
+    links = await resolve_short_links(classify_links(txt))
+    if len(links) > 1:
+        if any(l["type"] == "yt_video_list" for l in links):
+            # Same question as for a single video-with-playlist link; the answer covers all of them.
+            pending[uid] = {"links": links}
+            await send_and_track(ctx, chat_id, "1 = Track, L = Playlist")
+        else:
+            trace_mark(trace, "ingest")
+            await queue_links_and_report(ctx, chat_id, links, trace=trace)
+        sent = True
+    kind = links[0]["type"] if len(links) == 1 else None
+    link = links[0] if links else {}
+
+    if kind == "sc_set":
+        trace_mark(trace, "ingest")
+        count = await queue_soundcloud_set_async(link["url"], trace=trace)
         if count > 0:
             await send_and_track(ctx, chat_id, f"✔ SoundCloud set with {count} tracks added.")
         else:
             await send_and_track(ctx, chat_id, "⚠ This SoundCloud set could not be added.")
         sent = True
-        if sent:
-            schedule_cleanup(ctx, chat_id, prev_id)
-            await update_list_message(ctx, chat_id)
-        return
-    sc = SC.search(txt)
-    if not sc:
-        scs = SC_SHORT.search(txt)
-        if scs:
-            try:
-                resolved = await asyncio.to_thread(resolve_sc_short, scs.group(0))
-            except Exception:
-                resolved = None
-            if resolved and is_sc_set_url(resolved):
-                count = await queue_soundcloud_set_async(resolved)
-                if count > 0:
-                    await send_and_track(ctx, chat_id, f"✔ SoundCloud set with {count} tracks added.")
-                else:
-                    await send_and_track(ctx, chat_id, "⚠ This SoundCloud set could not be added.")
-                sent = True
-                if sent:
-                    schedule_cleanup(ctx, chat_id, prev_id)
-                    await update_list_message(ctx, chat_id)
-                return
-            if resolved and is_sc_track_url(resolved):
-                txt = resolved
-                sc = SC.search(txt)
-            if not sc:
-                await send_and_track(
-                    ctx,
-                    chat_id,
-                    "❌ SoundCloud link could not be added.\n"
-                    "The link points to Discover/Playlist or personal content.\n"
-                    "Please send the full track link in this format:\n"
-                    "https://soundcloud.com/ARTIST/TRACK"
-                )
-                sent = True
-                if sent:
-                    schedule_cleanup(ctx, chat_id, prev_id)
-                    await update_list_message(ctx, chat_id)
-                return
-    if sc:
+    elif kind == "sc_invalid":
+        await send_and_track(
+            ctx,
+            chat_id,
+            "❌ SoundCloud link could not be added.\n"
+            "The link points to Discover/Playlist or personal content.\n"
+            "Please send the full track link in this format:\n"
+            "https://soundcloud.com/ARTIST/TRACK"
+        )
+        sent = True
+    elif kind == "sc_track":
         try:
-            item = make_soundcloud(sc.group(0))
+            trace_mark(trace, "ingest")
+            item = make_soundcloud(link["url"])
+            item["trace"] = trace
             queue_item(item)
             await send_and_track(ctx, chat_id, "✔ SoundCloud track added to the queue.")
         except Exception as e:
             await send_and_track(ctx, chat_id, "⚠ This SoundCloud link is not playable.")
         sent = True
-        if sent:
-            schedule_cleanup(ctx, chat_id, prev_id)
-            await update_list_message(ctx, chat_id)
-        return
-
-    # ---- Then YouTube ----
-    vid = YT.search(txt)
-    pl = PL.search(txt)
-
-    if vid and pl:
-        pending[uid] = {"video": vid.group(1), "list": pl.group(1)}
+    elif kind == "yt_video_list":
+        pending[uid] = {"video": link["video"], "list": link["list"]}
         await send_and_track(ctx, chat_id, "1 = Track, L = Playlist")
         sent = True
-    elif vid:
-        await queue_video_async(vid.group(1))
+    elif kind == "yt_video":
+        trace_mark(trace, "ingest")
+        await queue_video_async(link["video"], trace=trace)
         await send_and_track(ctx, chat_id, "✔ Track added to the queue.")
         sent = True
-    elif pl:
-        count = await queue_playlist_async(pl.group(1))
+    elif kind == "yt_playlist":
+        trace_mark(trace, "ingest")
+        count = await queue_playlist_async(link["list"], trace=trace)
         await send_and_track(ctx, chat_id, f"✔ Playlist with {count} tracks added.")
         sent = True
 
@@ -2144,12 +4433,36 @@ async def handle_nontext(update, ctx):
     await warn_and_cleanup_chat(ctx, update.effective_chat.id, msg.message_id)
 
 
+# Admin-only /profile [cpu|mem] [seconds]; runs in the background so other updates keep flowing.
+async def on_profile(update, ctx):
+    uid = update.effective_user.id if update.effective_user else None
+    if uid not in ADMIN_USER_IDS:
+        log("PROFILE", f"denied user_id={uid}", level=logging.WARNING)
+        return
+    args = [a.lower() for a in (ctx.args or [])]
+    kind = "mem" if any(a in ("mem", "memory", "alloc") for a in args) else "cpu"
+    nums = [int(a) for a in args if a.isdigit()]
+    seconds = max(1, min(nums[0] if nums else PROFILE_DEFAULT_SEC, PROFILE_MAX_SEC))
+    chat_id = update.effective_chat.id
+    if PROFILE_ACTIVE:
+        await telegram_request(ctx.bot.send_message, chat_id=chat_id, text=f"⚠ A {PROFILE_ACTIVE} profile is already running.")
+        return
+    label = "CPU profile" if kind == "cpu" else "Allocation diff"
+    await telegram_request(ctx.bot.send_message, chat_id=chat_id, text=f"🔬 {label} running for {seconds}s…")
+    ctx.application.create_task(profile_and_report(ctx.bot, kind, seconds, [chat_id]))
+
 # Initialize the bot, handlers, and start polling.
 def main():
-    app = Application.builder().token(TOKEN).build()
+    setup_logging()
+    load_checkpoints()
+    open_kodi_trace()
+    builder = Application.builder().token(TOKEN)
+    if TG_BASE_URL:
+        builder = builder.base_url(TG_BASE_URL)
+    app = builder.build()
 
-    start_autoplay_thread()
     app.add_handler(CallbackQueryHandler(on_button))
+    app.add_handler(CommandHandler("profile", on_profile))
 
     app.add_handler(MessageHandler(filters.TEXT & (~filters.COMMAND), handle_text))
     app.add_handler(MessageHandler(filters.ATTACHMENT | filters.Sticker.ALL, handle_nontext))
@@ -2160,16 +4473,52 @@ def main():
             global APP_INSTANCE, MAIN_LOOP
             APP_INSTANCE = app
             MAIN_LOOP = asyncio.get_running_loop()
+            # asyncio.to_thread shares the bounded I/O executor.
+            MAIN_LOOP.set_default_executor(IO_EXECUTOR)
+            await start_metrics_server()
+            for signum, kind in ((signal.SIGUSR1, "cpu"), (signal.SIGUSR2, "mem")):
+                MAIN_LOOP.add_signal_handler(signum, on_profile_signal, kind)
             STARTUP_POSTED[STARTUP_CHAT_ID] = True
             await send_info_list_panel(app, STARTUP_CHAT_ID)
+            log("STARTUP", f"time_to_first_panel={CLOCK() - STARTUP_TS:.2f}s")
+            if EXTRACT_POOL_SIZE > 0:
+                submit_io(prewarm_extract_pool)
+            else:
+                # Without the pool, extraction runs in this process.
+                submit_io(prewarm_extractors)
+            submit_io(ensure_cec_master)
             await refresh_hifi_status_cache(force=True)
         except Exception as e:
-            print(f"STARTUP POST FAIL chat_id={STARTUP_CHAT_ID} err={e}", flush=True)
-        asyncio.get_running_loop().create_task(list_refresher(app))
-        asyncio.get_running_loop().create_task(kodi_ws_listener())
+            log("STARTUP POST FAIL", f"chat_id={STARTUP_CHAT_ID} err={e}", level=logging.ERROR)
+        loop = asyncio.get_running_loop()
+        BACKGROUND_TASKS.append(loop.create_task(list_refresher(app)))
+        BACKGROUND_TASKS.append(loop.create_task(kodi_ws_listener()))
+        BACKGROUND_TASKS.append(loop.create_task(autoplay_machine()))
+        BACKGROUND_TASKS.append(loop.create_task(checkpoint_ticker()))
+        BACKGROUND_TASKS.append(loop.create_task(restore_checkpoint_entry()))
+        BACKGROUND_TASKS.append(loop.create_task(cec_worker()))
+        if CEC_MONITOR and CEC_HOST:
+            BACKGROUND_TASKS.append(loop.create_task(cec_monitor()))
     app.post_init = _post_init
 
+    # Stop background tasks and servers while the loop is still open, then save checkpoints.
+    async def _post_stop(app):
+        for task in BACKGROUND_TASKS:
+            task.cancel()
+        await asyncio.gather(*BACKGROUND_TASKS, return_exceptions=True)
+        BACKGROUND_TASKS.clear()
+        if METRICS_SERVER is not None:
+            METRICS_SERVER.close()
+            await METRICS_SERVER.wait_closed()
+        await asyncio.to_thread(flush_checkpoints)
+    app.post_stop = _post_stop
+
     app.run_polling()
+    IO_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+    if KODI_TRACE is not None:
+        with KODI_TRACE_LOCK:
+            KODI_TRACE.close()
+    LOG_LISTENER.stop()
 
 
 if __name__ == "__main__":